@@ -1,16 +1,57 @@
-from fastapi import FastAPI, UploadFile, HTTPException
-from pydantic import BaseModel, HttpUrl
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from pydantic import BaseModel, HttpUrl, ValidationError
 from fastapi.middleware.cors import CORSMiddleware
-import httpx
-from tempfile import SpooledTemporaryFile
+from fastapi.responses import JSONResponse, Response
+# request.form() yields Starlette's UploadFile, not FastAPI's subclass.
+from starlette.datastructures import UploadFile
+
+from app.utils.batch_input import BatchInputError, detect_format, parse_rows
+from app.utils.batching import close_batchers, get_batcher
+from app.utils.cascade import CASCADE_MODEL_NAME, CASCADE_MODELS, run_cascade
+from app.utils import degradation
+from app.utils.executor import InferenceQueueFull, get_executor, shutdown_executor
+from app.utils.http_client import close_http_client, get_http_client
+from app.utils.metrics import CacheCollector, MetricsMiddleware, observe_stage, process_registry, render_metrics
+from app.utils.image_download import (
+    ImageDownloadError, ImageTooLarge, check_image, download_image, read_image_stream,
+)
+from app.utils.model_registry import CROP_MODEL_NAME, preload_models, readiness
+from app.utils.prediction_cache import hash_image, prediction_cache
+from app.utils.resnet_inference import (
+    MODEL_PRECISION, PRECISIONS, TOP_K_MAX, available_precisions, default_precision, model_cache,
+    published_precision,
+)
+from app.utils.weather_cache import weather_cache
+from app.utils.xgboost_inference import crop_mapping, predict_crop, predict_crops
+
+CROP_BATCH_MAX_ROWS = int(os.getenv("CROP_BATCH_MAX_ROWS", 10000))
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", 32))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_http_client()
+    get_executor()
+    # Load models in the background so /health/live answers while they warm up.
+    preload = asyncio.create_task(preload_models())
+    yield
+    preload.cancel()
+    await close_batchers()
+    await close_http_client()
+    await shutdown_executor()
 
-from app.utils.resnet_inference import predict_image
-from app.utils.xgboost_inference import predict_crop
 
 app = FastAPI(
     title="Crop AI | ML Server",
     description="An API for Crop Recommendation and Plant Disease Detection.",
     version="2.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -20,6 +61,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+process_registry.register(
+    CacheCollector({"prediction": prediction_cache, "weather": weather_cache, "model": model_cache})
+)
 
 
 class CropRecommendationInput(BaseModel):
@@ -36,35 +82,219 @@ class CropDiseaseDetectionInput(BaseModel):
     url: HttpUrl
 
 
-async def run_prediction(file: UploadFile, model_name: str):
+# The /predict/* routes read the body themselves to accept all three forms.
+DISEASE_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": CropDiseaseDetectionInput.model_json_schema()},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                    "required": ["file"],
+                }
+            },
+            "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+
+def resolve_precision(model_name: str, precision: Optional[str]) -> str:
+    """
+    The precision a request runs at
+
+    Only an explicit `?precision=` the model does not publish is an error;
+    the MODEL_PRECISION default falls back to fp32 for such models.
+    """
+    if not precision:
+        # The cascade falls back per stage.
+        return MODEL_PRECISION if model_name == CASCADE_MODEL_NAME else default_precision(model_name)
+    if precision not in PRECISIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown precision {precision}. Choose from: {list(PRECISIONS)}")
+    # The cascade falls back to fp32 for the stages without the variant.
+    if precision != "fp32" and model_name != CASCADE_MODEL_NAME and precision not in available_precisions(model_name):
+        raise HTTPException(status_code=404, detail=f"No {precision} variant of {model_name} is published")
+    return precision
+
+
+async def run_prediction(image_bytes: bytes, model_name: str, precision: str = "fp32"):
+    if model_name == CASCADE_MODEL_NAME:
+        result = await run_cascade(
+            lambda stage: run_prediction(image_bytes, stage, published_precision(stage, precision)),
+            # Under load a stage may degrade to the model of an earlier one.
+            resolve=lambda stage: degradation.substitute(stage, published_precision(stage, precision)),
+        )
+        # The last stage then answers with that earlier stage's prediction.
+        answering_model = CASCADE_MODELS[result["cascade"]["stage"] - 1]
+        result["degraded"] = result["degraded"] or result["model_used"] != answering_model
+        return result
+    served_model, served_precision, degraded = degradation.route(model_name, precision)
+    started = time.perf_counter()
     try:
-        image_bytes = await file.read()
-        return predict_image(image_bytes, model_name=model_name, use_onnx=True)
+        result = await get_batcher(served_model, served_precision).submit(image_bytes)
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except RuntimeError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
+    degradation.record_latency(time.perf_counter() - started)
+    result["degraded"] = degraded
+    return result
+
+
+def prediction_cache_key(model_name: str, precision: str) -> str:
+    # Each precision variant caches its own results.
+    return model_name if precision == "fp32" else f"{model_name}.{precision}"
+
+
+def store_prediction(content_hash: str, cache_key: str, result: dict):
+    # A stand-in's answer must not be served for the requested model once load drops.
+    if not result["degraded"]:
+        prediction_cache.put(content_hash, cache_key, result)
+
+
+async def predict_from_bytes(content, model_name: str, precision: str = "fp32"):
+    """Predict from uploaded image bytes, reusing the cached result for known content"""
+    cache_key = prediction_cache_key(model_name, precision)
+    content_hash = hash_image(content)
+    cached = await prediction_cache.get(content_hash, cache_key)
+    if cached is not None:
+        return cached
+
+    result = await run_prediction(content, model_name, precision)
+    store_prediction(content_hash, cache_key, result)
+    return result
+
+
+async def predict_from_url(url: str, model_name: str, precision: str = "fp32"):
+    """Predict from an image URL, reusing cached results for unchanged content"""
+    cache_key = prediction_cache_key(model_name, precision)
+    known = prediction_cache.lookup_url(url)
+    cached = await prediction_cache.get(known.content_hash, cache_key) if known else None
+
+    if cached is not None:
+        if prediction_cache.is_url_fresh(known):
+            return cached
+        with observe_stage("download", model_name):
+            image = await download_image(url, etag=known.etag, last_modified=known.last_modified)
+        if image.content is None:
+            prediction_cache.remember_url(url, known.content_hash, image.etag, image.last_modified)
+            return cached
+    else:
+        with observe_stage("download", model_name):
+            image = await download_image(url)
+
+    content_hash = hash_image(image.content)
+    prediction_cache.remember_url(url, content_hash, image.etag, image.last_modified)
+
+    # New content may still have been seen before under a different URL.
+    if known is None or content_hash != known.content_hash:
+        cached = await prediction_cache.get(content_hash, cache_key)
+    if cached is not None:
+        return cached
+
+    result = await run_prediction(image.content, model_name, precision)
+    store_prediction(content_hash, cache_key, result)
+    return result
+
+
+async def predict_upload(upload: UploadFile, model_name: str, precision: str):
+    content = await upload.read()
+    check_image(content)
+    return await predict_from_bytes(content, model_name, precision)
+
 
+async def predict_from_form(request: Request, model_name: str, precision: str):
+    """
+    Predict every image file of a multipart upload
 
-async def download_file_from_url(url: str) -> UploadFile:
-    """Download image from URL and wrap as UploadFile"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-        response.raise_for_status()
+    A single file gets the same response as a URL. Several files are
+    submitted together, so they share batched model calls, and each gets its
+    own result or error.
+    """
+    form = await request.form(max_files=UPLOAD_MAX_FILES)
+    uploads = [value for _, value in form.multi_items() if isinstance(value, UploadFile)]
+    if not uploads:
+        raise HTTPException(status_code=400, detail="Multipart uploads need at least one image file")
+    if len(uploads) == 1:
+        return await predict_upload(uploads[0], model_name, precision)
 
-    filename = url.split("/")[-1]
-    tmp = SpooledTemporaryFile()
-    tmp.write(response.content)
-    tmp.seek(0)
+    outcomes = await asyncio.gather(
+        *(predict_upload(upload, model_name, precision) for upload in uploads), return_exceptions=True
+    )
+    results = []
+    for upload, outcome in zip(uploads, outcomes):
+        if isinstance(outcome, HTTPException) and outcome.status_code == 503:
+            raise outcome
+        if isinstance(outcome, Exception):
+            detail = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+            results.append({"filename": upload.filename, "error": detail})
+        else:
+            results.append({"filename": upload.filename, **outcome})
+    return {"count": len(results), "results": results}
 
-    return UploadFile(filename=filename, file=tmp)
 
+def select_top_k(result: dict, top_k: int) -> dict:
+    """Trim a prediction's precomputed alternatives to the `top_k` requested (none for 0)"""
+    alternatives = result.pop("top_k", None)
+    if top_k and alternatives is not None:
+        result["top_k"] = alternatives[:top_k]
+    return result
 
-async def handle_disease_detection(body: CropDiseaseDetectionInput, model_name: str):
+
+async def handle_disease_request(request: Request, model_name: str, precision: Optional[str] = None,
+                                 top_k: int = 0):
+    """
+    Predict from a JSON image URL, a multipart upload or the raw image bytes
+
+    Raw bodies (`application/octet-stream` or `image/*`) are streamed straight
+    into the buffer handed to the decoder. With `top_k`, each prediction also
+    lists the k most likely classes, and `degraded` tells whether a cheaper
+    model stood in under load.
+    """
+    response = await dispatch_disease_request(request, model_name, precision)
+    for result in response.get("results", [response]):
+        select_top_k(result, top_k)
+        if "error" not in result:
+            result.setdefault("degraded", False)
+    return response
+
+
+async def dispatch_disease_request(request: Request, model_name: str, precision: Optional[str]):
+    request.state.model = model_name
+    precision = resolve_precision(model_name, precision)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    is_form = content_type == "multipart/form-data"
+    is_raw = content_type == "application/octet-stream" or content_type.startswith("image/")
+    if is_form or is_raw:
+        try:
+            if is_form:
+                return await predict_from_form(request, model_name, precision)
+            content = await read_image_stream(request.stream(), request.headers.get("content-length"))
+            return await predict_from_bytes(content, model_name, precision)
+        except ImageTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ImageDownloadError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        body = CropDiseaseDetectionInput.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_input=False))
+    return await handle_disease_detection(body, model_name, precision)
+
+
+async def handle_disease_detection(body: CropDiseaseDetectionInput, model_name: str, precision: str = "fp32"):
     try:
-        print("Body URL: ", body.url)
-        file = await download_file_from_url(str(body.url))
-        return await run_prediction(file, model_name)
+        return await predict_from_url(str(body.url), model_name, precision)
+    except HTTPException:
+        raise
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to fetch or process image: {e}")
 
@@ -75,10 +305,32 @@ async def root():
     return {"message": "Welcome to the Crop AI | API"}
 
 
+@app.get("/health/live", tags=["Health"])
+async def health_live():
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", tags=["Health"])
+async def health_ready():
+    ready, models = readiness()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "models": models},
+    )
+
+
+@app.get("/metrics", tags=["Health"])
+async def metrics():
+    """Prometheus metrics: request/stage latency, queue depth, batch sizes, caches, model load times"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.post("/crop-recommend", tags=["Crop Recommendation"])
-def recommend_crop(data: CropRecommendationInput):
+async def recommend_crop(data: CropRecommendationInput, request: Request):
+    request.state.model = CROP_MODEL_NAME
     try:
-        return predict_crop(
+        return await predict_crop(
             data.nitrogen,
             data.phosphorous,
             data.pottasium,
@@ -95,17 +347,76 @@ def recommend_crop(data: CropRecommendationInput):
         }
 
 
-@app.post("/predict/resnet9", tags=["Disease Detection"])
-async def predict_resnet9(body: CropDiseaseDetectionInput):
-    return await handle_disease_detection(body, "resnet9")
+@app.post("/crop-recommend/batch", tags=["Crop Recommendation"])
+async def recommend_crop_batch(request: Request, top_k: int = Query(0, ge=0, le=len(crop_mapping))):
+    """
+    Recommend crops for many plots at once.
+
+    The body is a JSON array of crop-recommendation inputs, NDJSON
+    (`application/x-ndjson`) or CSV (`text/csv`) with a header row. The same
+    formats can be uploaded as the `file` field of a multipart form. Pass
+    `top_k` to also get the k most likely crops with probabilities.
+    """
+    request.state.model = CROP_MODEL_NAME
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(status_code=400, detail="Multipart batches need a 'file' field")
+        body = await upload.read()
+        fmt = detect_format(upload.content_type or "", upload.filename or "")
+    else:
+        body = await request.body()
+        fmt = detect_format(content_type)
+
+    try:
+        rows = parse_rows(body, fmt)
+    except BatchInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if len(rows) > CROP_BATCH_MAX_ROWS:
+        raise HTTPException(
+            status_code=413, detail=f"Batch has {len(rows)} rows, limit is {CROP_BATCH_MAX_ROWS}"
+        )
+
+    samples = []
+    for i, row in enumerate(rows):
+        try:
+            samples.append(CropRecommendationInput.model_validate(row))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail={"row": i, "errors": e.errors(include_url=False)})
+
+    try:
+        results = await predict_crops(samples, top_k=top_k)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"count": len(results), "results": results}
+
+
+@app.post("/predict/resnet9", tags=["Disease Detection"], openapi_extra=DISEASE_REQUEST_BODY)
+async def predict_resnet9(request: Request, precision: Optional[str] = Query(None),
+                         top_k: int = Query(0, ge=0, le=TOP_K_MAX)):
+    return await handle_disease_request(request, "resnet9", precision, top_k)
+
+
+@app.post("/predict/resnet18", tags=["Disease Detection"], openapi_extra=DISEASE_REQUEST_BODY)
+async def predict_resnet18(request: Request, precision: Optional[str] = Query(None),
+                          top_k: int = Query(0, ge=0, le=TOP_K_MAX)):
+    return await handle_disease_request(request, "resnet18", precision, top_k)
 
 
-@app.post("/predict/resnet18", tags=["Disease Detection"])
-async def predict_resnet18(body: CropDiseaseDetectionInput):
-    return await handle_disease_detection(body, "resnet18")
+@app.post("/predict/resnet50", tags=["Disease Detection"], openapi_extra=DISEASE_REQUEST_BODY)
+async def predict_resnet50(request: Request, precision: Optional[str] = Query(None),
+                          top_k: int = Query(0, ge=0, le=TOP_K_MAX)):
+    return await handle_disease_request(request, "resnet50", precision, top_k)
 
 
-@app.post("/predict/resnet50", tags=["Disease Detection"])
-async def predict_resnet50(body: CropDiseaseDetectionInput):
-    print("Body: ", body)
-    return await handle_disease_detection(body, "resnet50")
+@app.post("/predict/auto", tags=["Disease Detection"], openapi_extra=DISEASE_REQUEST_BODY)
+async def predict_auto(request: Request, precision: Optional[str] = Query(None),
+                       top_k: int = Query(0, ge=0, le=TOP_K_MAX)):
+    """Answer with the cheapest model of CASCADE_MODELS confident enough for the image"""
+    return await handle_disease_request(request, CASCADE_MODEL_NAME, precision, top_k)
@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+from typing import List
+
+
+class BatchInputError(ValueError):
+    """Raised when an uploaded batch cannot be parsed"""
+
+
+def detect_format(content_type: str, filename: str = "") -> str:
+    content_type = content_type.split(";")[0].strip().lower()
+    filename = filename.lower()
+
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl") \
+            or filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if content_type in ("text/csv", "application/csv") or filename.endswith(".csv"):
+        return "csv"
+    return "json"
+
+
+def parse_rows(body: bytes, fmt: str) -> List[dict]:
+    """
+    Parse a JSON array, NDJSON or CSV body into a list of row dicts
+
+    CSV files need a header row naming the columns.
+    """
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise BatchInputError(f"Batch must be UTF-8 encoded: {e}") from e
+
+    if fmt == "csv":
+        return [row for row in csv.DictReader(io.StringIO(text)) if any(row.values())]
+
+    if fmt == "ndjson":
+        rows = []
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise BatchInputError(f"Invalid JSON on line {line_number}: {e}") from e
+        return rows
+
+    try:
+        rows = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise BatchInputError(f"Invalid JSON: {e}") from e
+    if isinstance(rows, dict) and isinstance(rows.get("samples"), list):
+        rows = rows["samples"]
+    if not isinstance(rows, list):
+        raise BatchInputError("Expected a JSON array of samples")
+    return rows
@@ -0,0 +1,146 @@
+import asyncio
+import os
+from functools import partial
+
+from app.utils.executor import MODEL_MAX_CONCURRENCY, admit_request, run_in_executor
+from app.utils.resnet_inference import TOP_K_MAX, predict_batch
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-image requests into batched model calls
+
+    Requests are queued and flushed as one batch once `max_batch_size` images
+    are waiting or `max_wait_ms` has passed since the first one arrived.
+    Each caller gets back only its own result.
+
+    Batches run on the inference worker pool, at most `max_concurrency` at a
+    time, so the event loop keeps serving other requests meanwhile.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                 max_concurrency=MODEL_MAX_CONCURRENCY):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.slots = asyncio.Semaphore(max(1, max_concurrency))
+        self.queue = asyncio.Queue()
+        self.worker = None
+        self.tasks = set()
+
+    async def submit(self, image):
+        with admit_request():
+            future = asyncio.get_running_loop().create_future()
+            self.queue.put_nowait((image, future))
+
+            if self.worker is None or self.worker.done():
+                self.worker = asyncio.create_task(self.run())
+
+            return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self.queue.get()]
+
+            try:
+                # Requests keep queueing while every slot is busy, so a batch
+                # started after waiting here fills up without further delay.
+                await self.slots.acquire()
+                deadline = loop.time() + self.max_wait
+
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                cancel_futures(future for _, future in batch)
+                raise
+
+            task = asyncio.create_task(self.flush(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.flush_done)
+
+    async def close(self):
+        """Stop batching and cancel the requests still waiting for a result"""
+        tasks = [task for task in (self.worker, *self.tasks) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        while not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            cancel_futures([future])
+
+    def flush_done(self, task):
+        self.tasks.discard(task)
+        self.slots.release()
+
+    async def flush(self, batch):
+        images = [image for image, _ in batch]
+        futures = [future for _, future in batch]
+
+        try:
+            results = await run_in_executor(self.predict_fn, images)
+        except asyncio.CancelledError:
+            cancel_futures(futures)
+            raise
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if "error" in result:
+                future.set_exception(ValueError(result["error"]))
+            else:
+                future.set_result(result)
+
+
+def cancel_futures(futures):
+    for future in futures:
+        if not future.done():
+            future.cancel()
+
+
+batchers = {}
+
+
+def get_batcher(model_name: str, precision: str = "fp32") -> MicroBatcher:
+    """
+    Return the request coalescer for a model variant, creating it on first use
+
+    Results carry TOP_K_MAX alternatives, so requests asking for any `top_k`
+    share batches and cached results.
+    """
+    key = (model_name, precision)
+    if key not in batchers:
+        predict_fn = partial(
+            predict_batch, model_name=model_name, use_onnx=True, batch_size=BATCH_MAX_SIZE,
+            precision=precision, top_k=TOP_K_MAX,
+        )
+        batchers[key] = MicroBatcher(predict_fn)
+    return batchers[key]
+
+
+async def close_batchers():
+    """
+    Close every batcher on shutdown
+
+    Their queues and tasks belong to the running event loop, so an app
+    started again (e.g. in tests) must not reuse them.
+    """
+    for batcher in list(batchers.values()):
+        await batcher.close()
+    batchers.clear()
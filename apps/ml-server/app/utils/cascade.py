@@ -0,0 +1,101 @@
+import os
+from typing import Awaitable, Callable, Hashable, List, Optional
+
+from app.utils.metrics import CASCADE_ANSWERS
+from app.utils.resnet_inference import MODEL_CONFIGS
+
+CASCADE_MODEL_NAME = "auto"
+DEFAULT_THRESHOLD = 0.9
+
+
+def parse_models(spec: str, known=MODEL_CONFIGS) -> List[str]:
+    """
+    Cascade stages from a comma-separated list of model names, cheapest first
+
+    Raises:
+        ValueError: If the list is empty or names a model that is not served
+    """
+    models = [name.strip() for name in spec.split(",") if name.strip()]
+    if not models:
+        raise ValueError("CASCADE_MODELS must name at least one model")
+    unknown = [name for name in models if name not in known]
+    if unknown:
+        raise ValueError(f"CASCADE_MODELS names unknown models {unknown}. Choose from: {list(known)}")
+    return models
+
+
+CASCADE_MODELS = parse_models(os.getenv("CASCADE_MODELS", "resnet9,resnet18,resnet50"))
+
+
+def parse_thresholds(spec: str) -> List[float]:
+    """
+    Confidence thresholds from a comma-separated list of values in [0, 1]
+
+    Raises:
+        ValueError: If a value is not a number in [0, 1]
+    """
+    thresholds = []
+    for value in spec.split(","):
+        if not value.strip():
+            continue
+        try:
+            threshold = float(value)
+        except ValueError:
+            threshold = None
+        if threshold is None or not 0 <= threshold <= 1:
+            raise ValueError(f"CASCADE_THRESHOLDS must be confidences between 0 and 1, got {value.strip()!r}")
+        thresholds.append(threshold)
+
+    if not thresholds:
+        print(f"Warning: CASCADE_THRESHOLDS is empty, using {DEFAULT_THRESHOLD}")
+        thresholds.append(DEFAULT_THRESHOLD)
+    return thresholds
+
+
+# Escalate past a stage when its confidence is below its threshold. One value
+# applies to every stage but the last, which always answers; pick them with
+# ml-model/inference/plant-disease/evaluate_cascade.py.
+CASCADE_THRESHOLDS = parse_thresholds(os.getenv("CASCADE_THRESHOLDS", str(DEFAULT_THRESHOLD)))
+
+
+def stage_thresholds(models=CASCADE_MODELS, thresholds=CASCADE_THRESHOLDS):
+    """Threshold of each stage but the last, repeating the last given value"""
+    return [thresholds[min(stage, len(thresholds) - 1)] for stage in range(len(models) - 1)]
+
+
+async def run_cascade(predict: Callable[[str], Awaitable[dict]], models=CASCADE_MODELS,
+                      thresholds=CASCADE_THRESHOLDS, resolve: Optional[Callable[[str], Hashable]] = None) -> dict:
+    """
+    Predict with the cheapest model first, escalating while it is unsure
+
+    Args:
+        predict: Coroutine function predicting the request's image with a model
+        models: Stages, cheapest first
+        thresholds: Minimum confidence for a stage to answer
+        resolve: What actually serves a stage, e.g. its model once degraded;
+            a stage served like an earlier one is not run again
+
+    Returns:
+        dict: The answering stage's prediction, plus `cascade` with its
+        1-based `stage` and the model and confidence of every stage tried
+    """
+    limits = stage_thresholds(models, thresholds)
+    tried = []
+    results = {}
+    for stage, model_name in enumerate(models):
+        last = stage == len(limits)
+        served = resolve(model_name) if resolve else model_name
+        if served in results:
+            if not last:
+                continue
+            # The last stage answers, with the prediction already made for it.
+            result = results[served]
+            break
+
+        result = results[served] = await predict(model_name)
+        tried.append({"model": model_name, "confidence": result["confidence"]})
+        if last or result["confidence"] >= limits[stage]:
+            break
+
+    CASCADE_ANSWERS.labels(model_name).inc()
+    return {**result, "cascade": {"stage": stage + 1, "stages": tried}}
@@ -0,0 +1,137 @@
+import json
+from pathlib import Path
+from typing import Optional
+
+# train.py saves {'model_state_dict', 'num_classes', 'class_names', ...};
+# older checkpoints are a bare state dict.
+STATE_DICT_KEY = 'model_state_dict'
+CLASSIFIER_KEYS = ('fc.weight', 'classifier.2.weight')
+CLASSIFIER_BIAS_KEYS = ('fc.bias', 'classifier.2.bias')
+
+
+class ClassMismatch(ValueError):
+    """Raised when a checkpoint was trained on other classes than the server serves"""
+
+
+def safetensors_path(checkpoint_path) -> Path:
+    """Safetensors weights published next to a .pth checkpoint"""
+    return Path(checkpoint_path).with_suffix('.safetensors')
+
+
+def load_checkpoint(checkpoint_path, device='cpu'):
+    """
+    Read a checkpoint's weights and metadata in a single pass
+
+    A `.safetensors` file next to the checkpoint is preferred: nothing is
+    unpickled, and its metadata holds the same fields as train.py's
+    checkpoints. A `.pth` file is read with `weights_only`, which refuses
+    arbitrary pickled code, and memory-mapped when saved in the zip format.
+
+    Either way, CPU tensors are views of the mapped file, read as they are
+    first touched. Preparing the model for inference still copies the
+    weights it rewrites (BatchNorm folding, channels_last).
+
+    Returns:
+        tuple: (state dict, metadata such as `num_classes` and `class_names`)
+    """
+    weights_path = safetensors_path(checkpoint_path)
+    if weights_path.exists():
+        return load_safetensors(weights_path, device)
+
+    import torch
+
+    try:
+        checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=True, mmap=True)
+    except RuntimeError:
+        # Checkpoints saved with _use_new_zipfile_serialization=False cannot be mapped.
+        checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=True)
+
+    if STATE_DICT_KEY not in checkpoint:
+        return checkpoint, {}
+    metadata = {key: value for key, value in checkpoint.items() if key != STATE_DICT_KEY}
+    return checkpoint[STATE_DICT_KEY], metadata
+
+
+def load_safetensors(weights_path, device='cpu'):
+    """
+    Weights and metadata of a safetensors file (metadata values are JSON)
+
+    Read through one safe_open handle. On CPU each tensor is a view of a
+    memory map of the file; for another device it is copied over.
+    """
+    try:
+        from safetensors import safe_open
+    except ImportError as e:
+        raise RuntimeError(f"Loading {weights_path} needs the safetensors package") from e
+
+    with safe_open(str(weights_path), framework='pt', device=str(device)) as f:
+        raw_metadata = f.metadata() or {}
+        state_dict = {key: f.get_tensor(key) for key in f.keys()}
+    metadata = {}
+    for key, value in raw_metadata.items():
+        try:
+            metadata[key] = json.loads(value)
+        except ValueError:
+            metadata[key] = value
+    return state_dict, metadata
+
+
+def save_safetensors(state_dict, weights_path, **metadata):
+    """
+    Write weights with JSON-encoded metadata, e.g. num_classes and class_names
+
+    The one writer of the format load_safetensors reads; train.py uses it too.
+    """
+    from safetensors.torch import save_file
+
+    tensors = {key: tensor.detach().contiguous() for key, tensor in state_dict.items()}
+    save_file(tensors, str(weights_path), metadata={key: json.dumps(value) for key, value in metadata.items()})
+
+
+def checkpoint_num_classes(state_dict, metadata, default):
+    """Class count from the metadata, else from the classifier's weight"""
+    if 'num_classes' in metadata:
+        return int(metadata['num_classes'])
+    for key, tensor in state_dict.items():
+        if key.endswith(CLASSIFIER_KEYS):
+            return tensor.shape[0]
+    return default
+
+
+def align_classes(state_dict, class_names, served_classes):
+    """
+    Reorder a checkpoint's classifier outputs to the served class order
+
+    Training orders classes by dataset folder, which need not match the
+    served class table. The rows of the classifier's weight and bias are
+    permuted once, so logit i is served_classes[i].
+
+    Raises:
+        ClassMismatch: If the checkpoint's classes are not the served ones
+    """
+    class_names, served_classes = list(class_names), list(served_classes)
+    if class_names == served_classes:
+        return state_dict
+    if sorted(class_names) != sorted(served_classes):
+        unknown = sorted(set(class_names) - set(served_classes))
+        missing = sorted(set(served_classes) - set(class_names))
+        raise ClassMismatch(
+            f"Checkpoint classes differ from the served ones (unknown: {unknown[:5]}, missing: {missing[:5]})"
+        )
+
+    import torch
+
+    order = torch.tensor([class_names.index(name) for name in served_classes])
+    return {
+        key: tensor.index_select(0, order.to(tensor.device))
+        if key.endswith(CLASSIFIER_KEYS + CLASSIFIER_BIAS_KEYS) else tensor
+        for key, tensor in state_dict.items()
+    }
+
+
+def checkpoint_file(checkpoint_path) -> Optional[Path]:
+    """The file load_checkpoint reads for a checkpoint, None if neither exists"""
+    for path in (safetensors_path(checkpoint_path), Path(checkpoint_path)):
+        if path.exists():
+            return path
+    return None
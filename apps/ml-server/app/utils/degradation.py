@@ -0,0 +1,99 @@
+import os
+import time
+
+from app.utils import executor
+from app.utils.metrics import DEGRADED, DEGRADED_REQUESTS
+from app.utils.resnet_inference import MODEL_CONFIGS, published_precision
+
+# Cheaper stand-ins used under pressure, as `model:substitute`; a substitute
+# may name a variant, e.g. `resnet50:resnet50.int8`. Empty turns it off.
+DEGRADE_ROUTES = os.getenv("DEGRADE_ROUTES", "resnet50:resnet18,resnet18:resnet9")
+DEGRADE_QUEUE_DEPTH = int(os.getenv("DEGRADE_QUEUE_DEPTH", executor.INFERENCE_QUEUE_SIZE // 2))
+DEGRADE_LATENCY_SLO_MS = float(os.getenv("DEGRADE_LATENCY_SLO_MS", 0))
+# Normal routing resumes once depth and latency fall below this share of their
+# limits and the server has stayed degraded for DEGRADE_HOLD_SECONDS.
+DEGRADE_RECOVER_RATIO = float(os.getenv("DEGRADE_RECOVER_RATIO", 0.5))
+DEGRADE_HOLD_SECONDS = float(os.getenv("DEGRADE_HOLD_SECONDS", 10))
+LATENCY_SMOOTHING = 0.2
+
+
+def parse_routes(spec: str) -> dict:
+    routes = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        source, _, target = (part.strip() for part in entry.partition(":"))
+        target_model, _, target_precision = target.partition(".")
+        if source not in MODEL_CONFIGS or target_model not in MODEL_CONFIGS:
+            print(f"Warning: Ignoring degradation route {entry.strip()!r}, models are {list(MODEL_CONFIGS)}")
+            continue
+        routes[source] = (target_model, target_precision or None)
+    return routes
+
+
+routes = parse_routes(DEGRADE_ROUTES)
+degraded = False
+changed_at = 0.0
+latency_ms = 0.0
+
+
+def record_latency(seconds: float):
+    """Fold one prediction's queueing and inference time into the moving average"""
+    global latency_ms
+    latency_ms += LATENCY_SMOOTHING * (seconds * 1000 - latency_ms)
+
+
+def is_degraded() -> bool:
+    """
+    Whether this worker is under pressure, switching with hysteresis
+
+    Pressure is DEGRADE_QUEUE_DEPTH admitted requests or a smoothed
+    prediction latency over DEGRADE_LATENCY_SLO_MS; either check is off at 0.
+    """
+    global degraded, changed_at
+    depth = executor.pending_requests
+    now = time.monotonic()
+
+    if not degraded:
+        if (DEGRADE_QUEUE_DEPTH and depth >= DEGRADE_QUEUE_DEPTH) or (
+                DEGRADE_LATENCY_SLO_MS and latency_ms > DEGRADE_LATENCY_SLO_MS):
+            degraded, changed_at = True, now
+            DEGRADED.set(1)
+            print(f"Degrading disease detection: {depth} requests queued, {latency_ms:.0f} ms latency")
+    elif now - changed_at >= DEGRADE_HOLD_SECONDS:
+        if (not DEGRADE_QUEUE_DEPTH or depth < DEGRADE_QUEUE_DEPTH * DEGRADE_RECOVER_RATIO) and (
+                not DEGRADE_LATENCY_SLO_MS or latency_ms < DEGRADE_LATENCY_SLO_MS * DEGRADE_RECOVER_RATIO):
+            degraded, changed_at = False, now
+            DEGRADED.set(0)
+            print(f"Restoring normal routing: {depth} requests queued, {latency_ms:.0f} ms latency")
+    return degraded
+
+
+def substitute(model_name: str, precision: str):
+    """
+    The model and precision that would serve a request right now
+
+    Returns:
+        tuple: (model, precision)
+    """
+    target = routes.get(model_name)
+    if target is None or not is_degraded():
+        return model_name, precision
+
+    target_model, target_precision = target
+    return target_model, published_precision(target_model, target_precision or precision)
+
+
+def route(model_name: str, precision: str):
+    """
+    The model and precision to serve a request with, counting degraded requests
+
+    Returns:
+        tuple: (model, precision, degraded)
+    """
+    served_model, served_precision = substitute(model_name, precision)
+    if (served_model, served_precision) == (model_name, precision):
+        return model_name, precision, False
+
+    DEGRADED_REQUESTS.labels(model_name, served_model).inc()
+    return served_model, served_precision, True
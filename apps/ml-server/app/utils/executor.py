@@ -0,0 +1,72 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Optional
+
+from app.utils.metrics import QUEUE_DEPTH, QUEUE_REJECTIONS
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", os.cpu_count() or 1))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 64))
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", 2))
+
+executor: Optional[ThreadPoolExecutor] = None
+pending_requests = 0
+
+
+class InferenceQueueFull(RuntimeError):
+    """Raised when the inference queue has no room for another request"""
+
+
+@contextmanager
+def admit_request():
+    """
+    Reserve a slot in the bounded inference queue for the duration of a request
+
+    Raises:
+        InferenceQueueFull: If INFERENCE_QUEUE_SIZE requests are already pending
+    """
+    global pending_requests
+    if pending_requests >= INFERENCE_QUEUE_SIZE:
+        QUEUE_REJECTIONS.inc()
+        raise InferenceQueueFull(
+            f"Inference queue is full ({INFERENCE_QUEUE_SIZE} pending requests), retry later"
+        )
+
+    pending_requests += 1
+    QUEUE_DEPTH.inc()
+    try:
+        yield
+    finally:
+        pending_requests -= 1
+        QUEUE_DEPTH.dec()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the inference worker pool, creating it on first use"""
+    global executor
+    if executor is None:
+        # ONNX Runtime, PIL decoding and torch all release the GIL while they work,
+        # so a thread pool keeps every core busy without pickling images to workers.
+        executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+    return executor
+
+
+async def run_in_executor(fn, *args, **kwargs):
+    """Run a blocking inference function on the worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), partial(fn, *args, **kwargs))
+
+
+async def shutdown_executor():
+    """
+    Cancel the queued work and wait for the running jobs to finish
+
+    The wait happens on another thread, so a model load or batch still in
+    flight does not block the event loop while the app shuts down.
+    """
+    global executor
+    if executor is not None:
+        pool, executor = executor, None
+        await asyncio.get_running_loop().run_in_executor(None, partial(pool.shutdown, wait=True, cancel_futures=True))
@@ -0,0 +1,32 @@
+import os
+from typing import Optional
+
+import httpx
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+
+client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the application-wide pooled HTTP client, creating it on first use"""
+    global client
+    if client is None or client.is_closed:
+        # Redirects are not followed: a public image URL could point on to an internal host.
+        client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+    return client
+
+
+async def close_http_client():
+    global client
+    if client is not None:
+        await client.aclose()
+        client = None
@@ -0,0 +1,140 @@
+import os
+from typing import NamedTuple, Optional
+
+from app.utils.http_client import get_http_client
+
+DOWNLOAD_MAX_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", 10 * 1024 * 1024))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 10))
+
+ALLOWED_CONTENT_TYPES = ("image/", "application/octet-stream", "binary/octet-stream")
+IMAGE_SIGNATURES = (
+    b"\xff\xd8\xff",  # JPEG
+    b"\x89PNG\r\n\x1a\n",  # PNG
+    b"GIF87a",
+    b"GIF89a",
+    b"BM",  # BMP
+    b"II*\x00",  # TIFF, little endian
+    b"MM\x00*",  # TIFF, big endian
+)
+SIGNATURE_BYTES = 12
+
+
+class DownloadedImage(NamedTuple):
+    content: Optional[bytearray]  # None when the server answered 304 Not Modified
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class ImageDownloadError(ValueError):
+    """Raised when a downloaded or uploaded file is not a usable image"""
+
+
+class ImageTooLarge(ImageDownloadError):
+    """Raised when an image exceeds DOWNLOAD_MAX_BYTES"""
+
+
+def is_image_signature(head: bytes) -> bool:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return True
+    return head.startswith(IMAGE_SIGNATURES)
+
+
+async def download_image(url: str, max_bytes: int = DOWNLOAD_MAX_BYTES,
+                         etag: Optional[str] = None, last_modified: Optional[str] = None) -> DownloadedImage:
+    """
+    Stream an image from a URL into a single buffer
+
+    Downloads are rejected as soon as the content type, the leading magic
+    bytes or the size show the body is not an acceptable image.
+
+    Passing a previous `etag`/`last_modified` makes the request conditional;
+    if the server answers 304 the returned image has no content.
+
+    Raises:
+        ImageTooLarge: If the body is larger than `max_bytes`
+        ImageDownloadError: If the body is not a supported image
+        httpx.HTTPError: If the request itself fails
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    async with get_http_client().stream("GET", url, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+        validators = (response.headers.get("etag"), response.headers.get("last-modified"))
+        if response.status_code == 304:
+            return DownloadedImage(None, validators[0] or etag, validators[1] or last_modified)
+        response.raise_for_status()
+
+        content_type = response.headers.get("content-type", "").lower()
+        if content_type and not content_type.startswith(ALLOWED_CONTENT_TYPES):
+            raise ImageDownloadError(f"Unsupported content type: {content_type}")
+
+        buffer = await read_image_stream(
+            response.aiter_bytes(), response.headers.get("content-length"), max_bytes
+        )
+
+    return DownloadedImage(buffer, *validators)
+
+
+async def read_image_stream(chunks, content_length: Optional[str] = None,
+                            max_bytes: int = DOWNLOAD_MAX_BYTES) -> bytearray:
+    """
+    Collect an image body arriving in chunks into a single buffer
+
+    Used for downloads and raw uploads alike. The buffer is preallocated from
+    `content_length` when known, and reading stops as soon as the size or the
+    leading magic bytes show the body is not an acceptable image.
+
+    Raises:
+        ImageTooLarge: If the body is larger than `max_bytes`
+        ImageDownloadError: If the body is not a supported image
+    """
+    expected = int(content_length) if content_length and content_length.isdigit() else None
+    if expected is not None and expected > max_bytes:
+        raise ImageTooLarge(f"Image is {expected} bytes, limit is {max_bytes}")
+
+    buffer = bytearray(expected) if expected else bytearray()
+    view = memoryview(buffer) if expected else None
+    size = 0
+    checked = False
+
+    async for chunk in chunks:
+        end = size + len(chunk)
+        if end > max_bytes:
+            raise ImageTooLarge(f"Image exceeds the {max_bytes} byte limit")
+
+        if view is not None and end <= expected:
+            view[size:end] = chunk
+        else:
+            if view is not None:
+                view.release()
+                view = None
+                del buffer[size:]
+            buffer += chunk
+        size = end
+
+        if not checked and size >= SIGNATURE_BYTES:
+            if not is_image_signature(bytes(buffer[:SIGNATURE_BYTES])):
+                raise ImageDownloadError("File is not a supported image")
+            checked = True
+
+    if view is not None:
+        view.release()
+    del buffer[size:]
+
+    check_image(buffer, max_bytes)
+    return buffer
+
+
+def check_image(content, max_bytes: int = DOWNLOAD_MAX_BYTES):
+    """
+    Raises:
+        ImageTooLarge: If `content` is larger than `max_bytes`
+        ImageDownloadError: If `content` is empty or not a supported image
+    """
+    if len(content) > max_bytes:
+        raise ImageTooLarge(f"Image is {len(content)} bytes, limit is {max_bytes}")
+    if not content or not is_image_signature(bytes(content[:SIGNATURE_BYTES])):
+        raise ImageDownloadError("File is not a supported image")
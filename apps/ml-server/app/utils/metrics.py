@@ -0,0 +1,149 @@
+"""
+Prometheus metrics of the ML server, served at /metrics
+
+Request latency is recorded per route and model, and broken down into the
+stages a prediction goes through, so a slow stage shows up on its own:
+
+    download, decode, preprocess, session_run, postprocess   (disease detection)
+    weather_fetch, xgboost_predict                          (crop recommendation)
+
+With several workers, PROMETHEUS_MULTIPROC_DIR (set by run.py) makes every
+worker write its samples there and /metrics aggregates all of them.
+"""
+
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Stages take from well under a millisecond (postprocess) to seconds (downloads).
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUESTS = Counter(
+    "ml_requests_total", "HTTP requests by route, model and status code", ["route", "model", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "ml_request_duration_seconds", "HTTP request latency", ["route", "model"], buckets=LATENCY_BUCKETS
+)
+STAGE_LATENCY = Histogram(
+    "ml_stage_duration_seconds", "Latency of one prediction stage", ["stage", "model"], buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    "ml_batch_size", "Images per model call", ["model"], buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+CASCADE_ANSWERS = Counter("ml_cascade_answers_total", "/predict/auto requests by the model that answered", ["model"])
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+QUEUE_DEPTH = Gauge(
+    "ml_inference_queue_depth", "Disease detection requests admitted and not yet answered",
+    multiprocess_mode="livesum",
+)
+QUEUE_REJECTIONS = Counter("ml_inference_queue_rejections_total", "Requests turned away with 503 by a full queue")
+DEGRADED = Gauge(
+    "ml_degraded", "1 while disease detection is routed to cheaper models under load", multiprocess_mode="livemax"
+)
+DEGRADED_REQUESTS = Counter(
+    "ml_degraded_requests_total", "Requests served by a cheaper model than asked for", ["model", "served"]
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "ml_model_load_seconds", "Time spent loading and warming up each model", ["model", "phase"],
+    multiprocess_mode="max",
+)
+
+# Collectors reading this process's own state at scrape time, such as the
+# caches. With several workers they describe the worker answering the scrape.
+process_registry = CollectorRegistry()
+
+
+def observe_stage(stage: str, model: str = ""):
+    """Context manager timing one stage, e.g. `with observe_stage("decode", "resnet50"):`"""
+    return STAGE_LATENCY.labels(stage, model).time()
+
+
+class CacheCollector:
+    """
+    Export the counters the caches already keep, read at scrape time
+
+    Args:
+        caches: Cache name -> object whose `stats()` has `hit_ratio`,
+            `entries`, optionally `size_bytes`, and event counters such as
+            `hits`, `misses`, `stale_hits`, `disk_hits` (a subset of `hits`),
+            `fallbacks` or `evictions`
+    """
+
+    EVENTS = ("hits", "misses", "stale_hits", "disk_hits", "fallbacks", "evictions")
+
+    def __init__(self, caches: dict):
+        self.caches = caches
+
+    def collect(self):
+        events = CounterMetricFamily("ml_cache_events", "Cache lookup events", labels=["cache", "event"])
+        hit_ratio = GaugeMetricFamily("ml_cache_hit_ratio", "Hit ratio since start", labels=["cache"])
+        entries = GaugeMetricFamily("ml_cache_entries", "Entries held in memory", labels=["cache"])
+        size = GaugeMetricFamily("ml_cache_bytes", "Memory accounted to the cache's entries", labels=["cache"])
+
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            for event in self.EVENTS:
+                if event in stats:
+                    events.add_metric([name, event], stats[event])
+            hit_ratio.add_metric([name], stats["hit_ratio"])
+            entries.add_metric([name], stats["entries"])
+            if "size_bytes" in stats:
+                size.add_metric([name], stats["size_bytes"])
+
+        yield events
+        yield hit_ratio
+        yield entries
+        yield size
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and timing them per route and model
+
+    The route label is the route's path template, so unknown paths do not
+    create new series. Handlers name the model through `request.state.model`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            model = scope.get("state", {}).get("model", "")
+            REQUESTS.labels(route_path, model, str(status)).inc()
+            REQUEST_LATENCY.labels(route_path, model).observe(time.perf_counter() - started)
+
+
+def render_metrics():
+    """
+    Returns:
+        tuple: (exposition body, content type)
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(process_registry), CONTENT_TYPE_LATEST
@@ -275,3 +275,181 @@ def get_model(model_name, num_classes=38, in_channels=3):
         raise ValueError(f"Model {model_name} not supported. Choose from: {list(models.keys())}")
     
     return models[model_name.lower()](in_channels=in_channels, num_classes=num_classes)
+
+
+# The TorchScript exporter is used (dynamo=False): the dynamo one needs onnxscript.
+ONNX_OPSET = 17
+
+
+def conv_bn_pairs(model):
+    """
+    Qualified names of the (Conv2d, BatchNorm2d) pairs where the BN
+    normalizes the convolution's output and nothing else reads it
+
+    Pairs are read off the graph torch.fx traces through forward(), so they
+    follow the data flow rather than the order modules were registered in.
+    If forward() cannot be traced, only consecutive children of an
+    nn.Sequential count, whose order is their data flow.
+    """
+    from collections import Counter
+
+    import torch.fx
+
+    modules = dict(model.named_modules())
+    try:
+        graph = torch.fx.symbolic_trace(model).graph
+    except Exception as e:
+        print(f"Warning: Could not trace {type(model).__name__}, folding BatchNorm in nn.Sequential only: {e}")
+        pairs = []
+        for name, module in modules.items():
+            if not isinstance(module, nn.Sequential):
+                continue
+            prefix = f"{name}." if name else ''
+            children = list(module.named_children())
+            for (conv_name, conv), (bn_name, bn) in zip(children, children[1:]):
+                if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                    pairs.append((prefix + conv_name, prefix + bn_name))
+        return pairs
+
+    # A module called more than once cannot take over another's parameters.
+    calls = Counter(node.target for node in graph.nodes if node.op == 'call_module')
+    pairs = []
+    for node in graph.nodes:
+        if node.op != 'call_module' or not isinstance(modules[node.target], nn.BatchNorm2d):
+            continue
+        source = node.args[0]
+        if (isinstance(source, torch.fx.Node) and source.op == 'call_module'
+                and isinstance(modules[source.target], nn.Conv2d) and len(source.users) == 1
+                and calls[source.target] == 1 and calls[node.target] == 1):
+            pairs.append((source.target, node.target))
+    return pairs
+
+
+def fuse_conv_bn(model):
+    """
+    Fold every BatchNorm2d into the Conv2d that feeds it, in place
+
+    The convolution takes over the BN's scale and shift and the BN becomes
+    an Identity, so forward() is unchanged and each block saves a full pass
+    over its activations. The ReLUs stay: they run in place in PyTorch and
+    ONNX Runtime fuses them into the convolution.
+
+    Args:
+        model: Model in eval mode (BN folding uses the running statistics)
+
+    Returns:
+        The same model
+
+    Raises:
+        ValueError: If the model is training or a BN does not match its convolution
+    """
+    from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+    if model.training:
+        raise ValueError("BatchNorm can only be folded into convolutions in eval mode")
+
+    for conv_name, bn_name in conv_bn_pairs(model):
+        conv, bn = model.get_submodule(conv_name), model.get_submodule(bn_name)
+        if bn.num_features != conv.out_channels:
+            raise ValueError(
+                f"{bn_name} normalizes {bn.num_features} channels but {conv_name} outputs {conv.out_channels}"
+            )
+        for name, replacement in ((conv_name, fuse_conv_bn_eval(conv, bn)), (bn_name, nn.Identity())):
+            parent_name, _, attribute = name.rpartition('.')
+            setattr(model.get_submodule(parent_name), attribute, replacement)
+    return model
+
+
+def prepare_for_inference(model, channels_last=True):
+    """
+    Eval mode with BatchNorm folded into the convolutions
+
+    Args:
+        model: Model to prepare, modified in place
+        channels_last: Store weights NHWC, the layout CPU and CUDA convolution
+            kernels run fastest on; feed it `channels_last` inputs too
+
+    Returns:
+        Prepared model
+    """
+    model.eval()
+    fuse_conv_bn(model)
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    return model
+
+
+def export_onnx(model, output_path, input_size=(256, 256), opset_version=ONNX_OPSET, rtol=1e-3, atol=1e-4):
+    """
+    Export a fused copy of a model to ONNX and check it against the model
+
+    The graph has BatchNorm folded into the convolutions and a dynamic batch
+    axis. The unfused model, the fused one and the ONNX graph are then run on
+    the same random batch; export fails if their logits are not close or
+    their top-1 classes differ.
+
+    Args:
+        model: Trained model, left unchanged
+        output_path: Where to write the ONNX graph
+        input_size: Input image size (H, W)
+        opset_version: ONNX opset to target
+
+    Returns:
+        dict: Largest absolute logit difference of the fused model and of
+        the ONNX graph from the unfused model
+
+    Raises:
+        ValueError: If the fused model or the ONNX graph fails the parity check
+    """
+    import copy
+
+    import numpy as np
+    import onnxruntime as ort
+
+    model.eval()
+    device = next(model.parameters()).device
+    fused = prepare_for_inference(copy.deepcopy(model).cpu(), channels_last=False)
+
+    torch.onnx.export(
+        fused,
+        torch.randn(1, 3, *input_size),
+        str(output_path),
+        export_params=True,
+        opset_version=opset_version,
+        do_constant_folding=True,
+        input_names=['input'],
+        output_names=['output'],
+        dynamic_axes={'input': {0: 'batch_size'}, 'output': {0: 'batch_size'}},
+        dynamo=False,
+    )
+
+    # A batch of several images also checks the dynamic batch axis.
+    inputs = torch.randn(4, 3, *input_size)
+    with torch.no_grad():
+        expected = model(inputs.to(device)).cpu().numpy()
+        outputs = {'pytorch_fused': fused(inputs).numpy()}
+    session = ort.InferenceSession(str(output_path), providers=['CPUExecutionProvider'])
+    outputs['onnx'] = session.run(None, {'input': inputs.numpy()})[0]
+
+    errors = {name: check_parity(name, actual, expected, rtol, atol) for name, actual in outputs.items()}
+    print(f"Parity with the unfused model: fused {errors['pytorch_fused']:.2e}, ONNX {errors['onnx']:.2e}")
+    return errors
+
+
+def check_parity(name, actual, expected, rtol=1e-3, atol=1e-4):
+    """
+    Compare a model's logits with the unfused model's on the same batch
+
+    Returns:
+        float: Largest absolute logit difference
+
+    Raises:
+        ValueError: If the logits are not close or the top-1 classes differ
+    """
+    import numpy as np
+
+    error = float(np.max(np.abs(actual - expected)))
+    same_classes = np.array_equal(np.argmax(actual, axis=1), np.argmax(expected, axis=1))
+    if not same_classes or not np.allclose(actual, expected, rtol=rtol, atol=atol):
+        raise ValueError(f"{name} output differs from the unfused model (max abs diff {error:.2e})")
+    return error
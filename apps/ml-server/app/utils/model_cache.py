@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Hashable, Optional
+
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", 0))
+MODEL_CACHE_IDLE_SECONDS = float(os.getenv("MODEL_CACHE_IDLE_SECONDS", 0))
+
+
+class ModelCache:
+    """
+    Loaded models (ONNX sessions, PyTorch modules) under a memory budget
+
+    Models are kept in least-recently-used order with the size their loader
+    reports, normally the bytes of their weights. Loading a model that does
+    not fit in `max_bytes` evicts the least recently used ones first, and
+    models unused for `idle_seconds` are dropped on the next lookup; either
+    limit is off at 0. Pinned models, the preloaded ones, are never evicted.
+
+    Eviction only drops the cache's reference: a model still running a batch
+    is freed once that call returns.
+    """
+
+    def __init__(self, max_bytes=MODEL_CACHE_MAX_BYTES, idle_seconds=MODEL_CACHE_IDLE_SECONDS):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.entries = OrderedDict()  # key -> [model, size, last used]
+        self.pinned = set()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.load_locks = defaultdict(threading.Lock)
+
+    def get(self, key: Hashable, load: Callable, size: Optional[Callable] = None, pin: bool = False):
+        """
+        Return the model cached under `key`, loading it on a miss
+
+        Args:
+            load: Builds the model; runs once per key even for concurrent callers
+            size: Returns the bytes to account for a loaded model (0 if omitted)
+            pin: Keep the model loaded regardless of budget and idle time
+        """
+        model = self.lookup(key, pin)
+        if model is not None:
+            return model
+
+        with self.load_locks[key]:
+            model = self.lookup(key, pin)
+            if model is not None:
+                return model
+
+            model = load()
+            model_bytes = size(model) if size else 0
+            with self.lock:
+                self.misses += 1
+                if pin:
+                    self.pinned.add(key)
+                self.entries[key] = [model, model_bytes, time.monotonic()]
+                self.size_bytes += model_bytes
+                self.evict(keep=key)
+            return model
+
+    def lookup(self, key: Hashable, pin: bool = False):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            entry[2] = time.monotonic()
+            self.entries.move_to_end(key)
+            self.hits += 1
+            if pin:
+                self.pinned.add(key)
+            if self.idle_seconds:
+                self.evict(keep=key)
+            return entry[0]
+
+    def evict(self, keep: Optional[Hashable] = None):
+        """Drop idle models, then least recently used ones until within budget (lock held)"""
+        now = time.monotonic()
+        for key in list(self.entries):
+            if key == keep or key in self.pinned:
+                continue
+            over_budget = self.max_bytes and self.size_bytes > self.max_bytes
+            idle = self.idle_seconds and now - self.entries[key][2] > self.idle_seconds
+            if over_budget or idle:
+                self.remove(key)
+
+        if self.max_bytes and self.size_bytes > self.max_bytes:
+            print(f"Warning: Loaded models take {self.size_bytes} bytes, over the {self.max_bytes} byte budget")
+
+    def remove(self, key: Hashable):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[1]
+            self.evictions += 1
+            print(f"Evicted model {key} ({entry[1]} bytes)")
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "size_bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
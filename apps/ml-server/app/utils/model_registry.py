@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from app.utils.checkpoint import checkpoint_file
+from app.utils.executor import run_in_executor
+from app.utils.metrics import MODEL_LOAD_SECONDS
+from app.utils.resnet_inference import (
+    MODEL_CONFIGS, PYTORCH_FALLBACK, default_precision, load_onnx_model, load_pytorch_model, run_inference,
+)
+from app.utils.xgboost_inference import get_crop_model, predict_proba
+
+CROP_MODEL_NAME = "xgboost"
+PRELOAD_MODELS = [name.strip() for name in os.getenv("PRELOAD_MODELS", "xgboost,resnet9").split(",") if name.strip()]
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "true").lower() in ("1", "true", "yes")
+
+model_states = {}
+
+
+def set_state(model_name: str, state: str, **details):
+    entry = model_states.setdefault(model_name, {})
+    entry.update(details, state=state)
+
+
+# Replicas are not ready until the preload has actually run.
+for name in PRELOAD_MODELS:
+    set_state(name, "pending")
+
+
+def load_model(model_name: str):
+    """
+    Load one model and run a warm-up inference, recording its state
+
+    States move from 'loading' to 'warming' to 'ready', or to 'failed' with
+    the error. A ResNet whose ONNX graph cannot be loaded falls back to
+    PyTorch the same way requests do, but only to a trained checkpoint: a
+    model with no weights at all fails rather than serving random ones.
+    """
+    set_state(model_name, "loading", error=None)
+    started = time.perf_counter()
+
+    try:
+        if model_name == CROP_MODEL_NAME:
+            if get_crop_model() is None:
+                raise RuntimeError("Crop recommendation model is not available.")
+            backend = "xgboost"
+            dummy = np.zeros((1, 7), dtype=np.float32)
+        elif model_name in MODEL_CONFIGS:
+            precision = default_precision(model_name)
+            try:
+                load_onnx_model(model_name, precision, pin=True)
+                backend = "ONNX"
+            except Exception as e:
+                if not PYTORCH_FALLBACK:
+                    raise
+                if checkpoint_file(MODEL_CONFIGS[model_name]["pytorch_path"]) is None:
+                    raise FileNotFoundError(f"{model_name} has neither an ONNX graph nor a checkpoint: {e}") from e
+                print(f"ONNX load failed for {model_name}, falling back to PyTorch: {e}")
+                load_pytorch_model(model_name, pin=True)
+                backend = "PyTorch"
+            dummy = np.zeros((1, 3, 256, 256), dtype=np.float32)
+        else:
+            raise ValueError(f"Unknown model {model_name}. Choose from: {[CROP_MODEL_NAME, *MODEL_CONFIGS]}")
+
+        load_seconds = time.perf_counter() - started
+        MODEL_LOAD_SECONDS.labels(model_name, "load").set(load_seconds)
+        set_state(model_name, "warming", backend=backend, load_seconds=load_seconds)
+
+        if WARMUP_MODELS:
+            started = time.perf_counter()
+            if model_name == CROP_MODEL_NAME:
+                predict_proba(dummy)
+            else:
+                run_inference(dummy, model_name, use_onnx=backend == "ONNX", precision=precision)
+            warmup_seconds = time.perf_counter() - started
+            MODEL_LOAD_SECONDS.labels(model_name, "warmup").set(warmup_seconds)
+            set_state(model_name, "warming", warmup_seconds=warmup_seconds)
+
+        set_state(model_name, "ready")
+        print(f"Model {model_name} ready ({backend}, loaded in {load_seconds:.2f}s)")
+    except Exception as e:
+        set_state(model_name, "failed", error=str(e))
+        print(f"Failed to load model {model_name}: {e}")
+
+
+async def preload_models(model_names=PRELOAD_MODELS):
+    """Load and warm up the configured models in parallel, skipping ready ones"""
+    # Models the prefork supervisor loaded are inherited ready.
+    model_names = [name for name in model_names if model_states.get(name, {}).get("state") != "ready"]
+    if not model_names:
+        return
+
+    for model_name in model_names:
+        set_state(model_name, "pending")
+
+    # On the shared worker pool, so cancelling at shutdown does not wait on a private pool.
+    await asyncio.gather(*(run_in_executor(load_model, name) for name in model_names))
+
+
+def readiness():
+    """
+    Returns:
+        tuple: (whether every preloaded model is ready, per-model states)
+    """
+    ready = all(state["state"] == "ready" for state in model_states.values())
+    return ready, {name: dict(state) for name, state in model_states.items()}
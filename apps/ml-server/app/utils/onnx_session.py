@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import platform
+import shutil
+import tempfile
+from pathlib import Path
+
+import onnxruntime as ort
+
+BASE_DIR = Path(__file__).resolve().parent
+
+ONNX_SESSION_CONFIG = os.getenv("ONNX_SESSION_CONFIG", "")
+ONNX_OPTIMIZED_DIR = os.getenv(
+    "ONNX_OPTIMIZED_DIR", str(BASE_DIR / '..' / 'models' / 'plant-disease' / 'optimized')
+)
+SERVER_WORKERS = int(os.getenv("WEB_CONCURRENCY", 1))
+# Sessions that may be loaded side by side on one host, per worker.
+SESSIONS_PER_WORKER = int(os.getenv("ONNX_SESSIONS_PER_WORKER", 3))
+# Initializers at least this large are memory-mapped from the cache's .data file.
+EXTERNAL_DATA_MIN_BYTES = 1024
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+
+def parse_bool(value) -> bool:
+    return str(value).lower() in ("1", "true", "yes")
+
+
+# Setting name -> (environment suffix, parser)
+SETTINGS = {
+    "intra_op_num_threads": ("INTRA_OP_THREADS", int),
+    "inter_op_num_threads": ("INTER_OP_THREADS", int),
+    "execution_mode": ("EXECUTION_MODE", str),
+    "graph_optimization_level": ("GRAPH_OPTIMIZATION", str),
+    "enable_cpu_mem_arena": ("CPU_MEM_ARENA", parse_bool),
+    "enable_mem_pattern": ("MEM_PATTERN", parse_bool),
+    "allow_spinning": ("ALLOW_SPINNING", parse_bool),
+    "optimized_cache": ("OPTIMIZED_CACHE", parse_bool),
+}
+
+
+def default_session_config():
+    """
+    Defaults that keep every session on the host within the available cores
+
+    Each session owns its own intra-op pool, so the cores are split between
+    all server workers and the models each of them may load.
+    """
+    cpus = os.cpu_count() or 1
+    return {
+        "intra_op_num_threads": max(1, cpus // (SERVER_WORKERS * SESSIONS_PER_WORKER)),
+        "inter_op_num_threads": 1,
+        "execution_mode": "sequential",
+        "graph_optimization_level": "all",
+        "enable_cpu_mem_arena": True,
+        "enable_mem_pattern": True,
+        # Idle pools spinning for work steal cores from the other sessions.
+        "allow_spinning": False,
+        "optimized_cache": True,
+    }
+
+
+def load_config_file(path=ONNX_SESSION_CONFIG):
+    if not path:
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read ONNX session config {path}: {e}")
+        return {}
+
+
+def session_config(model_name: str) -> dict:
+    """
+    Resolve the session settings for a model
+
+    Later sources win: computed defaults, the config file's "default" and
+    per-model sections, ONNX_<SETTING> and finally ONNX_<MODEL>_<SETTING>
+    environment variables (e.g. ONNX_RESNET50_INTRA_OP_THREADS=4).
+    """
+    file_config = load_config_file()
+    config = default_session_config()
+    config.update(file_config.get("default", {}))
+    config.update(file_config.get(model_name, {}))
+
+    for setting, (suffix, parse) in SETTINGS.items():
+        for env_name in (f"ONNX_{suffix}", f"ONNX_{model_name.upper()}_{suffix}"):
+            value = os.getenv(env_name)
+            if value not in (None, ""):
+                config[setting] = parse(value)
+
+    for setting, (_, parse) in SETTINGS.items():
+        config[setting] = parse(config[setting])
+    return config
+
+
+def external_data_path(onnx_path) -> Path:
+    """Weights file of a graph saved with external data (`<model>.onnx.data`)"""
+    return Path(f"{onnx_path}.data")
+
+
+def model_file_bytes(onnx_path) -> int:
+    """
+    Size of a model on disk, graph and external weights together
+
+    The model cache budgets sessions by this, an estimate: the resident
+    size also depends on prepacked kernels, the memory arena and whether
+    the weights are memory-mapped and shared.
+    """
+    return sum(os.path.getsize(path) for path in (onnx_path, external_data_path(onnx_path)) if os.path.exists(path))
+
+
+def optimized_model_path(onnx_path, config, providers):
+    """
+    Cache location of the optimized graph for this model file and runtime
+
+    The name changes whenever the source files, ONNX Runtime version,
+    providers, optimization level or CPU architecture change, since an
+    optimized graph is only valid for the setup that produced it.
+    """
+    sources = [path for path in (onnx_path, external_data_path(onnx_path)) if os.path.exists(path)]
+    fingerprint = "|".join([
+        str(Path(onnx_path).resolve()),
+        *(f"{os.stat(path).st_size}:{os.stat(path).st_mtime_ns}" for path in sources),
+        ort.__version__, ",".join(providers), config["graph_optimization_level"], platform.machine(),
+        "external-initializers",
+    ])
+    digest = hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+    return Path(ONNX_OPTIMIZED_DIR) / f"{Path(onnx_path).stem}.{digest}.optimized.onnx"
+
+
+def session_options(config) -> ort.SessionOptions:
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = config["intra_op_num_threads"]
+    options.inter_op_num_threads = config["inter_op_num_threads"]
+    options.execution_mode = EXECUTION_MODES[config["execution_mode"]]
+    options.graph_optimization_level = OPTIMIZATION_LEVELS[config["graph_optimization_level"]]
+    options.enable_cpu_mem_arena = config["enable_cpu_mem_arena"]
+    options.enable_mem_pattern = config["enable_mem_pattern"]
+    options.add_session_config_entry("session.intra_op.allow_spinning", "1" if config["allow_spinning"] else "0")
+    options.add_session_config_entry("session.inter_op.allow_spinning", "1" if config["allow_spinning"] else "0")
+    return options
+
+
+def create_session(model_name: str, onnx_path, providers) -> ort.InferenceSession:
+    """
+    Create an InferenceSession with the model's configured options
+
+    With the optimized-graph cache enabled, the first startup serializes the
+    optimized graph to ONNX_OPTIMIZED_DIR and later startups load it with
+    graph optimizations turned off, skipping the optimization passes. A
+    cached graph that fails to load is deleted and rebuilt from `onnx_path`.
+
+    Only sessions loaded from that cache keep their weights in a separate
+    `.data` file, which ONNX Runtime memory-maps instead of copying, so
+    processes serving the model share those pages. The first session, and
+    every session when the cache is off or unwritable, holds a private copy
+    of the weights, and kernels ONNX Runtime prepacks are private either way.
+    """
+    config = session_config(model_name)
+    print(f"ONNX session for {model_name}: {config}")
+    if not (config["optimized_cache"] and ONNX_OPTIMIZED_DIR):
+        return ort.InferenceSession(str(onnx_path), sess_options=session_options(config), providers=providers)
+
+    cached_path = optimized_model_path(onnx_path, config, providers)
+    if cached_path.exists() and external_data_path(cached_path).exists():
+        options = session_options(config)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            session = ort.InferenceSession(str(cached_path), sess_options=options, providers=providers)
+            print(f"Using optimized {model_name} graph from {cached_path}")
+            return session
+        except Exception as e:
+            print(f"Warning: Discarding unreadable optimized {model_name} graph {cached_path}: {e}")
+            for path in (cached_path, external_data_path(cached_path)):
+                path.unlink(missing_ok=True)
+
+    return create_cached_session(model_name, onnx_path, providers, config, cached_path)
+
+
+def create_cached_session(model_name: str, onnx_path, providers, config, cached_path) -> ort.InferenceSession:
+    """
+    Optimize the source graph and publish the result at `cached_path`
+
+    ONNX Runtime writes the optimized graph into a staging directory private
+    to this call; both files are then renamed into place, so another worker
+    never sees them half-written and a crash leaves at most a stale staging
+    directory behind.
+    """
+    options = session_options(config)
+    staging = None
+    try:
+        cached_path.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=cached_path.parent, prefix=f".{cached_path.stem}-"))
+        options.optimized_model_filepath = str(staging / cached_path.name)
+        options.add_session_config_entry(
+            "session.optimized_model_external_initializers_file_name", external_data_path(cached_path).name
+        )
+        options.add_session_config_entry(
+            "session.optimized_model_external_initializers_min_size_in_bytes", str(EXTERNAL_DATA_MIN_BYTES)
+        )
+    except OSError as e:
+        print(f"Warning: Cannot cache optimized {model_name} graph in {cached_path.parent}: {e}")
+
+    try:
+        session = ort.InferenceSession(str(onnx_path), sess_options=options, providers=providers)
+        if staging is not None:
+            try:
+                # Weights first: the graph is only used once its .data file is there.
+                for path in (external_data_path(cached_path), cached_path):
+                    os.replace(staging / path.name, path)
+            except OSError as e:
+                print(f"Warning: Could not publish optimized {model_name} graph to {cached_path}: {e}")
+        return session
+    finally:
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
@@ -0,0 +1,18 @@
+import numpy as np
+
+
+def top_classes(probabilities: np.ndarray, k: int):
+    """
+    The k most likely classes of every row of a (N, num_classes) array
+
+    argpartition selects each row's k winners in linear time, so only those
+    k are sorted, most likely first.
+
+    Returns:
+        tuple: (class indices, probabilities), both of shape (N, k)
+    """
+    k = min(k, probabilities.shape[1])
+    top = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+    top_probabilities = np.take_along_axis(probabilities, top, axis=1)
+    order = np.argsort(-top_probabilities, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_probabilities, order, axis=1)
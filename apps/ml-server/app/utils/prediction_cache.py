@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", 10000))
+PREDICTION_CACHE_MAX_BYTES = int(os.getenv("PREDICTION_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", 24 * 60 * 60))
+PREDICTION_CACHE_URL_TTL = float(os.getenv("PREDICTION_CACHE_URL_TTL", 5 * 60))
+PREDICTION_CACHE_DIR = os.getenv("PREDICTION_CACHE_DIR", "")
+
+# How often the disk tier drops rows older than the TTL.
+DISK_PURGE_INTERVAL = 60 * 60
+
+# Rough per-entry overhead of the dict, key and OrderedDict node on top of
+# the JSON-encoded result, used for memory accounting.
+ENTRY_OVERHEAD_BYTES = 512
+
+
+class UrlEntry(NamedTuple):
+    content_hash: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    checked_at: float
+
+
+def hash_image(image_bytes) -> str:
+    """Content address of an image, independent of the URL it came from"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class PredictionCache:
+    """
+    LRU/TTL cache of prediction results keyed by image content hash and model
+
+    Entries are evicted least-recently-used first once either `max_entries`
+    or `max_bytes` is exceeded. URLs are remembered separately with their
+    ETag/Last-Modified so a re-submitted URL can skip the download entirely
+    while fresh, or be revalidated with a conditional request afterwards.
+
+    With `cache_dir` set, results are also written to a SQLite file there so
+    they survive restarts; memory misses fall back to it. A single thread
+    owns the SQLite connection, off the event loop: it reads those misses,
+    commits queued writes in batches and purges expired rows.
+    """
+
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE, max_bytes=PREDICTION_CACHE_MAX_BYTES,
+                 ttl=PREDICTION_CACHE_TTL, url_ttl=PREDICTION_CACHE_URL_TTL, cache_dir=PREDICTION_CACHE_DIR):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.url_ttl = url_ttl
+        self.entries = OrderedDict()
+        self.urls = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.writer = None
+        self.writer_db = None
+        self.purged_at = 0.0
+        self.db_path = None
+        if cache_dir:
+            self.open_disk_tier(cache_dir)
+
+    def open_disk_tier(self, cache_dir):
+        try:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            self.db_path = Path(cache_dir) / "predictions.sqlite3"
+            with closing(sqlite3.connect(self.db_path)) as db, db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS predictions "
+                    "(key TEXT PRIMARY KEY, result TEXT NOT NULL, stored_at REAL NOT NULL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS predictions_stored_at ON predictions (stored_at)")
+            self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prediction-cache")
+            self.writer.submit(self.write_pending)  # purges expired rows
+            print(f"Prediction cache disk tier at {cache_dir}")
+        except sqlite3.Error as e:
+            print(f"Warning: Could not open prediction cache in {cache_dir}: {e}")
+
+    @staticmethod
+    def key(content_hash: str, model_name: str) -> str:
+        return f"{model_name}:{content_hash}"
+
+    async def get(self, content_hash: str, model_name: str) -> Optional[dict]:
+        key = self.key(content_hash, model_name)
+        now = time.time()
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            result, stored_at, _ = entry
+            if now - stored_at <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return dict(result)
+            self.remove(key)
+
+        result = await self.get_from_disk(key, now)
+        if result is not None:
+            self.hits += 1
+            self.disk_hits += 1
+            return dict(result)
+
+        self.misses += 1
+        return None
+
+    async def get_from_disk(self, key, now):
+        if self.writer is None:
+            return None
+        # On the writer thread, so a slow disk never stalls the event loop.
+        row = await asyncio.get_running_loop().run_in_executor(self.writer, self.read_row, key)
+        if row is None or now - row[1] > self.ttl:
+            return None
+
+        result = json.loads(row[0])
+        self.store(key, result, row[1], len(row[0]))
+        return result
+
+    def read_row(self, key):
+        """A stored (result, stored_at) row, or None (runs on the writer thread)"""
+        try:
+            return self.connection().execute(
+                "SELECT result, stored_at FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Prediction cache read failed: {e}")
+            return None
+
+    def connection(self):
+        if self.writer_db is None:
+            self.writer_db = sqlite3.connect(self.db_path)
+            self.writer_db.execute("PRAGMA synchronous=NORMAL")
+        return self.writer_db
+
+    def put(self, content_hash: str, model_name: str, result: dict):
+        key = self.key(content_hash, model_name)
+        encoded = json.dumps(result)
+        now = time.time()
+        self.store(key, dict(result), now, len(encoded))
+
+        if self.writer is not None:
+            with self.pending_lock:
+                self.pending.append((key, encoded, now))
+                if len(self.pending) == 1:
+                    self.writer.submit(self.write_pending)
+
+    def write_pending(self):
+        """Commit the queued results in one transaction (runs on the writer thread)"""
+        with self.pending_lock:
+            rows, self.pending = self.pending, []
+        try:
+            now = time.time()
+            with self.connection() as db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO predictions (key, result, stored_at) VALUES (?, ?, ?)", rows
+                )
+                if now - self.purged_at >= DISK_PURGE_INTERVAL:
+                    db.execute("DELETE FROM predictions WHERE stored_at < ?", (now - self.ttl,))
+                    self.purged_at = now
+        except sqlite3.Error as e:
+            print(f"Prediction cache write failed: {e}")
+
+    def flush(self):
+        """Wait until the queued results are on disk"""
+        if self.writer is not None:
+            self.writer.submit(self.write_pending).result()
+
+    def store(self, key, result, stored_at, encoded_size):
+        self.remove(key)
+        size = encoded_size + ENTRY_OVERHEAD_BYTES
+        self.entries[key] = (result, stored_at, size)
+        self.size_bytes += size
+
+        while self.entries and (len(self.entries) > self.max_entries or self.size_bytes > self.max_bytes):
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[2]
+
+    def lookup_url(self, url: str) -> Optional[UrlEntry]:
+        """Return what is known about a URL's content, or None"""
+        entry = self.urls.get(url)
+        if entry is not None:
+            self.urls.move_to_end(url)
+        return entry
+
+    def is_url_fresh(self, entry: UrlEntry) -> bool:
+        return time.time() - entry.checked_at <= self.url_ttl
+
+    def remember_url(self, url: str, content_hash: str, etag=None, last_modified=None):
+        self.urls.pop(url, None)
+        self.urls[url] = UrlEntry(content_hash, etag, last_modified, time.time())
+        while len(self.urls) > self.max_entries:
+            self.urls.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "size_bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "disk_tier": self.writer is not None,
+        }
+
+
+prediction_cache = PredictionCache()
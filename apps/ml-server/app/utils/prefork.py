@@ -0,0 +1,171 @@
+import os
+import signal
+import socket
+import time
+import traceback
+
+import uvicorn
+
+APP = "app.main:app"
+# A worker that dies sooner than this after starting is restarted only after a pause.
+RESTART_BACKOFF = 5
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on, honouring container CPU sets"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def fork_safe(model_name: str) -> bool:
+    """
+    Whether a model can be loaded before forking and used by every worker
+
+    Threads do not survive fork(), so only models that run on the calling
+    thread qualify: ONNX sessions with one intra-op thread in sequential mode
+    and the pure-NumPy compiled crop model. XGBoost boosters (OpenMP) and
+    PyTorch are loaded by each worker instead.
+    """
+    from app.utils.model_registry import CROP_MODEL_NAME
+    from app.utils.onnx_session import session_config
+    from app.utils.resnet_inference import MODEL_CONFIGS, default_precision, get_onnx_path
+    from app.utils.xgboost_inference import CROP_MODEL_BACKEND
+
+    if model_name == CROP_MODEL_NAME:
+        return CROP_MODEL_BACKEND == "compiled"
+    if model_name not in MODEL_CONFIGS or not os.path.exists(get_onnx_path(model_name, default_precision(model_name))):
+        return False
+    config = session_config(model_name)
+    return config["intra_op_num_threads"] == 1 and config["execution_mode"] == "sequential"
+
+
+def preload_shared_models():
+    """
+    Load and warm up the fork-safe PRELOAD_MODELS in the supervisor
+
+    Workers inherit the loaded sessions copy-on-write, so their weights and
+    prepacked kernels are in memory once however many workers run. Workers
+    see these models as ready and only load the remaining ones themselves.
+    """
+    from app.utils.model_registry import PRELOAD_MODELS, load_model, model_states
+
+    for model_name in PRELOAD_MODELS:
+        if fork_safe(model_name):
+            load_model(model_name)
+        else:
+            print(f"Model {model_name} is not fork-safe with its current settings, each worker loads its own copy")
+
+    return [name for name, state in model_states.items() if state["state"] == "ready"]
+
+
+def run_worker(sock: socket.socket, graceful_timeout: int):
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+
+    config = uvicorn.Config(APP, timeout_graceful_shutdown=graceful_timeout, proxy_headers=True)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(host: str, port: int, workers: int, graceful_timeout: int = 30, preload: bool = True):
+    """
+    Run `workers` uvicorn workers forked from one supervisor sharing a socket
+
+    SIGTERM, SIGINT or SIGHUP stop the workers from accepting connections
+    and let in-flight requests finish for up to `graceful_timeout` seconds.
+    Workers that exit on their own are replaced until then.
+    """
+    sock = bind_socket(host, port)
+    if preload:
+        shared = preload_shared_models()
+        print(f"Shared across workers: {', '.join(shared) or 'none'}")
+
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(sock, graceful_timeout)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if not stopping:
+            print(f"Received {signal.Signals(signum).name}, draining {len(children)} workers")
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    # SIGHUP too: its default action would kill the supervisor and orphan the workers.
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, stop)
+
+    print(f"Starting {workers} workers on http://{host}:{port}")
+    for _ in range(workers):
+        spawn()
+
+    deadline = None
+    while children:
+        if stopping and deadline is None:
+            deadline = time.monotonic() + graceful_timeout + 5
+        if deadline is not None and time.monotonic() > deadline:
+            print(f"Killing {len(children)} workers still running after {graceful_timeout}s")
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass  # Exited since the last waitpid; reaped below
+            deadline = float("inf")
+
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+
+        started = children.pop(pid, None)
+        if started is None:
+            continue
+        mark_worker_dead(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            if time.monotonic() - started < RESTART_BACKOFF:
+                time.sleep(RESTART_BACKOFF)
+            # A stop during the pause must not start a worker the drain would miss.
+            if not stopping:
+                spawn()
+
+    sock.close()
+    print("All workers stopped")
+
+
+def mark_worker_dead(pid: int):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
+
+
+def serve_single(host: str, port: int, graceful_timeout: int = 30):
+    uvicorn.run(APP, host=host, port=port, timeout_graceful_shutdown=graceful_timeout, proxy_headers=True)
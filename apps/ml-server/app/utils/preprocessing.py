@@ -0,0 +1,69 @@
+import io
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = (256, 256)
+# Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding, as long
+# as the result stays at least this many times IMAGE_SIZE. Leaving the final
+# bilinear resize some room keeps the pixels within ~0.5% of a full decode;
+# 1 decodes as small as possible, 0 turns draft decoding off (bit-exact).
+JPEG_DRAFT_OVERSAMPLE = float(os.getenv("JPEG_DRAFT_OVERSAMPLE", 2))
+
+buffers = threading.local()
+
+
+def load_image(img, size=IMAGE_SIZE):
+    """
+    Open an image (PIL Image, file path, or bytes) as RGB
+
+    JPEGs are decoded at the smallest DCT scale that still covers `size`
+    (height, width) times JPEG_DRAFT_OVERSAMPLE, so a 12MP photo is decoded
+    at 1/4 or 1/8 resolution instead of being fully decoded and then shrunk.
+    """
+    if isinstance(img, (bytes, bytearray, memoryview, str)):
+        img = Image.open(img if isinstance(img, str) else io.BytesIO(img))
+        # Only for images opened here: draft() changes what a caller's image decodes to.
+        if JPEG_DRAFT_OVERSAMPLE > 0 and img.format == "JPEG":
+            img.draft("RGB", (int(size[1] * JPEG_DRAFT_OVERSAMPLE), int(size[0] * JPEG_DRAFT_OVERSAMPLE)))
+        img.load()
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
+
+
+def preprocess_into(img, out: np.ndarray) -> np.ndarray:
+    """
+    Decode, resize and normalize an image straight into a 3xHxW float32 slot
+
+    Matches torchvision's `Resize` + `ToTensor()` on PIL images (bilinear PIL
+    resize, scale to [0, 1], HWC -> CHW). The uint8 pixels are scaled and
+    transposed in one pass into `out`, e.g. one slot of a batch buffer.
+    """
+    size = out.shape[1:]
+    resized = load_image(img, size).resize(size[::-1], Image.BILINEAR)
+    np.divide(np.asarray(resized).transpose(2, 0, 1), np.float32(255), out=out)
+    return out
+
+
+def preprocess_image(img) -> np.ndarray:
+    """Decode and transform a single image into a new 3x256x256 float32 array"""
+    return preprocess_into(img, np.empty((3, *IMAGE_SIZE), dtype=np.float32))
+
+
+def batch_buffer(batch_size: int) -> np.ndarray:
+    """
+    Reusable (batch_size, 3, 256, 256) float32 input buffer of this thread
+
+    Each inference thread keeps one buffer and grows it only when a larger
+    batch comes along. The contents are overwritten by the next batch, so the
+    buffer must not be held on to after the model call returns.
+    """
+    buffer = getattr(buffers, "batch", None)
+    if buffer is None or len(buffer) < batch_size:
+        buffer = np.empty((batch_size, 3, *IMAGE_SIZE), dtype=np.float32)
+        buffers.batch = buffer
+    return buffer[:batch_size]
@@ -1,13 +1,8 @@
 import os
 import sys
 from pathlib import Path
-from torchvision import transforms
-from PIL import Image
-import torch
-import torch.nn.functional as F
 import numpy as np
 import onnxruntime as ort
-import io
 from pathlib import Path
 
 current_dir = Path(__file__).parent
@@ -15,24 +10,19 @@ models_dir = current_dir.parent.parent / "models"
 sys.path.insert(0, str(models_dir))
 
 sys.path.insert(0, str(current_dir.parent.parent))
-from app.utils.model import get_model
 
-def detect_num_classes_from_checkpoint(checkpoint_path):
-    """Detect number of classes from checkpoint file"""
-    try:
-        checkpoint = torch.load(checkpoint_path, map_location='cpu')
-        if 'model_state_dict' in checkpoint:
-            state_dict = checkpoint['model_state_dict']
-        else:
-            state_dict = checkpoint
-        
-        for key in state_dict.keys():
-            if 'fc.weight' in key or 'classifier.2.weight' in key:
-                return state_dict[key].shape[0]
-        
-        return 38  # default
-    except:
-        return 38  # default
+from app.utils.checkpoint import (
+    ClassMismatch, align_classes, checkpoint_file, checkpoint_num_classes, load_checkpoint,
+)
+from app.utils.model_cache import ModelCache
+from app.utils.onnx_session import create_session, model_file_bytes
+from app.utils.postprocessing import top_classes
+from app.utils.metrics import BATCH_SIZE, observe_stage
+from app.utils.preprocessing import batch_buffer, load_image, preprocess_into
+
+# PyTorch is optional: the ONNX serving path only needs NumPy and PIL, and
+# torch is imported on first use of the PyTorch fallback or export helpers.
+PYTORCH_FALLBACK = os.getenv("PYTORCH_FALLBACK", "true").lower() in ("1", "true", "yes")
 
 disease_classes = [
     'Apple___Apple_scab', 'Apple___Black_rot', 'Apple___Cedar_apple_rust', 'Apple___healthy',
@@ -47,6 +37,21 @@ disease_classes = [
     'Tomato___Tomato_Yellow_Leaf_Curl_Virus', 'Tomato___Tomato_mosaic_virus', 'Tomato___healthy'
 ]
 
+def class_labels(class_name):
+    """Display names of a 'Plant___Disease' class"""
+    parts = class_name.split('___')
+    return {
+        'predicted_class': class_name,
+        'plant_name': parts[0].replace('_', ' ').title() if len(parts) >= 1 else "Unknown",
+        'disease_status': parts[1].replace('_', ' ').title() if len(parts) >= 2 else "Unknown",
+    }
+
+# Built once, so formatting a prediction is an index lookup.
+class_table = [class_labels(name) for name in disease_classes]
+
+# Alternatives computed for every prediction; requests ask for up to this many.
+TOP_K_MAX = int(os.getenv("TOP_K_MAX", 5))
+
 
 BASE_DIR = Path(__file__).resolve().parent
 
@@ -65,180 +70,349 @@ MODEL_CONFIGS = {
     }
 }
 
-loaded_models = {}
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# Quantized variants are built and accuracy-gated by
+# ml-model/inference/plant-disease/quantize.py and stored next to the FP32
+# graph, e.g. resnet50_plant_disease.int8.onnx.
+PRECISIONS = ('fp32', 'int8', 'int8-dynamic', 'fp16')
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32")
 
-def load_pytorch_model(model_name='resnet9'):
-    """Load PyTorch model"""
-    if model_name in loaded_models:
-        return loaded_models[model_name]
-    
+for config in MODEL_CONFIGS.values():
+    config['onnx_variants'] = {
+        precision: config['onnx_path'] if precision == 'fp32'
+        else config['onnx_path'].with_name(f"{config['onnx_path'].stem}.{precision}.onnx")
+        for precision in PRECISIONS
+    }
+
+# ONNX sessions under ("onnx", model, precision), PyTorch models under ("pytorch", model)
+model_cache = ModelCache()
+device = None
+
+def get_device():
+    """Torch device for the PyTorch fallback (imports torch)"""
+    global device
+    if device is None:
+        import torch
+        from app.utils.torch_backend import configure_threads
+
+        configure_threads()
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return device
+
+def get_onnx_providers():
+    if 'CUDAExecutionProvider' in ort.get_available_providers():
+        return ['CUDAExecutionProvider', 'CPUExecutionProvider']
+    return ['CPUExecutionProvider']
+
+def load_pytorch_model(model_name='resnet9', pin=False):
+    """Load PyTorch model, run with TORCH_BACKEND (cached; `pin` exempts it from eviction)"""
+    model, _ = model_cache.get(
+        ('pytorch', model_name), lambda: _load_optimized_pytorch_model(model_name), lambda entry: entry[1], pin
+    )
+    return model
+
+def _load_optimized_pytorch_model(model_name):
+    """The runnable model and its weight bytes, counted before scripting hides the parameters"""
+    from app.utils.torch_backend import optimize_model
+
+    model = _prepare_checked(_load_pytorch_model(model_name), model_name)
+    model_bytes = pytorch_model_bytes(model)
+    weights_path = checkpoint_file(MODEL_CONFIGS[model_name]['pytorch_path'])
+    return optimize_model(model, model_name, weights_path), model_bytes
+
+def _prepare_checked(model, model_name):
+    """
+    prepare_for_inference, checked against the unfused model on one batch
+
+    If folding BatchNorm changed the logits the unfused model is served
+    instead, so a model whose blocks fold wrongly is slower, not wrong.
+    """
+    import copy
+
+    import torch
+    from app.utils.model import check_parity, prepare_for_inference
+
+    reference = copy.deepcopy(model.eval())
+    model = prepare_for_inference(model)
+    inputs = torch.randn(2, 3, 256, 256, device=get_device())
+    with torch.inference_mode():
+        expected = reference(inputs).cpu().numpy()
+        actual = model(inputs.contiguous(memory_format=torch.channels_last)).cpu().numpy()
+    try:
+        error = check_parity(f"{model_name} with BatchNorm folded", actual, expected)
+    except ValueError as e:
+        print(f"Warning: {e}, serving it unfused")
+        return reference.to(memory_format=torch.channels_last)
+    print(f"Folded BatchNorm into {model_name} (max abs logit diff {error:.2e})")
+    return model
+
+def pytorch_model_bytes(model):
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+def _load_pytorch_model(model_name):
+    import torch
+    from app.utils.model import get_model
+
+    device = get_device()
     config = MODEL_CONFIGS.get(model_name)
     if not config:
         raise ValueError(f"Model {model_name} not supported. Choose from: {list(MODEL_CONFIGS.keys())}")
     
-    model_path = config['pytorch_path']
+    model_path = checkpoint_file(config['pytorch_path'])
     
-    if os.path.exists(model_path):
+    if model_path:
         try:
-            num_classes = detect_num_classes_from_checkpoint(model_path)
+            state_dict, metadata = load_checkpoint(config['pytorch_path'], device)
+            num_classes = checkpoint_num_classes(state_dict, metadata, len(disease_classes))
             print(f"Detected {num_classes} classes from checkpoint")
+            # ONNX graphs and checkpoints share one class table, so logits follow its order.
+            if metadata.get('class_names'):
+                state_dict = align_classes(state_dict, metadata['class_names'], disease_classes)
             
-            model = get_model(model_name, num_classes=num_classes)
-            
-            checkpoint = torch.load(model_path, map_location=device)
-            if 'model_state_dict' in checkpoint:
-                model.load_state_dict(checkpoint['model_state_dict'])
-            else:
-                model.load_state_dict(checkpoint)
+            # Built without initializing weights, then pointed at the loaded tensors.
+            with torch.device('meta'):
+                model = get_model(model_name, num_classes=num_classes)
+            model.load_state_dict(state_dict, assign=True)
             print(f"Loaded {model_name} weights from {model_path}")
             
+        except ClassMismatch as e:
+            # Unlike unreadable weights, this is not papered over with random ones.
+            raise ClassMismatch(f"Refusing {model_name} checkpoint {model_path}: {e}") from e
         except Exception as e:
             print(f"Warning: Could not load weights for {model_name}: {e}")
             print("Using randomly initialized weights with 38 classes")
             model = get_model(model_name, num_classes=len(disease_classes))
     else:
-        print(f"Warning: Model file not found at {model_path}")
+        print(f"Warning: Model file not found at {config['pytorch_path']}")
         print("Using randomly initialized weights")
         model = get_model(model_name, num_classes=len(disease_classes))
     
     model = model.to(device)
     model.eval()
-    
-    loaded_models[model_name] = model
     return model
 
-def load_onnx_model(model_name='resnet9'):
-    """Load ONNX model"""
-    onnx_key = f"{model_name}_onnx"
-    if onnx_key in loaded_models:
-        return loaded_models[onnx_key]
-    
-    config = MODEL_CONFIGS.get(model_name)
-    if not config:
-        raise ValueError(f"Model {model_name} not supported. Choose from: {list(MODEL_CONFIGS.keys())}")
-    
-    onnx_path = config['onnx_path']
-    
+def load_onnx_model(model_name='resnet9', precision='fp32', pin=False):
+    """Load ONNX model (cached; `pin` exempts it from eviction)"""
+    onnx_path = get_onnx_path(model_name, precision)
+    return model_cache.get(
+        ('onnx', model_name, precision), lambda: _load_onnx_model(model_name, precision, onnx_path),
+        lambda session: model_file_bytes(onnx_path), pin
+    )
+
+def _load_onnx_model(model_name, precision, onnx_path):
     if not os.path.exists(onnx_path):
         raise FileNotFoundError(f"ONNX model not found at {onnx_path}")
     
-    providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if torch.cuda.is_available() else ['CPUExecutionProvider']
-    session = ort.InferenceSession(onnx_path, providers=providers)
+    session = create_session(model_name, onnx_path, get_onnx_providers())
     
-    loaded_models[onnx_key] = session
-    print(f"Loaded {model_name} ONNX model from {onnx_path}")
+    print(f"Loaded {model_name} {precision} ONNX model from {onnx_path}")
     return session
 
-def predict_image(img, model_name='resnet9', use_onnx=False, confidence_threshold=0.5):
+def get_onnx_path(model_name, precision='fp32'):
+    """Path of a model's ONNX graph at the given precision"""
+    config = MODEL_CONFIGS.get(model_name)
+    if not config:
+        raise ValueError(f"Model {model_name} not supported. Choose from: {list(MODEL_CONFIGS.keys())}")
+    if precision not in config['onnx_variants']:
+        raise ValueError(f"Precision {precision} not supported. Choose from: {list(PRECISIONS)}")
+    return config['onnx_variants'][precision]
+
+def available_precisions(model_name):
+    """Precisions with a published ONNX graph for the model"""
+    config = MODEL_CONFIGS.get(model_name, {})
+    return [precision for precision, path in config.get('onnx_variants', {}).items() if os.path.exists(path)]
+
+def published_precision(model_name, precision):
+    """The precision if the model publishes that variant, else fp32"""
+    return precision if precision in available_precisions(model_name) else 'fp32'
+
+def default_precision(model_name):
+    """MODEL_PRECISION where the model publishes it; a variant that failed its gate falls back to fp32"""
+    return published_precision(model_name, MODEL_PRECISION)
+
+def softmax(logits):
+    """Row-wise softmax over a (batch, num_classes) logits array"""
+    probabilities = np.exp(logits - np.max(logits, axis=1, keepdims=True))
+    return probabilities / np.sum(probabilities, axis=1, keepdims=True)
+
+def run_inference(batch, model_name='resnet9', use_onnx=False, precision='fp32'):
     """
-    Predict plant disease from image using specified model
-    
+    Run a preprocessed NCHW batch through the model in a single call
+
     Args:
-        img: Input image (PIL Image, file path, or bytes)
+        batch: float32 array of shape (N, 3, 256, 256)
         model_name: Model to use ('resnet9', 'resnet18', 'resnet50')
         use_onnx: Whether to use ONNX model (if available)
-        confidence_threshold: Minimum confidence for prediction
-    
+        precision: ONNX graph variant ('fp32', 'int8', 'int8-dynamic', 'fp16');
+            the PyTorch fallback always runs in FP32
+
     Returns:
-        dict: Prediction results with confidence and details
+        tuple: (probabilities array of shape (N, num_classes), inference type)
     """
-    transform = transforms.Compose([
-        transforms.Resize((256, 256)),
-        transforms.ToTensor(),
-    ])
-
-    if isinstance(img, str):
-        img = Image.open(img).convert("RGB")
-    elif isinstance(img, bytes):
-        img = Image.open(io.BytesIO(img)).convert("RGB")
-    elif not isinstance(img, Image.Image):
-        img = img.convert("RGB")
-
-    img_tensor = transform(img).unsqueeze(0)
-    
     if use_onnx:
         try:
-            session = load_onnx_model(model_name)
+            session = load_onnx_model(model_name, precision)
             input_name = session.get_inputs()[0].name
-            
-            logits = session.run(None, {input_name: img_tensor.numpy()})[0]
-            
-            probabilities = np.exp(logits - np.max(logits, axis=1, keepdims=True))
-            probabilities = probabilities / np.sum(probabilities, axis=1, keepdims=True)
-            
-            confidence = float(np.max(probabilities))
-            predicted_idx = int(np.argmax(probabilities))
-            
+            with observe_stage("session_run", model_name):
+                logits = session.run(None, {input_name: batch})[0]
+            return softmax(logits), 'ONNX'
         except Exception as e:
+            if not PYTORCH_FALLBACK:
+                raise RuntimeError(f"ONNX inference failed for {model_name}: {e}") from e
             print(f"ONNX inference failed, falling back to PyTorch: {e}")
-            use_onnx = False
-    
-    if not use_onnx:
-        model = load_pytorch_model(model_name)
-        img_tensor = img_tensor.to(device)
-        
-        with torch.no_grad():
-            logits = model(img_tensor)
-            probabilities = F.softmax(logits, dim=1)
-            confidence = float(torch.max(probabilities))
-            predicted_idx = int(torch.argmax(probabilities))
-    
-    if predicted_idx < len(disease_classes):
-        predicted_class = disease_classes[predicted_idx]
-        parts = predicted_class.split('___')
-        plant_name = parts[0].replace('_', ' ').title() if len(parts) >= 1 else "Unknown"
-        disease_status = parts[1].replace('_', ' ').title() if len(parts) >= 2 else "Unknown"
-    else:
-        predicted_class = f"Class_{predicted_idx}"
-        plant_name = "Unknown"
-        disease_status = f"Predicted_Class_{predicted_idx}"
-    
+
+    import torch
+    import torch.nn.functional as F
+
+    model = load_pytorch_model(model_name)
+    with torch.inference_mode(), observe_stage("session_run", model_name):
+        logits = model(torch.from_numpy(batch).to(get_device(), memory_format=torch.channels_last))
+        probabilities = F.softmax(logits, dim=1)
+    return probabilities.cpu().numpy(), 'PyTorch'
+
+def class_entry(idx):
+    """Precomputed display names of a class index"""
+    if idx < len(class_table):
+        return class_table[idx]
+    return {'predicted_class': f"Class_{idx}", 'plant_name': "Unknown", 'disease_status': f"Predicted_Class_{idx}"}
+
+def format_prediction(predicted_idx, confidence, model_name, inference_type, confidence_threshold=0.5,
+                      precision='fp32', alternatives=None):
+    """Build the prediction result dict for a single class index"""
     result = {
-        'predicted_class': predicted_class,
-        'plant_name': plant_name,
-        'disease_status': disease_status,
+        **class_entry(predicted_idx),
         'confidence': confidence,
         'is_confident': confidence >= confidence_threshold,
         'model_used': model_name,
-        'inference_type': 'ONNX' if use_onnx else 'PyTorch'
+        'inference_type': inference_type,
+        'precision': precision if inference_type == 'ONNX' else 'fp32'
     }
-    
+    if alternatives is not None:
+        result['top_k'] = alternatives
     return result
 
-def predict_batch(images, model_name='resnet9', use_onnx=False, batch_size=8):
+def format_predictions(probabilities, model_name, inference_type, confidence_threshold=0.5, precision='fp32',
+                       top_k=0):
+    """
+    Result dicts for every row of a (N, num_classes) probability array
+
+    With `top_k`, each result also lists the k most likely classes with
+    their confidence under 'top_k', selected for the whole batch at once.
+    """
+    if not top_k:
+        predicted = np.argmax(probabilities, axis=1)
+        confidences = probabilities[np.arange(len(predicted)), predicted]
+        return [
+            format_prediction(idx, confidence, model_name, inference_type, confidence_threshold, precision)
+            for idx, confidence in zip(predicted.tolist(), confidences.tolist())
+        ]
+
+    top, top_probabilities = top_classes(probabilities, top_k)
+    results = []
+    for indices, confidences in zip(top.tolist(), top_probabilities.tolist()):
+        alternatives = [
+            {**class_entry(idx), 'confidence': confidence} for idx, confidence in zip(indices, confidences)
+        ]
+        results.append(format_prediction(
+            indices[0], confidences[0], model_name, inference_type, confidence_threshold, precision, alternatives
+        ))
+    return results
+
+def predict_image(img, model_name='resnet9', use_onnx=False, confidence_threshold=0.5, precision='fp32', top_k=0):
+    """
+    Predict plant disease from image using specified model
+    
+    Args:
+        img: Input image (PIL Image, file path, or bytes)
+        model_name: Model to use ('resnet9', 'resnet18', 'resnet50')
+        use_onnx: Whether to use ONNX model (if available)
+        confidence_threshold: Minimum confidence for prediction
+        precision: ONNX graph variant to use
+        top_k: Also list the k most likely classes
+    
+    Returns:
+        dict: Prediction results with confidence and details
+    """
+    batch = batch_buffer(1)
+    preprocess_into(img, batch[0])
+    probabilities, inference_type = run_inference(batch, model_name, use_onnx, precision)
+    
+    return format_predictions(
+        probabilities, model_name, inference_type, confidence_threshold, precision, top_k
+    )[0]
+
+def predict_batch(images, model_name='resnet9', use_onnx=False, batch_size=8, confidence_threshold=0.5,
+                  precision='fp32', top_k=0):
     """
     Predict plant diseases for multiple images
     
+    Each chunk of `batch_size` images is preprocessed in place into this
+    thread's reusable NCHW buffer and run through the model with a single
+    call. Images that fail to decode get an error entry without failing the
+    rest of the chunk.
+    
     Args:
         images: List of images (paths, PIL Images, or bytes)
         model_name: Model to use
         use_onnx: Whether to use ONNX model
         batch_size: Batch size for processing
+        confidence_threshold: Minimum confidence for prediction
+        precision: ONNX graph variant to use
+        top_k: Also list the k most likely classes of each image
     
     Returns:
-        list: List of prediction results
+        list: List of prediction results, in the same order as `images`
     """
     results = []
     
     for i in range(0, len(images), batch_size):
         batch_images = images[i:i + batch_size]
+        batch_results = [None] * len(batch_images)
         
-        for img in batch_images:
+        buffer = batch_buffer(len(batch_images))
+        slots = []
+        for slot, img in enumerate(batch_images):
             try:
-                result = predict_image(img, model_name, use_onnx)
-                results.append(result)
+                with observe_stage("decode", model_name):
+                    image = load_image(img)
+                # Decoded images are packed at the front of the buffer.
+                with observe_stage("preprocess", model_name):
+                    preprocess_into(image, buffer[len(slots)])
+                slots.append(slot)
             except Exception as e:
                 print(f"Error processing image: {e}")
-                results.append({
-                    'error': str(e),
-                    'predicted_class': 'Error',
-                    'confidence': 0.0,
-                    'is_confident': False
-                })
+                batch_results[slot] = batch_error(e)
+        
+        if slots:
+            BATCH_SIZE.labels(model_name).observe(len(slots))
+            try:
+                probabilities, inference_type = run_inference(
+                    buffer[:len(slots)], model_name, use_onnx, precision
+                )
+                with observe_stage("postprocess", model_name):
+                    predictions = format_predictions(
+                        probabilities, model_name, inference_type, confidence_threshold, precision, top_k
+                    )
+                    for slot, prediction in zip(slots, predictions):
+                        batch_results[slot] = prediction
+            except Exception as e:
+                print(f"Error running batch inference: {e}")
+                for slot in slots:
+                    batch_results[slot] = batch_error(e)
+        
+        results.extend(batch_results)
     
     return results
 
+def batch_error(e):
+    """Error entry for an image that could not be predicted in a batch"""
+    return {
+        'error': str(e),
+        'predicted_class': 'Error',
+        'confidence': 0.0,
+        'is_confident': False
+    }
+
 def get_model_info(model_name='resnet9'):
     """Get information about available models"""
     info = {
@@ -252,14 +426,15 @@ def get_model_info(model_name='resnet9'):
     config = MODEL_CONFIGS.get(model_name, {})
     
     pytorch_path = config.get('pytorch_path', '')
-    if os.path.exists(pytorch_path):
+    if pytorch_path and checkpoint_file(pytorch_path):
         info['pytorch_available'] = True
-        info['pytorch_path'] = pytorch_path
+        info['pytorch_path'] = checkpoint_file(pytorch_path)
     
     onnx_path = config.get('onnx_path', '')
     if os.path.exists(onnx_path):
         info['onnx_available'] = True
         info['onnx_path'] = onnx_path
+    info['onnx_precisions'] = available_precisions(model_name)
     
     return info
 
@@ -274,29 +449,18 @@ def convert_pytorch_to_onnx(model_name='resnet9', input_size=(256, 256)):
     Returns:
         bool: Success status
     """
+    from app.utils.model import export_onnx
+
     try:
-        model = load_pytorch_model(model_name)
-        
-        dummy_input = torch.randn(1, 3, input_size[0], input_size[1]).to(device)
+        # The unfused model: export_onnx folds a copy and checks it against this one.
+        model = _load_pytorch_model(model_name)
         
         config = MODEL_CONFIGS.get(model_name, {})
         onnx_path = config.get('onnx_path', f'././..//models/plant-disease/resnet9_best.pthplant-disease/{model_name}-plant-disease-model.onnx')
         
         os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
         
-        torch.onnx.export(
-            model,
-            dummy_input,
-            onnx_path,
-            input_names=["input"],
-            output_names=["output"],
-            dynamic_axes={
-                "input": {0: "batch_size"},
-                "output": {0: "batch_size"}
-            },
-            opset_version=11,
-            do_constant_folding=True
-        )
+        export_onnx(model, onnx_path, input_size)
         
         print(f"{model_name} model exported to ONNX: {onnx_path}")
         return True
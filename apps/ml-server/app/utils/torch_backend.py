@@ -0,0 +1,122 @@
+import hashlib
+import os
+import platform
+from pathlib import Path
+from typing import Optional
+
+from app.utils.executor import MODEL_MAX_CONCURRENCY
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# How the PyTorch fallback runs models: "eager", "script" (traced, frozen and
+# cached to disk as TorchScript) or "compile" (torch.compile, with compiled
+# kernels cached to disk by Inductor).
+TORCH_BACKEND = os.getenv("TORCH_BACKEND", "eager").lower()
+TORCH_CACHE_DIR = os.getenv(
+    "TORCH_CACHE_DIR", str(BASE_DIR / '..' / 'models' / 'plant-disease' / 'optimized')
+)
+SERVER_WORKERS = int(os.getenv("WEB_CONCURRENCY", 1))
+# torch's intra-op pool is process-wide: 0 splits the cores between the
+# server workers and the batches each may run at once.
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", 0))
+BACKENDS = ("eager", "script", "compile")
+
+threads_configured = False
+
+
+def configure_threads():
+    """Size torch's thread pools once per process, before the first model runs"""
+    global threads_configured
+    if threads_configured:
+        return
+    import torch
+
+    cpus = os.cpu_count() or 1
+    threads = TORCH_NUM_THREADS or max(1, cpus // (SERVER_WORKERS * MODEL_MAX_CONCURRENCY))
+    torch.set_num_threads(threads)
+    try:
+        # Models are single chains of ops; concurrency comes from batches.
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Only settable before torch's first parallel work
+    threads_configured = True
+    print(f"PyTorch fallback: {threads} intra-op threads, {TORCH_BACKEND} backend")
+
+
+def scripted_model_path(model_name: str, checkpoint_path, device) -> Optional[Path]:
+    """
+    Cache location of a model's frozen TorchScript (None without weights)
+
+    Like the ONNX optimized-graph cache, the name changes with the
+    checkpoint, the torch version, the device type and the CPU architecture.
+    """
+    import torch
+
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return None
+    stat = os.stat(checkpoint_path)
+    fingerprint = "|".join([
+        str(Path(checkpoint_path).resolve()), f"{stat.st_size}:{stat.st_mtime_ns}",
+        torch.__version__, device.type, platform.machine(), "channels_last",
+    ])
+    digest = hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+    return Path(TORCH_CACHE_DIR) / f"{model_name}.{digest}.torchscript.pt"
+
+
+def script_model(model, model_name: str, checkpoint_path, example):
+    """Trace and freeze a model, reusing the cached TorchScript when present"""
+    import torch
+
+    path = scripted_model_path(model_name, checkpoint_path, example.device)
+    scripted = None
+    if path and path.exists():
+        try:
+            scripted = torch.jit.load(str(path), map_location=example.device)
+            print(f"Using frozen {model_name} TorchScript from {path}")
+        except Exception as e:
+            print(f"Warning: Could not load cached TorchScript {path}, rebuilding: {e}")
+
+    if scripted is None:
+        with torch.inference_mode():
+            scripted = torch.jit.freeze(torch.jit.trace(model, example).eval())
+        if path:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                torch.jit.save(scripted, str(path))
+            except OSError as e:
+                print(f"Warning: Could not cache TorchScript for {model_name}: {e}")
+
+    # The oneDNN rewrites do not survive saving, so they run after loading.
+    return torch.jit.optimize_for_inference(scripted)
+
+
+def optimize_model(model, model_name: str, checkpoint_path, input_size=(256, 256)):
+    """
+    Apply TORCH_BACKEND to a model prepared for inference
+
+    The model is run once on a channels_last example, which builds the
+    TorchScript or compiles the kernels up front. Falls back to the eager
+    model if that fails, e.g. without a C++ compiler for torch.compile.
+    """
+    import torch
+
+    if TORCH_BACKEND == "eager":
+        return model
+    if TORCH_BACKEND not in BACKENDS:
+        print(f"Warning: Unknown TORCH_BACKEND {TORCH_BACKEND}, choose from {list(BACKENDS)}; using eager")
+        return model
+
+    device = next(model.parameters()).device
+    example = torch.randn(1, 3, *input_size, device=device).contiguous(memory_format=torch.channels_last)
+    try:
+        if TORCH_BACKEND == "script":
+            optimized = script_model(model, model_name, checkpoint_path, example)
+        else:
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(Path(TORCH_CACHE_DIR) / "inductor"))
+            optimized = torch.compile(model)
+        with torch.inference_mode():
+            optimized(example)
+        return optimized
+    except Exception as e:
+        print(f"Warning: {TORCH_BACKEND} backend failed for {model_name}, running it eagerly: {e}")
+        return model
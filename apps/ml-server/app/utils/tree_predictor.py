@@ -0,0 +1,103 @@
+"""
+Pure-NumPy evaluator for XGBoost tree ensembles
+
+The trees of a model saved with `Booster.save_model(... .json)` are
+flattened into a few contiguous arrays, so prediction is a fixed number of
+vectorized gather/compare steps (one per tree level) over every row and
+every tree at once. It needs neither xgboost nor a pickle at serving time.
+"""
+
+import json
+
+import numpy as np
+
+
+class CompiledTreeEnsemble:
+    """
+    Flattened multi-class (multi:softprob) gradient-boosted tree ensemble
+
+    Attributes:
+        roots: Index of each tree's root node in the flattened arrays
+        tree_class: Class each tree contributes its leaf value to
+        left, right: Child node indices; leaves point to themselves
+        feature: Feature index tested at each node
+        threshold: Split threshold; for leaves, the leaf value
+        default_left: Whether missing values go to the left child
+    """
+
+    def __init__(self, model_path):
+        with open(model_path) as f:
+            learner = json.load(f)["learner"]
+
+        objective = learner["objective"]["name"]
+        if objective not in ("multi:softprob", "multi:softmax"):
+            raise ValueError(f"Unsupported objective for compiled predictor: {objective}")
+
+        params = learner["learner_model_param"]
+        self.num_class = int(params["num_class"])
+        self.num_feature = int(params["num_feature"])
+        self.base_score = float(params["base_score"])
+
+        booster = learner["gradient_booster"]["model"]
+        trees = booster["trees"]
+        self.tree_class = np.asarray(booster["tree_info"], dtype=np.int64)
+
+        left, right, feature, threshold, default_left, roots = [], [], [], [], [], []
+        self.depth = 0
+        offset = 0
+        for tree in trees:
+            if any(tree["split_type"]):
+                raise ValueError("Categorical splits are not supported by the compiled predictor")
+
+            tree_left = np.asarray(tree["left_children"], dtype=np.int64)
+            tree_right = np.asarray(tree["right_children"], dtype=np.int64)
+            nodes = np.arange(len(tree_left))
+            is_leaf = tree_left == -1
+
+            roots.append(offset)
+            left.append(np.where(is_leaf, nodes, tree_left) + offset)
+            right.append(np.where(is_leaf, nodes, tree_right) + offset)
+            feature.append(np.where(is_leaf, 0, tree["split_indices"]))
+            threshold.append(tree["split_conditions"])
+            default_left.append(tree["default_left"])
+            self.depth = max(self.depth, tree_depth(tree_left, tree_right))
+            offset += len(tree_left)
+
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.left = np.concatenate(left)
+        self.right = np.concatenate(right)
+        self.feature = np.concatenate(feature).astype(np.int64)
+        self.threshold = np.concatenate(threshold).astype(np.float32)
+        self.default_left = np.concatenate(default_left).astype(bool)
+
+        # (num_trees, num_class) one-hot map so per-class sums are one matmul.
+        self.class_map = np.zeros((len(trees), self.num_class), dtype=np.float32)
+        self.class_map[np.arange(len(trees)), self.tree_class] = 1.0
+
+    def predict_margin(self, features: np.ndarray) -> np.ndarray:
+        features = np.asarray(features, dtype=np.float32)
+        rows = np.arange(len(features))[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (len(features), len(self.roots))).copy()
+
+        for _ in range(self.depth):
+            values = features[rows, self.feature[nodes]]
+            go_left = np.where(np.isnan(values), self.default_left[nodes], values < self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return self.threshold[nodes] @ self.class_map + self.base_score
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        margins = self.predict_margin(features)
+        probabilities = np.exp(margins - margins.max(axis=1, keepdims=True))
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+
+def tree_depth(left, right):
+    """Number of split levels on the longest root-to-leaf path"""
+    depth = 0
+    level = [0]
+    while True:
+        level = [child for node in level if left[node] != -1 for child in (left[node], right[node])]
+        if not level:
+            return depth
+        depth += 1
@@ -0,0 +1,177 @@
+import asyncio
+import inspect
+import os
+import time
+from typing import NamedTuple, Optional, Tuple
+
+from app.utils.metrics import observe_stage
+from app.utils.weather_fetch import (
+    WEATHER_RETRIES, WEATHER_TIMEOUT, Weather, WeatherProvider, get_weather_provider,
+)
+
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", 15 * 60))
+WEATHER_CACHE_STALE_TTL = float(os.getenv("WEATHER_CACHE_STALE_TTL", 15 * 60))
+WEATHER_GEOHASH_PRECISION = int(os.getenv("WEATHER_GEOHASH_PRECISION", 5))
+# A request waits this long for an uncached cell, then gets the fallback while
+# the fetch carries on in the background; never longer than every attempt takes.
+WEATHER_FETCH_WAIT = min(float(os.getenv("WEATHER_FETCH_WAIT", 1.5)), WEATHER_TIMEOUT * (WEATHER_RETRIES + 1))
+WEATHER_CACHE_MAX_CELLS = int(os.getenv("WEATHER_CACHE_MAX_CELLS", 10000))
+WEATHER_FALLBACK = os.getenv("WEATHER_FALLBACK", "climatology")
+
+# Mean temperature (°C) and humidity (%) of the crop recommendation training
+# data, used when a cell has never been fetched and the weather API is down.
+CLIMATOLOGY_WEATHER = (25.6, 71)
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+class WeatherReading(NamedTuple):
+    weather: Weather
+    source: str  # "live", "stale" (older than the TTL) or "climatology"
+
+
+def geohash(lat: float, lon: float, precision: int = WEATHER_GEOHASH_PRECISION) -> Tuple[str, float, float]:
+    """
+    Encode a coordinate as a geohash cell
+
+    Returns:
+        tuple: (geohash, cell center latitude, cell center longitude)
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars), (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+class WeatherCache:
+    """
+    Weather lookups shared by every field in the same geohash cell
+
+    A cell's weather is fetched once for the cell center and reused for
+    `ttl` seconds. For a further `stale_ttl` seconds the old value is still
+    served while one background refresh runs. Concurrent misses for the same
+    cell await a single upstream call instead of each making their own.
+
+    When the provider fails or is too slow, the last value known for the
+    cell (however old) is used, then the climatological default unless
+    WEATHER_FALLBACK is set to "none". Readings say which of these they are.
+    """
+
+    def __init__(self, provider: Optional[WeatherProvider] = None, ttl=WEATHER_CACHE_TTL,
+                 stale_ttl=WEATHER_CACHE_STALE_TTL, precision=WEATHER_GEOHASH_PRECISION):
+        self.provider = provider
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.precision = precision
+        self.entries = {}
+        self.in_flight = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    async def get(self, lat: float, lon: float) -> Optional[WeatherReading]:
+        cell, cell_lat, cell_lon = geohash(lat, lon, self.precision)
+
+        entry = self.entries.get(cell)
+        if entry is not None:
+            weather, fetched_at = entry
+            age = time.time() - fetched_at
+            if age <= self.ttl:
+                self.hits += 1
+                return WeatherReading(weather, "live")
+            if age <= self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self.start_refresh(cell, cell_lat, cell_lon)
+                return WeatherReading(weather, "stale")
+
+        self.misses += 1
+        refresh = self.start_refresh(cell, cell_lat, cell_lon)
+        try:
+            return await asyncio.wait_for(asyncio.shield(refresh), WEATHER_FETCH_WAIT)
+        except asyncio.TimeoutError:
+            print(f"Weather fetch for cell {cell} timed out after {WEATHER_FETCH_WAIT}s")
+            return self.fallback(cell)
+
+    def start_refresh(self, cell, lat, lon) -> asyncio.Task:
+        refresh = self.in_flight.get(cell)
+        if refresh is None:
+            refresh = asyncio.create_task(self.refresh(cell, lat, lon))
+            self.in_flight[cell] = refresh
+            refresh.add_done_callback(lambda _: self.in_flight.pop(cell, None))
+        return refresh
+
+    async def refresh(self, cell, lat, lon) -> Optional[WeatherReading]:
+        """Fetch a cell's weather for everyone waiting on it"""
+        provider = self.provider or get_weather_provider()
+        try:
+            with observe_stage("weather_fetch"):
+                if inspect.iscoroutinefunction(provider):
+                    weather = await provider(lat, lon)
+                else:
+                    weather = await asyncio.to_thread(provider, lat, lon)
+        except Exception as e:
+            print(f"Weather refresh failed for cell {cell}: {e}")
+            weather = None
+
+        if weather is None:
+            return self.fallback(cell)
+
+        self.entries[cell] = (weather, time.time())
+        if len(self.entries) > WEATHER_CACHE_MAX_CELLS:
+            self.evict_oldest()
+        return WeatherReading(weather, "live")
+
+    def fallback(self, cell) -> Optional[WeatherReading]:
+        entry = self.entries.get(cell)
+        if entry is not None:
+            self.fallbacks += 1
+            return WeatherReading(entry[0], "stale")
+        if WEATHER_FALLBACK == "climatology":
+            self.fallbacks += 1
+            return WeatherReading(CLIMATOLOGY_WEATHER, "climatology")
+        return None
+
+    def evict_oldest(self):
+        """Drop the least recently fetched tenth of the cells"""
+        by_age = sorted(self.entries, key=lambda cell: self.entries[cell][1])
+        for cell in by_age[:max(1, len(by_age) // 10)]:
+            del self.entries[cell]
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "fallbacks": self.fallbacks,
+        }
+
+
+weather_cache = WeatherCache()
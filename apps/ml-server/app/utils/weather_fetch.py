@@ -1,36 +1,152 @@
+import asyncio
 import os
-import requests
-from typing import Optional, Tuple
+import random
+import time
+import httpx
+from typing import Awaitable, Callable, Optional, Tuple, Union
 from dotenv import load_dotenv
 
+from app.utils.http_client import get_http_client
+
 load_dotenv()
 
-def weather_fetch(lat: float, lon: float) -> Optional[Tuple[float, int]]:
-    """
-    Fetch temperature (°C) and humidity (%) using OpenWeatherMap API with lat/lon.
-    """
-    api_key = os.getenv("OPENWEATHER_API_KEY")
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
-
-    try:
-        return api(base_url, lat, lon, api_key)
-    except requests.exceptions.RequestException as e:
-        print(f"Weather API error: {e}")
-        return None
-
-
-def api(base_url, lat, lon, api_key):
-    response = requests.get(
-        base_url,
-        params={"lat": lat, "lon": lon, "appid": api_key, "units": "metric"},
-        timeout=5
-    )
-    data = response.json()
-    print('Weather Data: ', data)
-    if response.status_code != 200:
-        return None
-    
-    main_data = data.get("main", {})
-    temperature = main_data.get("temp", 0)
-    humidity = main_data.get("humidity", 0)
-    return temperature, humidity
+OPENWEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+WEATHER_PROVIDER = os.getenv("WEATHER_PROVIDER", "openweather")
+STUB_TEMPERATURE = float(os.getenv("STUB_WEATHER_TEMPERATURE", 25.0))
+STUB_HUMIDITY = int(os.getenv("STUB_WEATHER_HUMIDITY", 70))
+
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", 3))
+WEATHER_RETRIES = int(os.getenv("WEATHER_RETRIES", 2))
+WEATHER_BACKOFF = float(os.getenv("WEATHER_BACKOFF", 0.2))
+WEATHER_BREAKER_THRESHOLD = int(os.getenv("WEATHER_BREAKER_THRESHOLD", 5))
+WEATHER_BREAKER_RESET = float(os.getenv("WEATHER_BREAKER_RESET", 30))
+
+Weather = Tuple[float, int]
+WeatherProvider = Callable[[float, float], Union[Optional[Weather], Awaitable[Optional[Weather]]]]
+
+weather_provider: Optional[WeatherProvider] = None
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of calling the weather API while it is known to be down"""
+
+
+class CircuitBreaker:
+    """
+    Fail fast after `failure_threshold` consecutive failed calls
+
+    Once open, calls are refused for `reset_timeout` seconds. After that a
+    single trial call is let through: success closes the breaker, failure
+    opens it for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold=WEATHER_BREAKER_THRESHOLD, reset_timeout=WEATHER_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half-open":
+            # Re-arm so concurrent callers keep failing fast during the trial.
+            self.opened_at = time.monotonic()
+        return state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+weather_breaker = CircuitBreaker()
+
+class RetryableWeatherError(Exception):
+    pass
+
+
+class WeatherAuthError(PermissionError):
+    """Raised when the weather API rejects OPENWEATHER_API_KEY"""
+
+
+async def async_weather_fetch(lat: float, lon: float) -> Optional[Weather]:
+    """
+    Fetch temperature (°C) and humidity (%) from OpenWeatherMap on the shared pooled client.
+
+    Timeouts, connection errors, 429 and 5xx answers are retried with jittered
+    exponential backoff. Repeated failures open `weather_breaker`, after which
+    calls fail fast with CircuitOpenError until the API has had time to recover.
+
+    Raises:
+        WeatherAuthError: If the API rejects the key (HTTP 401/403)
+    """
+    if not weather_breaker.allow():
+        raise CircuitOpenError("Weather API circuit is open")
+
+    params = {"lat": lat, "lon": lon, "appid": os.getenv("OPENWEATHER_API_KEY"), "units": "metric"}
+    error = None
+
+    for attempt in range(WEATHER_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(random.uniform(0, WEATHER_BACKOFF * 2 ** attempt))
+        try:
+            response = await get_http_client().get(OPENWEATHER_URL, params=params, timeout=WEATHER_TIMEOUT)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise RetryableWeatherError(f"HTTP {response.status_code}")
+        except (httpx.TransportError, RetryableWeatherError) as e:
+            error = e
+            continue
+
+        # The API answered; a 4xx (bad key, bad coordinates) is not an outage.
+        weather_breaker.record_success()
+        if response.status_code in (401, 403):
+            raise WeatherAuthError(
+                f"Weather API rejected OPENWEATHER_API_KEY (HTTP {response.status_code}), "
+                "every recommendation is using fallback weather"
+            )
+        if response.status_code != 200:
+            print(f"Weather API error: HTTP {response.status_code} {response.text}")
+            return None
+
+        main_data = response.json().get("main", {})
+        return main_data.get("temp", 0), main_data.get("humidity", 0)
+
+    weather_breaker.record_failure()
+    raise ConnectionError(f"Weather API unavailable after {WEATHER_RETRIES + 1} attempts: {error}")
+
+
+def stub_weather_fetch(lat: float, lon: float) -> Optional[Weather]:
+    """
+    Fixed weather for tests and benchmarks, no network access.
+    """
+    return STUB_TEMPERATURE, STUB_HUMIDITY
+
+
+def set_weather_provider(provider: Optional[WeatherProvider]):
+    """
+    Override the weather provider, e.g. with a stub in tests. None restores the configured one.
+    Providers may be plain functions or coroutine functions taking (lat, lon).
+    """
+    global weather_provider
+    weather_provider = provider
+
+
+def get_weather_provider() -> WeatherProvider:
+    if weather_provider is not None:
+        return weather_provider
+    if WEATHER_PROVIDER == "stub":
+        return stub_weather_fetch
+    return async_weather_fetch
@@ -1,8 +1,12 @@
+import asyncio
 import os
-import joblib
-import xgboost.compat as xgb_compat
+import threading
 import numpy as np
-from app.utils.weather_fetch import weather_fetch
+from app.utils.executor import run_in_executor
+from app.utils.metrics import observe_stage
+from app.utils.postprocessing import top_classes
+from app.utils.tree_predictor import CompiledTreeEnsemble
+from app.utils.weather_cache import weather_cache
 
 crop_mapping = {
     0: "apple",
@@ -28,54 +32,195 @@ crop_mapping = {
     20: "rice",
     21: "watermelon"
 }
-class XGBoostLabelEncoder:
-    def __init__(self, *args, **kwargs):
-        pass
-
-xgb_compat.XGBoostLabelEncoder = XGBoostLabelEncoder
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-CROP_MODEL_PATH = os.path.join(BASE_DIR, "..", "models", "crop-recommendation", "XGBoost.pkl")
-print(CROP_MODEL_PATH)
+CROP_MODEL_PATH = os.getenv("CROP_MODEL_PATH") or os.path.join(
+    BASE_DIR, "..", "models", "crop-recommendation", "XGBoost.json"
+)
+CROP_MODEL_BACKEND = os.getenv("CROP_MODEL_BACKEND", "booster")
+CROP_MODEL_THREADS = int(os.getenv("CROP_MODEL_THREADS", 0))
+
+
+def load_crop_model(model_path=CROP_MODEL_PATH, backend=CROP_MODEL_BACKEND):
+    """
+    Load the crop recommendation model from a native XGBoost JSON/UBJSON file
+
+    Args:
+        model_path: Path to the model saved with `Booster.save_model`
+        backend: 'booster' for an XGBoost Booster, or 'compiled' for the
+            pure-NumPy flattened-tree evaluator (JSON only, no xgboost needed)
+    """
+    if backend == "compiled":
+        return CompiledTreeEnsemble(model_path)
+
+    import xgboost as xgb
+
+    booster = xgb.Booster()
+    booster.load_model(model_path)
+    if CROP_MODEL_THREADS:
+        booster.set_param({"nthread": CROP_MODEL_THREADS})
+    return booster
+
+
 crop_recommendation_model = None
-if os.path.exists(CROP_MODEL_PATH):
-    try:
-        crop_recommendation_model = joblib.load(CROP_MODEL_PATH)
-        print("✅ XGBoost Crop Recommendation model loaded successfully.")
-    except Exception as e:
-        print(f"❌ Error loading XGBoost model: {e}")
-else:
-    print(f"⚠️ Warning: XGBoost model file not found at {CROP_MODEL_PATH}")
+crop_model_lock = threading.Lock()
 
 
-def predict_crop(nitrogen: int, phosphorous: int, pottasium: int, ph: float, rainfall: float, lat: float, lon: float):
-    if crop_recommendation_model is None:
+def get_crop_model():
+    """Return the crop recommendation model, loading it on first use (None if unavailable)"""
+    global crop_recommendation_model
+    if crop_recommendation_model is not None:
+        return crop_recommendation_model
+
+    with crop_model_lock:
+        if crop_recommendation_model is None:
+            if not os.path.exists(CROP_MODEL_PATH):
+                print(f"⚠️ Warning: XGBoost model file not found at {CROP_MODEL_PATH}")
+                return None
+            try:
+                crop_recommendation_model = load_crop_model()
+                print(f"✅ XGBoost Crop Recommendation model loaded successfully ({CROP_MODEL_BACKEND}).")
+            except Exception as e:
+                print(f"❌ Error loading XGBoost model: {e}")
+    return crop_recommendation_model
+
+# Reused feature row for single predictions. predict_crop fills and scores it
+# on the event loop without awaiting in between, so requests never share it.
+single_row = np.empty((1, 7), dtype=np.float32)
+
+
+def predict_proba(features: np.ndarray) -> np.ndarray:
+    """Class probabilities, shape (N, 22), for a float32 (N, 7) feature matrix"""
+    model = get_crop_model()
+    with observe_stage("xgboost_predict", "xgboost"):
+        if isinstance(model, CompiledTreeEnsemble):
+            return model.predict_proba(features)
+        return model.inplace_predict(features)
+
+
+async def predict_crop(nitrogen: int, phosphorous: int, pottasium: int, ph: float, rainfall: float, lat: float, lon: float):
+    if get_crop_model() is None:
         raise RuntimeError("Crop recommendation model is not available.")
 
      # Get weather data
     try:
-        weather = weather_fetch(lat, lon)
-        if weather is None:
+        reading = await weather_cache.get(lat, lon)
+        if reading is None:
             raise ConnectionError("Weather data unavailable for the given coordinates.")
-        temperature, humidity = weather
+        temperature, humidity = reading.weather
     except Exception as e:
         raise ConnectionError(f"Weather service error: {e}") from e
 
     # Make prediction
     try:
-        data = np.array([[nitrogen, phosphorous, pottasium, temperature, humidity, ph, rainfall]])
-        prediction = crop_recommendation_model.predict(data)[0]
+        single_row[0] = (nitrogen, phosphorous, pottasium, temperature, humidity, ph, rainfall)
+        prediction = int(np.argmax(predict_proba(single_row)[0]))
     except Exception as e:
         raise ValueError(f"Failed to make a crop prediction: {e}") from e
 
+    return crop_result(
+        int(prediction), nitrogen, phosphorous, pottasium, temperature, humidity, ph, rainfall, lat, lon,
+        reading.source,
+    )
+
+
+def crop_result(prediction: int, nitrogen, phosphorous, pottasium, temperature, humidity, ph, rainfall, lat, lon,
+                weather_source):
     return {
-        "prediction": str(crop_mapping[int(prediction)]),
+        "prediction": str(crop_mapping[prediction]),
         "inputs": {
             "nitrogen": nitrogen, "phosphorous": phosphorous, "pottasium": pottasium,
             "temperature": temperature, "humidity": humidity, "ph": ph, "rainfall": rainfall,
         },
+        "weather_source": weather_source,
         "location": {"lat": lat, "lon": lon}
     }
 
+
+def score_features(features: np.ndarray, top_k: int = 0):
+    """
+    Score a (N, 7) float32 feature matrix with one vectorized model call
+
+    Returns:
+        tuple: (predicted class per row, (indices, probabilities) of the top_k
+        classes per row or None when top_k is 0)
+    """
+    probabilities = predict_proba(features)
+    if not top_k:
+        return np.argmax(probabilities, axis=1), None
+
+    top, top_probabilities = top_classes(probabilities, top_k)
+    return top[:, 0], (top, top_probabilities)
+
+
+async def predict_crops(samples, top_k: int = 0):
+    """
+    Recommend crops for many soil readings at once
+
+    Weather is looked up once per unique location, then every row with
+    weather is scored in a single vectorized model call.
+
+    Args:
+        samples: Sequence of objects with nitrogen, phosphorous, pottasium,
+            ph, rainfall, lat and lon attributes
+        top_k: Also return the k most likely crops with probabilities
+
+    Returns:
+        list: One result per sample, in order. Rows whose weather could not
+        be resolved get an error entry instead.
+    """
+    if get_crop_model() is None:
+        raise RuntimeError("Crop recommendation model is not available.")
+
+    locations = list({(sample.lat, sample.lon) for sample in samples})
+    readings = await asyncio.gather(
+        *(weather_cache.get(lat, lon) for lat, lon in locations), return_exceptions=True
+    )
+    weather_by_location = {
+        location: reading for location, reading in zip(locations, readings)
+        if reading is not None and not isinstance(reading, BaseException)
+    }
+
+    rows = [i for i, sample in enumerate(samples) if (sample.lat, sample.lon) in weather_by_location]
+    features = np.empty((len(rows), 7), dtype=np.float32)
+    for row, i in enumerate(rows):
+        sample = samples[i]
+        temperature, humidity = weather_by_location[(sample.lat, sample.lon)].weather
+        features[row] = (
+            sample.nitrogen, sample.phosphorous, sample.pottasium,
+            temperature, humidity, sample.ph, sample.rainfall,
+        )
+
+    results = [
+        {"error": "Weather data unavailable for the given coordinates.",
+         "location": {"lat": sample.lat, "lon": sample.lon}}
+        for sample in samples
+    ]
+    if not rows:
+        return results
+
+    try:
+        predictions, top = await run_in_executor(score_features, features, top_k)
+    except Exception as e:
+        raise ValueError(f"Failed to make a crop prediction: {e}") from e
+
+    predictions = predictions.tolist()
+    for row, i in enumerate(rows):
+        sample = samples[i]
+        reading = weather_by_location[(sample.lat, sample.lon)]
+        temperature, humidity = reading.weather
+        result = crop_result(
+            predictions[row], sample.nitrogen, sample.phosphorous, sample.pottasium,
+            temperature, humidity, sample.ph, sample.rainfall, sample.lat, sample.lon, reading.source,
+        )
+        if top is not None:
+            result["top_k"] = [
+                {"crop": crop_mapping[idx], "probability": probability}
+                for idx, probability in zip(top[0][row].tolist(), top[1][row].tolist())
+            ]
+        results[i] = result
+
+    return results
+
 # print(predict_crop(284, 45.4, 189, 134, 214, 6.7, 200, 24.24, 86.76))    
\ No newline at end of file
@@ -1,14 +1,56 @@
-import uvicorn
+import argparse
+import glob
 import os
+import shutil
+import tempfile
+
+from dotenv import load_dotenv
+
+from app.utils.prefork import available_cpus
 
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 5000))
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run the Crop AI ML server")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", available_cpus())),
+                        help="Worker processes (default: WEB_CONCURRENCY or the number of CPUs)")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.environ.get("GRACEFUL_TIMEOUT", 30)),
+                        help="Seconds in-flight requests get to finish on shutdown")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Let every worker load its own models instead of sharing them")
+    parser.add_argument("--reload", action="store_true", help="Development server with auto-reload on 127.0.0.1")
+    args = parser.parse_args()
+
+    if args.reload:
+        import uvicorn
+
+        print(f"Starting server with auto-reload on http://127.0.0.1:{args.port}")
+        uvicorn.run("app.main:app", host="127.0.0.1", port=args.port, reload=True)
+        raise SystemExit
+
+    workers = max(1, args.workers)
+    # Read at import time: ONNX thread defaults and the inference pool are sized
+    # so all workers together use each CPU once.
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    os.environ.setdefault("INFERENCE_WORKERS", str(max(1, available_cpus() // workers)))
+
+    from app.utils import prefork
+
+    if workers == 1 or not hasattr(os, "fork"):
+        prefork.serve_single(args.host, args.port, args.graceful_timeout)
+        raise SystemExit
 
-    print(f"Starting server with auto-reload on http://127.0.0.1:{port}")
+    # Every worker writes its metrics here and /metrics aggregates them.
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    temporary = not metrics_dir
+    if temporary:
+        metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="ml-server-metrics-")
+    for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+        os.remove(path)
 
-    uvicorn.run(
-        "app.main:app",
-        host="127.0.0.1",
-        port=port,
-        reload=True
-    )
+    try:
+        prefork.serve(args.host, args.port, workers, args.graceful_timeout, preload=not args.no_preload)
+    finally:
+        if temporary:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
@@ -0,0 +1,404 @@
+"""
+Load test and micro-benchmarks for the ML server
+
+The load test starts the server in a subprocess with the stub weather
+provider and the prediction cache disabled, serves generated JPEGs from a
+local stub image server, and drives /crop-recommend and /predict/<model> at
+each concurrency level, reporting throughput and p50/p95/p99 latency.
+
+The micro-benchmarks run in-process: the predict_image stages (decode,
+preprocess, session run, postprocess), predict_batch at several batch sizes
+and the XGBoost predict call for both crop model backends.
+
+Results are written as JSON. With --baseline, latencies and throughputs are
+compared against a previous run and the script exits non-zero when any of
+them regressed by more than --tolerance.
+
+Usage:
+    uv run python scripts/benchmark.py --suite all --output results.json
+    uv run python scripts/benchmark.py --suite load --endpoints crop,resnet50 --concurrency 1,8,32
+    # Record a baseline on the target machine, then compare later runs with it
+    uv run python scripts/benchmark.py --suite micro --output benchmark_baseline.json
+    uv run python scripts/benchmark.py --suite micro --baseline benchmark_baseline.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+CROP_ENDPOINT = "crop"
+DISEASE_MODELS = ("resnet9", "resnet18", "resnet50")
+LOWER_IS_BETTER = ("p50_ms", "p95_ms")
+HIGHER_IS_BETTER = ("throughput_rps", "items_per_second")
+
+
+def make_images(count, size, seed=0):
+    """Distinct leaf-coloured JPEGs, so content-hash caching cannot kick in"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    images = []
+    for _ in range(count):
+        base = np.stack([
+            60 + 40 * np.sin(x / rng.uniform(20, 80)),
+            120 + 60 * np.cos(y / rng.uniform(20, 80)),
+            40 + 30 * np.sin((x + y) / rng.uniform(20, 80)),
+        ], axis=-1)
+        noise = rng.normal(0, 12, base.shape)
+        pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, "JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def summarize(samples, count=None, elapsed=None):
+    """Latency percentiles in milliseconds, plus throughput when `elapsed` is given"""
+    ms = np.asarray(samples) * 1000
+    summary = {
+        "samples": len(samples),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+    if elapsed:
+        summary["throughput_rps"] = (count if count is not None else len(samples)) / elapsed
+    return summary
+
+
+def time_call(fn, repeat, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+# Load test
+
+def start_image_server(images):
+    class ImageHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                body = images[int(self.path.strip("/").split(".")[0]) % len(images)]
+            except ValueError:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(models, keep_cache, timeout=180):
+    """Run the server with stub weather and wait until its models are ready"""
+    import httpx
+
+    port = free_port()
+    env = dict(
+        os.environ,
+        WEATHER_PROVIDER="stub",
+        PRELOAD_MODELS=",".join(["xgboost", *models]),
+    )
+    if not keep_cache:
+        env["PREDICTION_CACHE_SIZE"] = "0"
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            response = httpx.get(f"{base_url}/health/ready", timeout=2)
+            states = response.json()["models"]
+            failed = {name: state.get("error") for name, state in states.items() if state["state"] == "failed"}
+            if failed:
+                process.terminate()
+                raise RuntimeError(f"Models failed to load: {failed}")
+            if response.status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+
+    process.terminate()
+    raise RuntimeError(f"Server was not ready after {timeout}s")
+
+
+def request_factory(endpoint, image_base, image_count):
+    if endpoint == CROP_ENDPOINT:
+        def make_request(i):
+            rng = random.Random(i)
+            return "/crop-recommend", {
+                "nitrogen": rng.randint(0, 140),
+                "phosphorous": rng.randint(5, 145),
+                "pottasium": rng.randint(5, 205),
+                "ph": round(rng.uniform(3.5, 9.9), 2),
+                "rainfall": round(rng.uniform(20, 300), 1),
+                # A handful of fields, so the weather cache behaves like production.
+                "lat": 24.2 + rng.randint(0, 9) * 0.1,
+                "lon": 86.7,
+            }
+    else:
+        def make_request(i):
+            return f"/predict/{endpoint}", {"url": f"{image_base}/{i % image_count}.jpg"}
+    return make_request
+
+
+async def run_load(base_url, make_request, concurrency, total, warmup):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        for i in range(warmup):
+            path, payload = make_request(-1 - i)
+            await client.post(path, json=payload)
+
+        latencies = []
+        statuses = {}
+        counter = iter(range(total))
+
+        async def worker():
+            for i in counter:
+                path, payload = make_request(i)
+                started = time.perf_counter()
+                try:
+                    status = (await client.post(path, json=payload)).status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, count=statuses.get("200", 0), elapsed=elapsed)
+    result["statuses"] = statuses
+    return result
+
+
+def load_suite(args):
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    models = [e for e in endpoints if e in DISEASE_MODELS]
+    images = make_images(args.images, args.image_size)
+    image_server, image_base = start_image_server(images)
+
+    process = None
+    base_url = args.url
+    if not base_url:
+        process, base_url = start_server(models, args.keep_cache)
+
+    results = {}
+    try:
+        for endpoint in endpoints:
+            make_request = request_factory(endpoint, image_base, len(images))
+            for concurrency in args.concurrency:
+                result = asyncio.run(run_load(base_url, make_request, concurrency, args.requests, args.warmup))
+                results[f"{endpoint}@c{concurrency}"] = result
+                print(f"load {endpoint:>8} c={concurrency:<3} {result['throughput_rps']:8.1f} req/s  "
+                      f"p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms  "
+                      f"p99 {result['p99_ms']:7.1f} ms  {result['statuses']}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        image_server.shutdown()
+    return results
+
+
+# Micro-benchmarks
+
+def micro_suite(args):
+    from app.utils.preprocessing import batch_buffer, load_image, preprocess_into
+    from app.utils.resnet_inference import TOP_K_MAX, format_predictions, predict_batch, predict_image, run_inference
+    from app.utils.xgboost_inference import CROP_MODEL_PATH, load_crop_model
+
+    results = {}
+
+    def record(name, result, items=None):
+        if items:
+            result["items_per_second"] = items / (result["p50_ms"] / 1000)
+        results[name] = result
+        print(f"micro {name:<32} p50 {result['p50_ms']:8.3f} ms  p95 {result['p95_ms']:8.3f} ms")
+
+    image = make_images(1, args.image_size)[0]
+    model = args.model
+    buffer = batch_buffer(1)
+    decoded = load_image(image)
+    preprocess_into(image, buffer[0])
+    probabilities, inference_type = run_inference(buffer, model, use_onnx=True)
+
+    def postprocess():
+        format_predictions(probabilities, model, inference_type, top_k=TOP_K_MAX)
+
+    record(f"{model}.decode", time_call(lambda: load_image(image), args.repeat))
+    record(f"{model}.preprocess", time_call(lambda: preprocess_into(decoded, buffer[0]), args.repeat))
+    record(f"{model}.session_run", time_call(lambda: run_inference(buffer, model, use_onnx=True), args.repeat))
+    record(f"{model}.postprocess", time_call(postprocess, args.repeat))
+    record(f"{model}.predict_image", time_call(lambda: predict_image(image, model, use_onnx=True), args.repeat), 1)
+
+    images = make_images(max(args.batch_sizes), args.image_size, seed=1)
+    for batch_size in args.batch_sizes:
+        batch = images[:batch_size]
+        result = time_call(
+            lambda: predict_batch(batch, model, use_onnx=True, batch_size=batch_size),
+            max(3, args.repeat // batch_size),
+        )
+        record(f"{model}.predict_batch@{batch_size}", result, batch_size)
+
+    rng = np.random.default_rng(0)
+    for backend in ("booster", "compiled"):
+        crop_model = load_crop_model(CROP_MODEL_PATH, backend)
+        predict = crop_model.predict_proba if backend == "compiled" else crop_model.inplace_predict
+        for rows in (1, 1000):
+            features = rng.uniform(0, 200, (rows, 7)).astype(np.float32)
+            record(f"xgboost.{backend}@{rows}", time_call(lambda: predict(features), args.repeat), rows)
+
+    return results
+
+
+# Baseline comparison
+
+def compare(results, baseline, tolerance):
+    """
+    Returns:
+        list: Regression descriptions; empty when nothing got worse than `tolerance`
+    """
+    regressions = []
+    for section in ("load", "micro"):
+        for name, current in results.get(section, {}).items():
+            previous = baseline.get(section, {}).get(name)
+            if not previous:
+                continue
+            for key in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+                if key not in current or not previous.get(key):
+                    continue
+                change = current[key] / previous[key] - 1
+                worse = change > tolerance if key in LOWER_IS_BETTER else change < -tolerance
+                marker = "REGRESSION" if worse else ""
+                print(f"{section} {name:<32} {key:<18} {previous[key]:10.2f} -> {current[key]:10.2f} "
+                      f"({change:+.1%}) {marker}")
+                if worse:
+                    regressions.append(f"{section}/{name} {key} {change:+.1%}")
+    return regressions
+
+
+def environment():
+    import onnxruntime
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "onnxruntime": onnxruntime.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def parse_ints(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def parse_size(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", choices=("load", "micro", "all"), default="all")
+    parser.add_argument("--endpoints", default="crop,resnet9,resnet18,resnet50",
+                        help="Load test targets: crop and/or disease models")
+    parser.add_argument("--concurrency", type=parse_ints, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--url", default="", help="Load test an already running server instead of starting one")
+    parser.add_argument("--keep-cache", action="store_true", help="Leave the prediction cache enabled")
+    parser.add_argument("--images", type=int, default=64, help="Distinct images served by the stub image server")
+    parser.add_argument("--image-size", type=parse_size, default=(1024, 768), help="WIDTHxHEIGHT of test images")
+    parser.add_argument("--model", default="resnet9", help="Model for the micro-benchmarks")
+    parser.add_argument("--batch-sizes", type=parse_ints, default=[1, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=50, help="Timed calls per micro-benchmark")
+    parser.add_argument("--output", default="", help="Write results JSON here (also usable as a baseline)")
+    parser.add_argument("--baseline", default="", help="Compare against this results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown, e.g. 0.15")
+    args = parser.parse_args()
+    # Checked up front, not after a run that may take minutes.
+    if args.baseline and not os.path.exists(args.baseline):
+        parser.error(f"Baseline {args.baseline} not found; record one on this machine with --output first")
+
+    results = {"environment": environment()}
+    if args.suite in ("micro", "all"):
+        results["micro"] = micro_suite(args)
+    if args.suite in ("load", "all"):
+        results["load"] = load_suite(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
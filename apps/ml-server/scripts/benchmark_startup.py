@@ -0,0 +1,70 @@
+"""
+Measure import time and resident memory of the ML server with and without PyTorch
+
+Each scenario runs in a fresh interpreter, imports the server (optionally
+after importing torch the way the server used to) and optionally loads one
+ONNX session, then reports wall time and peak RSS as JSON.
+
+Usage:
+    uv run python scripts/benchmark_startup.py [--model resnet9] [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+if {import_torch}:
+    import torch, torchvision
+import app.main
+imported = time.perf_counter() - started
+if {model!r}:
+    from app.utils.resnet_inference import load_onnx_model
+    load_onnx_model({model!r})
+print(json.dumps({{
+    "import_seconds": imported,
+    "total_seconds": time.perf_counter() - started,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "torch_imported": "torch" in sys.modules,
+}}))
+"""
+
+
+def run_probe(import_torch, model):
+    env = dict(os.environ, PRELOAD_MODELS="")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(import_torch=import_torch, model=model)],
+        cwd=SERVER_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", default="", help="Also load this model's ONNX session, e.g. resnet9")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {}
+    for name, import_torch in (("onnx_only", False), ("with_torch", True)):
+        runs = [run_probe(import_torch, args.model) for _ in range(args.repeat)]
+        results[name] = {
+            key: min(run[key] for run in runs) if key != "torch_imported" else runs[0][key]
+            for key in runs[0]
+        }
+
+    results["saved"] = {
+        "import_seconds": results["with_torch"]["import_seconds"] - results["onnx_only"]["import_seconds"],
+        "peak_rss_mb": results["with_torch"]["peak_rss_mb"] - results["onnx_only"]["peak_rss_mb"],
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Check that the native XGBoost.json model predicts exactly like XGBoost.pkl
+
+Scores the crop recommendation dataset (plus random rows with missing
+values) with the legacy pickle, the native Booster and the compiled NumPy
+evaluator, and exits non-zero if their probabilities or classes disagree.
+
+Usage:
+    uv run python scripts/check_crop_model_parity.py [--tolerance 1e-5]
+"""
+
+import argparse
+import csv
+import os
+import sys
+
+import numpy as np
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from app.utils.xgboost_inference import load_crop_model
+
+MODEL_DIR = os.path.join(SERVER_DIR, "app", "models", "crop-recommendation")
+PKL_MODEL_PATH = os.path.join(MODEL_DIR, "XGBoost.pkl")
+JSON_MODEL_PATH = os.path.join(MODEL_DIR, "XGBoost.json")
+DATASET_PATH = os.path.join(SERVER_DIR, "..", "..", "ml-model", "data-processed", "crop_recommendation.csv")
+FEATURES = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+
+
+def load_pickle_model(path):
+    import joblib
+    import xgboost.compat as xgb_compat
+
+    # The pickle references a class removed from newer xgboost releases.
+    class XGBoostLabelEncoder:
+        def __init__(self, *args, **kwargs):
+            pass
+
+    xgb_compat.XGBoostLabelEncoder = XGBoostLabelEncoder
+    return joblib.load(path)
+
+
+def load_features(seed=0, random_rows=2000):
+    with open(DATASET_PATH) as f:
+        rows = [[float(row[name]) for name in FEATURES] for row in csv.DictReader(f)]
+    features = np.asarray(rows, dtype=np.float32)
+
+    rng = np.random.default_rng(seed)
+    low, high = features.min(axis=0), features.max(axis=0)
+    random = rng.uniform(low, high, size=(random_rows, len(FEATURES))).astype(np.float32)
+    random[rng.random(random.shape) < 0.05] = np.nan
+    return np.concatenate([features, random])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    features = load_features()
+    expected = load_pickle_model(PKL_MODEL_PATH).predict_proba(features)
+
+    failed = False
+    for backend in ("booster", "compiled"):
+        model = load_crop_model(JSON_MODEL_PATH, backend=backend)
+        if backend == "booster":
+            probabilities = model.inplace_predict(features)
+        else:
+            probabilities = model.predict_proba(features)
+
+        max_diff = float(np.abs(probabilities - expected).max())
+        agreement = float((probabilities.argmax(axis=1) == expected.argmax(axis=1)).mean())
+        ok = max_diff <= args.tolerance and agreement == 1.0
+        failed |= not ok
+        print(f"{backend:>9}: max |Δp| = {max_diff:.2e}, class agreement = {agreement:.4%} "
+              f"{'OK' if ok else 'MISMATCH'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
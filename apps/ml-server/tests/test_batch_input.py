@@ -0,0 +1,84 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.batch_input import BatchInputError, detect_format, parse_rows
+from app.utils.weather_cache import weather_cache
+from app.utils.weather_fetch import set_weather_provider, stub_weather_fetch
+
+ROW = {"nitrogen": 90, "phosphorous": 42, "pottasium": 43, "ph": 6.5, "rainfall": 202.9, "lat": 24.24, "lon": 86.76}
+CSV = "nitrogen,phosphorous,pottasium,ph,rainfall,lat,lon\n90,42,43,6.5,202.9,24.24,86.76\n,,,,,,\n"
+
+
+@pytest.mark.parametrize("content_type, filename, fmt", [
+    ("application/json", "", "json"),
+    ("application/x-ndjson; charset=utf-8", "", "ndjson"),
+    ("text/csv", "", "csv"),
+    ("application/octet-stream", "plots.CSV", "csv"),
+    ("", "plots.jsonl", "ndjson"),
+    ("", "", "json"),
+])
+def test_detect_format(content_type, filename, fmt):
+    assert detect_format(content_type, filename) == fmt
+
+
+def test_parse_json_array_and_samples_object():
+    assert parse_rows(json.dumps([ROW, ROW]).encode(), "json") == [ROW, ROW]
+    assert parse_rows(json.dumps({"samples": [ROW]}).encode(), "json") == [ROW]
+
+
+def test_parse_ndjson_skips_blank_lines():
+    body = f"{json.dumps(ROW)}\n\n{json.dumps(ROW)}\n".encode()
+    assert parse_rows(body, "ndjson") == [ROW, ROW]
+
+
+def test_parse_csv_with_bom_skips_empty_rows():
+    rows = parse_rows(("\ufeff" + CSV).encode(), "csv")
+    assert rows == [{key: str(value) for key, value in ROW.items()}]
+
+
+@pytest.mark.parametrize("body, fmt, message", [
+    (b"[{\"nitrogen\": 90,", "json", "Invalid JSON"),
+    (b"{\"nitrogen\": 90}", "json", "Expected a JSON array"),
+    (b"{\"nitrogen\": 90}\nnot json\n", "ndjson", "line 2"),
+    (b"\xff\xfe\x00", "csv", "UTF-8"),
+])
+def test_parse_rejects_malformed_batches(body, fmt, message):
+    with pytest.raises(BatchInputError, match=message):
+        parse_rows(body, fmt)
+
+
+@pytest.fixture
+def client():
+    set_weather_provider(stub_weather_fetch)
+    weather_cache.clear()
+    yield TestClient(app)
+    set_weather_provider(None)
+    weather_cache.clear()
+
+
+def test_batch_route_accepts_multipart_csv(client):
+    response = client.post(
+        "/crop-recommend/batch", params={"top_k": 2}, files={"file": ("plots.csv", CSV, "text/csv")}
+    )
+    assert response.status_code == 200
+    result = response.json()["results"][0]
+    assert result["prediction"] == result["top_k"][0]["crop"]
+    assert len(result["top_k"]) == 2
+
+
+def test_batch_route_rejects_malformed_and_invalid_rows(client):
+    response = client.post(
+        "/crop-recommend/batch", content=b"{\"nitrogen\": 90}\nnot json\n",
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == 400
+
+    response = client.post("/crop-recommend/batch", json=[ROW, {**ROW, "nitrogen": "lots"}])
+    assert response.status_code == 422
+    assert response.json()["detail"]["row"] == 1
+
+    response = client.post("/crop-recommend/batch", files={"upload": ("plots.csv", CSV, "text/csv")})
+    assert response.status_code == 400
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils.batching import MicroBatcher
+
+
+def recording_predict(batch_sizes, started=None, release=None):
+    """Predict function echoing each image, recording the size of every batch"""
+
+    def predict(images):
+        batch_sizes.append(len(images))
+        if started is not None:
+            started.set()
+            release.wait(5)
+        return [{"image": image} for image in images]
+
+    return predict
+
+
+def test_concurrent_submits_share_one_batch():
+    batch_sizes = []
+
+    async def submit_all():
+        batcher = MicroBatcher(recording_predict(batch_sizes), max_batch_size=8, max_wait_ms=50)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    results = asyncio.run(submit_all())
+    assert results == [{"image": i} for i in range(5)]
+    assert batch_sizes == [5]
+
+
+def test_lone_request_flushes_after_max_wait():
+    batch_sizes = []
+
+    async def submit_one():
+        batcher = MicroBatcher(recording_predict(batch_sizes), max_batch_size=8, max_wait_ms=20)
+        started = time.perf_counter()
+        result = await batcher.submit("leaf")
+        return result, time.perf_counter() - started
+
+    result, elapsed = asyncio.run(submit_one())
+    assert result == {"image": "leaf"}
+    assert batch_sizes == [1]
+    assert 0.015 <= elapsed < 1
+
+
+def test_batches_never_exceed_max_batch_size():
+    batch_sizes = []
+
+    async def submit_all():
+        batcher = MicroBatcher(recording_predict(batch_sizes), max_batch_size=4, max_wait_ms=50)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+    assert asyncio.run(submit_all()) == [{"image": i} for i in range(10)]
+    assert sorted(batch_sizes) == [2, 4, 4]
+
+
+def test_error_entry_fails_only_its_request():
+    def predict(images):
+        return [{"error": "cannot decode"} if image == "bad" else {"image": image} for image in images]
+
+    async def submit_all():
+        batcher = MicroBatcher(predict, max_wait_ms=20)
+        return await asyncio.gather(batcher.submit("good"), batcher.submit("bad"), return_exceptions=True)
+
+    good, bad = asyncio.run(submit_all())
+    assert good == {"image": "good"}
+    assert isinstance(bad, ValueError)
+
+
+def test_close_cancels_running_and_queued_requests():
+    batch_sizes = []
+    started, release = threading.Event(), threading.Event()
+
+    async def close_while_busy():
+        batcher = MicroBatcher(
+            recording_predict(batch_sizes, started, release), max_batch_size=1, max_wait_ms=0, max_concurrency=1
+        )
+        requests = [asyncio.create_task(batcher.submit(i)) for i in range(3)]
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        await batcher.close()
+        release.set()
+        return await asyncio.gather(*requests, return_exceptions=True)
+
+    outcomes = asyncio.run(close_while_busy())
+    assert all(isinstance(outcome, asyncio.CancelledError) for outcome in outcomes)
+    # Only the first batch reached the model.
+    assert batch_sizes == [1]
+
+
+@pytest.mark.parametrize("max_batch_size, max_wait_ms", [(0, 5), (4, -1)])
+def test_limits_are_clamped(max_batch_size, max_wait_ms):
+    batcher = MicroBatcher(recording_predict([]), max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    assert batcher.max_batch_size >= 1
+    assert batcher.max_wait >= 0
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from app.utils.cascade import parse_models, parse_thresholds, run_cascade, stage_thresholds
+
+MODELS = ["resnet9", "resnet18", "resnet50"]
+
+
+@pytest.mark.parametrize("thresholds, expected", [
+    ([0.9], [0.9, 0.9]),
+    ([0.8, 0.95], [0.8, 0.95]),
+    ([0.8], [0.8, 0.8]),
+    ([0.7, 0.8, 0.9, 0.99], [0.7, 0.8]),
+])
+def test_stage_thresholds(thresholds, expected):
+    assert stage_thresholds(MODELS, thresholds) == expected
+
+
+def test_single_model_has_no_thresholds():
+    assert stage_thresholds(["resnet50"], [0.9]) == []
+
+
+def test_parse_thresholds():
+    assert parse_thresholds("0.8, 0.95,") == [0.8, 0.95]
+    assert parse_thresholds(" ") == [0.9]
+
+
+@pytest.mark.parametrize("spec", ["high", "1.5", "-0.1"])
+def test_parse_thresholds_rejects_invalid_values(spec):
+    with pytest.raises(ValueError, match="CASCADE_THRESHOLDS"):
+        parse_thresholds(spec)
+
+
+def test_parse_models():
+    assert parse_models(" resnet9, resnet50 ,") == ["resnet9", "resnet50"]
+
+
+@pytest.mark.parametrize("spec, message", [
+    ("", "at least one"),
+    (" , ", "at least one"),
+    ("resnet9,resnet34", "resnet34"),
+])
+def test_parse_models_rejects_empty_or_unknown(spec, message):
+    with pytest.raises(ValueError, match=message):
+        parse_models(spec)
+
+
+def cascade(confidences, thresholds=(0.9,), resolve=None):
+    calls = []
+
+    async def predict(model_name):
+        calls.append(model_name)
+        return {"model_used": model_name, "confidence": confidences[model_name]}
+
+    result = asyncio.run(run_cascade(predict, MODELS, list(thresholds), resolve))
+    return result, calls
+
+
+def test_confident_stage_answers():
+    result, calls = cascade({"resnet9": 0.95, "resnet18": 0.5, "resnet50": 0.5})
+    assert calls == ["resnet9"]
+    assert result["cascade"] == {"stage": 1, "stages": [{"model": "resnet9", "confidence": 0.95}]}
+
+
+def test_unsure_stages_escalate_to_the_last():
+    result, calls = cascade({"resnet9": 0.5, "resnet18": 0.6, "resnet50": 0.4})
+    assert calls == MODELS
+    assert result["model_used"] == "resnet50"
+    assert result["cascade"]["stage"] == 3
+
+
+def test_stage_degraded_to_a_tried_model_is_skipped():
+    # Under load resnet18 is served by resnet9, which already answered unsure.
+    degraded = {"resnet18": "resnet9"}
+    result, calls = cascade(
+        {"resnet9": 0.5, "resnet18": 0.99, "resnet50": 0.7}, resolve=lambda model: degraded.get(model, model)
+    )
+    assert calls == ["resnet9", "resnet50"]
+    assert [stage["model"] for stage in result["cascade"]["stages"]] == ["resnet9", "resnet50"]
+    assert result["cascade"]["stage"] == 3
+
+
+def test_last_stage_degraded_to_a_tried_model_reuses_its_prediction():
+    degraded = {"resnet50": "resnet18"}
+    result, calls = cascade(
+        {"resnet9": 0.5, "resnet18": 0.6, "resnet50": 0.99}, resolve=lambda model: degraded.get(model, model)
+    )
+    assert calls == ["resnet9", "resnet18"]
+    assert result["model_used"] == "resnet18"
+    assert result["cascade"]["stage"] == 3
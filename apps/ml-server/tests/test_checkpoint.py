@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.utils.checkpoint import (  # noqa: E402
+    ClassMismatch, align_classes, checkpoint_num_classes, load_checkpoint, load_safetensors, save_safetensors,
+)
+
+SERVED = ["Apple___healthy", "Corn___healthy", "Tomato___healthy"]
+
+
+def classifier_state(rows):
+    return {
+        "features.weight": torch.ones(4, 2),
+        "fc.weight": torch.arange(rows * 2, dtype=torch.float32).reshape(rows, 2),
+        "fc.bias": torch.arange(rows, dtype=torch.float32),
+    }
+
+
+def test_aligned_logits_follow_the_served_order():
+    trained = ["Tomato___healthy", "Apple___healthy", "Corn___healthy"]
+    state_dict = classifier_state(3)
+    aligned = align_classes(state_dict, trained, SERVED)
+
+    features = torch.tensor([0.5, -1.0])
+    logits = dict(zip(trained, state_dict["fc.weight"] @ features + state_dict["fc.bias"]))
+    aligned_logits = aligned["fc.weight"] @ features + aligned["fc.bias"]
+    assert aligned_logits.tolist() == [logits[name].item() for name in SERVED]
+    assert aligned["features.weight"] is state_dict["features.weight"]
+
+
+def test_same_order_is_left_alone():
+    state_dict = classifier_state(3)
+    assert align_classes(state_dict, SERVED, SERVED) is state_dict
+
+
+@pytest.mark.parametrize("trained", [SERVED[:2], [*SERVED[:2], "Grape___healthy"], [*SERVED, "Grape___healthy"]])
+def test_other_classes_are_refused(trained):
+    with pytest.raises(ClassMismatch):
+        align_classes(classifier_state(len(trained)), trained, SERVED)
+
+
+def test_num_classes_from_metadata_or_classifier():
+    assert checkpoint_num_classes(classifier_state(3), {"num_classes": 5}, 38) == 5
+    assert checkpoint_num_classes(classifier_state(3), {}, 38) == 3
+    assert checkpoint_num_classes({"features.weight": torch.ones(1)}, {}, 38) == 38
+
+
+def test_torch_checkpoint_with_metadata(tmp_path):
+    path = tmp_path / "resnet9_best.pth"
+    torch.save({"model_state_dict": classifier_state(3), "class_names": SERVED, "num_classes": 3}, path)
+
+    state_dict, metadata = load_checkpoint(path)
+    assert torch.equal(state_dict["fc.bias"], classifier_state(3)["fc.bias"])
+    assert metadata == {"class_names": SERVED, "num_classes": 3}
+
+
+def test_safetensors_next_to_the_checkpoint_is_preferred(tmp_path):
+    pytest.importorskip("safetensors")
+    path = tmp_path / "resnet9_best.pth"
+    save_safetensors(classifier_state(3), path.with_suffix(".safetensors"), class_names=SERVED, num_classes=3)
+
+    state_dict, metadata = load_checkpoint(path)
+    assert torch.equal(state_dict["fc.weight"], classifier_state(3)["fc.weight"])
+    assert metadata == {"class_names": SERVED, "num_classes": 3}
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc to see memory maps")
+def test_safetensors_weights_are_mapped_not_copied(tmp_path):
+    pytest.importorskip("safetensors")
+    path = tmp_path / "resnet9_best.safetensors"
+    save_safetensors({"fc.weight": torch.randn(256, 1024)}, path, num_classes=256)
+
+    weight = load_safetensors(path)[0]["fc.weight"]
+    with open("/proc/self/maps") as f:
+        regions = [line.split()[0] for line in f if line.rstrip().endswith(str(path))]
+    mapped = [[int(address, 16) for address in region.split("-")] for region in regions]
+    assert any(start <= weight.data_ptr() < end for start, end in mapped)
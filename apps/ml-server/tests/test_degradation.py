@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import degradation, executor
+from app.utils.degradation import is_degraded, parse_routes, record_latency, route, substitute
+
+
+@pytest.fixture
+def load(monkeypatch):
+    """Controls the pending requests and the clock; degrades at 10 pending, recovers below 5 after 10s"""
+    state = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(degradation, "time", SimpleNamespace(monotonic=lambda: state.now))
+    monkeypatch.setattr(degradation, "DEGRADE_QUEUE_DEPTH", 10)
+    monkeypatch.setattr(degradation, "DEGRADE_LATENCY_SLO_MS", 0)
+    monkeypatch.setattr(degradation, "DEGRADE_RECOVER_RATIO", 0.5)
+    monkeypatch.setattr(degradation, "DEGRADE_HOLD_SECONDS", 10)
+    monkeypatch.setattr(degradation, "routes", {"resnet50": ("resnet18", None), "resnet18": ("resnet9", "int8")})
+    monkeypatch.setattr(degradation, "degraded", False)
+    monkeypatch.setattr(degradation, "changed_at", 0.0)
+    monkeypatch.setattr(degradation, "latency_ms", 0.0)
+    monkeypatch.setattr(executor, "pending_requests", 0)
+
+    def at(seconds, pending):
+        state.now = 1000.0 + seconds
+        executor.pending_requests = pending
+
+    return at
+
+
+def test_parse_routes():
+    assert parse_routes("resnet50:resnet18, resnet18:resnet9.int8,") == {
+        "resnet50": ("resnet18", None), "resnet18": ("resnet9", "int8"),
+    }
+
+
+@pytest.mark.parametrize("spec", ["resnet50:resnet34", "vgg:resnet9", "resnet50"])
+def test_parse_routes_skips_unknown_models(spec):
+    assert parse_routes(spec) == {}
+
+
+def test_degrades_above_the_queue_depth(load):
+    load(0, 9)
+    assert not is_degraded()
+    load(1, 10)
+    assert is_degraded()
+
+
+def test_holds_for_the_hold_window(load):
+    load(0, 10)
+    assert is_degraded()
+    load(9.9, 0)
+    assert is_degraded()
+    load(10, 0)
+    assert not is_degraded()
+
+
+def test_recovers_only_below_the_recover_ratio(load):
+    load(0, 10)
+    assert is_degraded()
+    # Back under the limit, but not under half of it
+    load(20, 5)
+    assert is_degraded()
+    load(21, 4)
+    assert not is_degraded()
+    # Degrading again needs the full limit.
+    load(22, 9)
+    assert not is_degraded()
+
+
+def test_latency_slo_degrades(load, monkeypatch):
+    monkeypatch.setattr(degradation, "DEGRADE_QUEUE_DEPTH", 0)
+    monkeypatch.setattr(degradation, "DEGRADE_LATENCY_SLO_MS", 100)
+    load(0, 1000)
+    assert not is_degraded()
+    for _ in range(20):
+        record_latency(0.5)
+    assert is_degraded()
+
+
+def test_route_and_substitute(load, monkeypatch):
+    monkeypatch.setattr(degradation, "published_precision", lambda model_name, precision: precision)
+    load(0, 0)
+    assert route("resnet50", "fp32") == ("resnet50", "fp32", False)
+
+    load(1, 10)
+    assert substitute("resnet50", "fp32") == ("resnet18", "fp32")
+    assert route("resnet50", "fp32") == ("resnet18", "fp32", True)
+    # A route's own precision wins over the request's.
+    assert route("resnet18", "fp32") == ("resnet9", "int8", True)
+    # Models without a route are served as asked.
+    assert route("resnet9", "fp32") == ("resnet9", "fp32", False)
+
+
+def test_substitute_falls_back_to_a_published_precision(load, monkeypatch):
+    monkeypatch.setattr(degradation, "published_precision", lambda model_name, precision: "fp32")
+    load(0, 10)
+    assert substitute("resnet18", "fp32") == ("resnet9", "fp32")
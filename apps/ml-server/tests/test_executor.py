@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app import main
+from app.utils import executor
+from app.utils.batching import close_batchers
+from app.utils.executor import InferenceQueueFull, admit_request, run_in_executor, shutdown_executor
+
+
+def test_full_queue_is_rejected(monkeypatch):
+    monkeypatch.setattr(executor, "INFERENCE_QUEUE_SIZE", 1)
+    with admit_request():
+        with pytest.raises(InferenceQueueFull):
+            with admit_request():
+                pass
+    assert executor.pending_requests == 0
+
+
+def test_slot_is_released_when_the_request_raises(monkeypatch):
+    monkeypatch.setattr(executor, "INFERENCE_QUEUE_SIZE", 1)
+    with pytest.raises(ValueError):
+        with admit_request():
+            raise ValueError("prediction failed")
+    assert executor.pending_requests == 0
+
+    with admit_request():
+        assert executor.pending_requests == 1
+
+
+def test_full_queue_answers_503_with_retry_after(monkeypatch):
+    monkeypatch.setattr(executor, "INFERENCE_QUEUE_SIZE", 0)
+
+    async def predict():
+        try:
+            return await main.run_prediction(b"image", "resnet9")
+        finally:
+            await close_batchers()
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(predict())
+    assert error.value.status_code == 503
+    assert error.value.headers == {"Retry-After": "1"}
+    assert executor.pending_requests == 0
+
+
+def test_shutdown_waits_for_running_jobs_without_blocking_the_loop():
+    release = threading.Event()
+    ticks = []
+
+    async def shut_down_while_busy():
+        job = asyncio.ensure_future(run_in_executor(release.wait, 5))
+        await asyncio.sleep(0.01)
+        shutdown = asyncio.create_task(shutdown_executor())
+        for _ in range(3):
+            await asyncio.sleep(0.01)
+            ticks.append(shutdown.done())
+        release.set()
+        await shutdown
+        return await job
+
+    assert asyncio.run(shut_down_while_busy()) is True
+    assert ticks == [False, False, False]
+    assert executor.executor is None
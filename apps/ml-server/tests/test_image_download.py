@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.utils import http_client, image_download
+from app.utils.image_download import ImageDownloadError, ImageTooLarge, download_image
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 60
+
+
+async def chunked(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def serve(monkeypatch, handler):
+    """Route download_image's requests to `handler`"""
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(image_download, "get_http_client", lambda: client)
+
+
+def download(url="http://images.test/leaf.jpg", **kwargs):
+    return asyncio.run(download_image(url, **kwargs))
+
+
+def test_download_returns_image_and_validators(monkeypatch):
+    serve(monkeypatch, lambda request: httpx.Response(
+        200, content=JPEG, headers={"content-type": "image/jpeg", "etag": '"v1"'},
+    ))
+    image = download()
+    assert bytes(image.content) == JPEG
+    assert image.etag == '"v1"'
+
+
+def test_download_rejects_declared_length_over_limit(monkeypatch):
+    serve(monkeypatch, lambda request: httpx.Response(200, content=JPEG * 4))
+    with pytest.raises(ImageTooLarge):
+        download(max_bytes=len(JPEG))
+
+
+def test_download_stops_streaming_at_limit(monkeypatch):
+    # No content-length: the cap has to hold while the chunks arrive.
+    serve(monkeypatch, lambda request: httpx.Response(200, content=chunked(JPEG, JPEG, JPEG)))
+    with pytest.raises(ImageTooLarge):
+        download(max_bytes=2 * len(JPEG))
+
+
+@pytest.mark.parametrize("body", [b"<html><body>not found</body></html>", b"%PDF-1.7" + b"\x00" * 16])
+def test_download_rejects_non_image_magic_bytes(monkeypatch, body):
+    serve(monkeypatch, lambda request: httpx.Response(200, content=body))
+    with pytest.raises(ImageDownloadError):
+        download()
+
+
+def test_download_rejects_non_image_content_type(monkeypatch):
+    serve(monkeypatch, lambda request: httpx.Response(200, content=JPEG, headers={"content-type": "text/html"}))
+    with pytest.raises(ImageDownloadError):
+        download()
+
+
+def test_conditional_download_not_modified(monkeypatch):
+    def handler(request):
+        assert request.headers["if-none-match"] == '"v1"'
+        return httpx.Response(304)
+
+    serve(monkeypatch, handler)
+    image = download(etag='"v1"')
+    assert image.content is None
+    assert image.etag == '"v1"'
+
+
+def test_redirects_are_not_followed(monkeypatch):
+    monkeypatch.setattr(http_client, "client", None)
+    assert not http_client.get_http_client().follow_redirects
+
+    serve(monkeypatch, lambda request: httpx.Response(302, headers={"location": "http://169.254.169.254/"}))
+    with pytest.raises(httpx.HTTPStatusError):
+        download()
+
+
+@pytest.mark.parametrize("head", [
+    b"\xff\xd8\xff\xdb", b"\x89PNG\r\n\x1a\n", b"GIF89a", b"BM", b"RIFF\x00\x00\x00\x00WEBP",
+])
+def test_image_signatures(head):
+    assert image_download.is_image_signature(head + b"\x00" * 12)
+
+
+def test_non_image_signature():
+    assert not image_download.is_image_signature(b"\x00" * 12)
+
+
+def read(*chunks, content_length=None, max_bytes=1024):
+    return asyncio.run(image_download.read_image_stream(chunked(*chunks), content_length, max_bytes))
+
+
+def test_read_stream_joins_chunks():
+    assert bytes(read(JPEG[:5], JPEG[5:], content_length=str(len(JPEG)))) == JPEG
+
+
+def test_read_stream_handles_short_or_missing_length():
+    assert bytes(read(JPEG[:10], JPEG[10:], content_length="10")) == JPEG
+    assert bytes(read(JPEG, content_length=str(2 * len(JPEG)))) == JPEG
+    assert bytes(read(JPEG)) == JPEG
+
+
+def test_read_stream_caps_size():
+    with pytest.raises(ImageTooLarge):
+        read(JPEG, content_length="4096")
+    with pytest.raises(ImageTooLarge):
+        read(JPEG, JPEG, max_bytes=len(JPEG) + 1)
+
+
+def test_read_stream_rejects_non_image():
+    with pytest.raises(ImageDownloadError):
+        read(b"GET / HTTP/1.1\r\n\r\n")
+
+
+@pytest.mark.parametrize("content", [b"", b"\xff\xd8", b"not an image at all"])
+def test_check_image_rejects(content):
+    with pytest.raises(ImageDownloadError):
+        image_download.check_image(content)
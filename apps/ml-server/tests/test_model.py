@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+nn = torch.nn
+
+from app.utils.model import check_parity, conv_bn_pairs, fuse_conv_bn, get_model  # noqa: E402
+
+
+def randomize_batchnorm(model, seed=0):
+    """Non-trivial BN statistics, so folding them actually changes the weights"""
+    generator = torch.Generator().manual_seed(seed)
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm2d):
+            size = module.num_features
+            module.running_mean.copy_(torch.randn(size, generator=generator) * 0.1)
+            module.running_var.copy_(torch.rand(size, generator=generator) + 0.5)
+            module.weight.data.copy_(torch.rand(size, generator=generator) + 0.5)
+            module.bias.data.copy_(torch.randn(size, generator=generator) * 0.1)
+    return model.eval()
+
+
+def assert_fusion_parity(model, inputs):
+    with torch.no_grad():
+        expected = model(inputs).numpy()
+        fused = fuse_conv_bn(model)
+        actual = fused(inputs).numpy()
+    check_parity("fused", actual, expected)
+    return fused
+
+
+@pytest.mark.parametrize("model_name, size", [("resnet9", 256), ("resnet18", 64), ("resnet50", 64)])
+def test_resnets_fold_every_batchnorm(model_name, size):
+    torch.manual_seed(0)
+    model = randomize_batchnorm(get_model(model_name, num_classes=38))
+    batchnorms = sum(isinstance(module, nn.BatchNorm2d) for module in model.modules())
+
+    assert len(conv_bn_pairs(model)) == batchnorms
+    fused = assert_fusion_parity(model, torch.randn(2, 3, size, size))
+    assert not any(isinstance(module, nn.BatchNorm2d) for module in fused.modules())
+
+
+class BatchNormRegisteredFirst(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.bn = nn.BatchNorm2d(8)
+        self.conv = nn.Conv2d(3, 8, 3, padding=1)
+
+    def forward(self, x):
+        return self.bn(self.conv(x))
+
+
+class BatchNormBeforeConv(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(3, 3, 3, padding=1)
+        self.bn = nn.BatchNorm2d(3)
+
+    def forward(self, x):
+        return self.conv(self.bn(x))
+
+
+class ConvOutputReusedElsewhere(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(3, 3, 3, padding=1)
+        self.bn = nn.BatchNorm2d(3)
+
+    def forward(self, x):
+        out = self.conv(x)
+        return self.bn(out) + out
+
+
+def test_pairs_follow_the_data_flow_not_registration_order():
+    assert conv_bn_pairs(BatchNormRegisteredFirst()) == [("conv", "bn")]
+    assert conv_bn_pairs(BatchNormBeforeConv()) == []
+    assert conv_bn_pairs(ConvOutputReusedElsewhere()) == []
+
+
+@pytest.mark.parametrize("module", [BatchNormRegisteredFirst, BatchNormBeforeConv, ConvOutputReusedElsewhere])
+def test_folding_keeps_the_output(module):
+    torch.manual_seed(0)
+    assert_fusion_parity(randomize_batchnorm(module()), torch.randn(2, 3, 16, 16))
+
+
+class Untraceable(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.features = nn.Sequential(nn.Conv2d(3, 4, 3), nn.BatchNorm2d(4), nn.ReLU())
+        self.conv = nn.Conv2d(4, 4, 3)
+        self.bn = nn.BatchNorm2d(4)
+
+    def forward(self, x):
+        out = self.features(x)
+        if out.sum() > 0:  # Data-dependent branch, which torch.fx cannot trace
+            out = self.bn(self.conv(out))
+        return out
+
+
+def test_untraceable_model_folds_sequential_pairs_only():
+    assert conv_bn_pairs(Untraceable()) == [("features.0", "features.1")]
+
+
+def test_mismatched_batchnorm_is_rejected():
+    model = BatchNormRegisteredFirst().eval()
+    model.bn = nn.BatchNorm2d(4).eval()
+    with pytest.raises(ValueError, match="normalizes 4 channels"):
+        fuse_conv_bn(model)
+
+
+def test_training_model_is_rejected():
+    with pytest.raises(ValueError, match="eval mode"):
+        fuse_conv_bn(BatchNormRegisteredFirst())
+
+
+def test_parity_check_catches_changed_predictions():
+    expected = np.array([[1.0, 2.0], [3.0, 1.0]])
+    assert check_parity("same", expected + 1e-6, expected) < 1e-5
+    with pytest.raises(ValueError, match="differs"):
+        check_parity("swapped", expected[:, ::-1], expected)
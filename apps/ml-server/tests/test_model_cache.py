@@ -0,0 +1,81 @@
+import threading
+import time
+
+from app.utils import model_cache as model_cache_module
+from app.utils.model_cache import ModelCache
+
+
+def load(cache, key, size, pin=False):
+    return cache.get(key, lambda: f"model {key}", lambda model: size, pin)
+
+
+def test_budget_evicts_least_recently_used():
+    cache = ModelCache(max_bytes=100)
+    load(cache, "a", 40)
+    load(cache, "b", 40)
+    load(cache, "a", 40)  # a is now the most recently used
+    load(cache, "c", 40)
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.size_bytes == 80
+    assert cache.stats()["evictions"] == 1
+
+
+def test_pinned_models_are_never_evicted():
+    cache = ModelCache(max_bytes=100)
+    load(cache, "pinned", 60, pin=True)
+    load(cache, "b", 30)
+    load(cache, "c", 30)
+
+    assert "pinned" in cache
+    assert "b" not in cache and "c" in cache
+
+
+def test_oversized_model_stays_loaded_alone():
+    cache = ModelCache(max_bytes=100)
+    load(cache, "a", 40)
+    load(cache, "huge", 150)
+
+    assert list(cache.entries) == ["huge"]
+
+
+def test_lookup_can_pin_a_loaded_model():
+    cache = ModelCache(max_bytes=100)
+    load(cache, "a", 60)
+    load(cache, "a", 60, pin=True)
+    load(cache, "b", 60)
+
+    assert "a" in cache and "b" in cache
+
+
+def test_idle_models_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_cache_module.time, "monotonic", lambda: now[0])
+    cache = ModelCache(idle_seconds=60)
+    load(cache, "idle", 10)
+    load(cache, "pinned", 10, pin=True)
+
+    now[0] += 61
+    load(cache, "fresh", 10)
+    assert "idle" not in cache
+    assert "pinned" in cache and "fresh" in cache
+
+
+def test_concurrent_misses_load_once():
+    cache = ModelCache()
+    loads = []
+
+    def slow_load():
+        loads.append(1)
+        time.sleep(0.05)
+        return "model"
+
+    threads = [threading.Thread(target=cache.get, args=("a", slow_load)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 3
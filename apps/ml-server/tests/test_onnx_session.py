@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip("onnx")
+from onnx import TensorProto, helper, numpy_helper  # noqa: E402
+
+from app.utils import onnx_session  # noqa: E402
+from app.utils.onnx_session import create_session, external_data_path, optimized_model_path  # noqa: E402
+
+PROVIDERS = ["CPUExecutionProvider"]
+WEIGHTS = np.arange(64 * 64, dtype=np.float32).reshape(64, 64) / 4096
+
+
+@pytest.fixture
+def model_path(tmp_path, monkeypatch):
+    """A MatMul + Add graph whose weights are large enough to go to the .data file"""
+    monkeypatch.setattr(onnx_session, "ONNX_OPTIMIZED_DIR", str(tmp_path / "optimized"))
+    graph = helper.make_graph(
+        [helper.make_node("MatMul", ["x", "w"], ["y"]), helper.make_node("Add", ["y", "b"], ["out"])],
+        "tiny",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, [None, 64])],
+        [helper.make_tensor_value_info("out", TensorProto.FLOAT, [None, 64])],
+        [numpy_helper.from_array(WEIGHTS, "w"), numpy_helper.from_array(np.ones(64, np.float32), "b")],
+    )
+    path = tmp_path / "tiny.onnx"
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)], ir_version=8), path)
+    return path
+
+
+def cache_path(model_path):
+    return optimized_model_path(model_path, onnx_session.session_config("tiny"), PROVIDERS)
+
+
+def check_output(session):
+    x = np.ones((2, 64), dtype=np.float32)
+    np.testing.assert_allclose(session.run(None, {"x": x})[0], x @ WEIGHTS + 1, rtol=1e-5)
+
+
+def test_optimized_graph_is_published_whole(model_path):
+    check_output(create_session("tiny", model_path, PROVIDERS))
+
+    cached = cache_path(model_path)
+    assert cached.exists() and external_data_path(cached).exists()
+    # Nothing is left behind in the staging directory.
+    assert sorted(path.name for path in cached.parent.iterdir()) == sorted(
+        [cached.name, external_data_path(cached).name]
+    )
+
+
+def test_cached_graph_is_used(model_path, capsys):
+    create_session("tiny", model_path, PROVIDERS)
+    check_output(create_session("tiny", model_path, PROVIDERS))
+    assert "Using optimized tiny graph" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("damaged", ["graph", "weights"])
+def test_corrupt_cache_is_rebuilt(model_path, capsys, damaged):
+    create_session("tiny", model_path, PROVIDERS)
+    cached = cache_path(model_path)
+    target = cached if damaged == "graph" else external_data_path(cached)
+    target.write_bytes(target.read_bytes()[: target.stat().st_size // 3])
+
+    check_output(create_session("tiny", model_path, PROVIDERS))
+    assert "Discarding unreadable optimized tiny graph" in capsys.readouterr().out
+
+    # The rebuilt cache loads again.
+    check_output(create_session("tiny", model_path, PROVIDERS))
+    assert "Using optimized tiny graph" in capsys.readouterr().out
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from app.utils.postprocessing import top_classes
+
+
+@pytest.mark.parametrize("k", [1, 3, 5, 38])
+def test_top_classes_match_a_full_sort(k):
+    probabilities = np.random.default_rng(0).dirichlet(np.ones(38), size=16).astype(np.float32)
+    top, top_probabilities = top_classes(probabilities, k)
+
+    expected = np.argsort(-probabilities, axis=1, kind="stable")[:, :k]
+    np.testing.assert_array_equal(top, expected)
+    np.testing.assert_array_equal(top_probabilities, np.take_along_axis(probabilities, expected, axis=1))
+    assert np.all(np.diff(top_probabilities, axis=1) <= 0)
+
+
+def test_top_one_is_argmax():
+    probabilities = np.array([[0.1, 0.7, 0.2], [0.5, 0.2, 0.3]])
+    top, top_probabilities = top_classes(probabilities, 1)
+    np.testing.assert_array_equal(top[:, 0], [1, 0])
+    np.testing.assert_array_equal(top_probabilities[:, 0], [0.7, 0.5])
+
+
+def test_k_is_capped_at_the_class_count():
+    top, top_probabilities = top_classes(np.array([[0.2, 0.3, 0.5]]), 10)
+    np.testing.assert_array_equal(top, [[2, 1, 0]])
+    assert top_probabilities.shape == (1, 3)
@@ -0,0 +1,53 @@
+import pytest
+from fastapi import HTTPException
+
+from app import main
+from app.utils import model_registry, resnet_inference
+
+
+@pytest.fixture
+def int8_default(monkeypatch):
+    """MODEL_PRECISION=int8, with only resnet50 publishing an int8 variant"""
+    monkeypatch.setattr(resnet_inference, "MODEL_PRECISION", "int8")
+    monkeypatch.setattr(main, "MODEL_PRECISION", "int8")
+    published = {"resnet9": ["fp32"], "resnet18": ["fp32"], "resnet50": ["fp32", "int8"]}
+    monkeypatch.setattr(resnet_inference, "available_precisions", lambda model_name: published.get(model_name, []))
+    monkeypatch.setattr(main, "available_precisions", lambda model_name: published.get(model_name, []))
+
+
+def test_default_precision_falls_back_to_fp32(int8_default):
+    assert main.resolve_precision("resnet9", None) == "fp32"
+    assert main.resolve_precision("resnet50", None) == "int8"
+    # The cascade resolves it per stage.
+    assert main.resolve_precision(main.CASCADE_MODEL_NAME, None) == "int8"
+
+
+def test_explicit_unpublished_precision_is_not_found(int8_default):
+    with pytest.raises(HTTPException) as error:
+        main.resolve_precision("resnet9", "int8")
+    assert error.value.status_code == 404
+    assert main.resolve_precision("resnet9", "fp32") == "fp32"
+
+
+def test_unknown_precision_is_rejected(int8_default):
+    with pytest.raises(HTTPException) as error:
+        main.resolve_precision("resnet9", "int4")
+    assert error.value.status_code == 400
+
+
+def test_preload_serves_fp32_onnx_without_the_default_variant(int8_default, monkeypatch):
+    calls = []
+    monkeypatch.setattr(model_registry, "model_states", {})
+    monkeypatch.setattr(model_registry, "WARMUP_MODELS", True)
+    monkeypatch.setattr(
+        model_registry, "load_onnx_model", lambda model_name, precision, pin: calls.append(("load", precision))
+    )
+    monkeypatch.setattr(
+        model_registry, "run_inference",
+        lambda batch, model_name, use_onnx, precision: calls.append(("warmup", precision)),
+    )
+    monkeypatch.setattr(model_registry, "load_pytorch_model", lambda *args, **kwargs: pytest.fail("fell back"))
+
+    model_registry.load_model("resnet9")
+    assert calls == [("load", "fp32"), ("warmup", "fp32")]
+    assert model_registry.model_states["resnet9"]["backend"] == "ONNX"
@@ -0,0 +1,85 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils import resnet_inference
+from app.utils.resnet_inference import disease_classes, predict_batch
+
+
+class StubInput:
+    name = "input"
+
+
+class StubSession:
+    """Answers each image with the class index painted into its red channel"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def get_inputs(self):
+        return [StubInput()]
+
+    def run(self, outputs, feeds):
+        batch = feeds["input"]
+        self.batch_sizes.append(len(batch))
+        logits = np.zeros((len(batch), len(disease_classes)), dtype=np.float32)
+        classes = np.rint(batch[:, 0, 0, 0] * 255).astype(int)
+        logits[np.arange(len(batch)), classes] = 10.0
+        return [logits]
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = StubSession()
+    monkeypatch.setattr(resnet_inference, "load_onnx_model", lambda *args, **kwargs: session)
+    return session
+
+
+def image_of_class(idx):
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (idx, 0, 0)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_one_session_run_per_chunk(session):
+    images = [image_of_class(idx) for idx in range(10)]
+    predict_batch(images, use_onnx=True, batch_size=4)
+    assert session.batch_sizes == [4, 4, 2]
+
+
+def test_results_keep_input_order_across_chunks(session):
+    classes = [7, 3, 12, 0, 25, 1, 30]
+    results = predict_batch([image_of_class(idx) for idx in classes], use_onnx=True, batch_size=3)
+    assert [result["predicted_class"] for result in results] == [disease_classes[idx] for idx in classes]
+    assert all(result["inference_type"] == "ONNX" for result in results)
+
+
+def test_bad_image_fails_only_its_own_slot(session):
+    images = [image_of_class(5), b"not an image", image_of_class(9), image_of_class(2)]
+    results = predict_batch(images, use_onnx=True, batch_size=2)
+
+    assert results[1]["predicted_class"] == "Error"
+    assert "error" in results[1]
+    assert [results[i]["predicted_class"] for i in (0, 2, 3)] == [disease_classes[idx] for idx in (5, 9, 2)]
+    # The failed image is left out of its chunk's model call.
+    assert session.batch_sizes == [1, 2]
+
+
+def test_failed_model_call_fails_only_its_chunk(session, monkeypatch):
+    monkeypatch.setattr(resnet_inference, "PYTORCH_FALLBACK", False)
+    run = session.run
+
+    def flaky_run(outputs, feeds):
+        if len(session.batch_sizes) == 1:
+            session.batch_sizes.append(len(feeds["input"]))
+            raise RuntimeError("session failed")
+        return run(outputs, feeds)
+
+    session.run = flaky_run
+    results = predict_batch([image_of_class(idx) for idx in (1, 2, 3, 4)], use_onnx=True, batch_size=2)
+
+    assert [result["predicted_class"] for result in results] == [
+        disease_classes[1], disease_classes[2], "Error", "Error",
+    ]
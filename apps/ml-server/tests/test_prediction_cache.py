@@ -0,0 +1,62 @@
+import asyncio
+import sqlite3
+import threading
+
+from app.utils.prediction_cache import PredictionCache
+
+RESULT = {"predicted_class": "Tomato___healthy", "confidence": 0.97}
+
+
+def get(cache, content_hash, model_name="resnet9"):
+    return asyncio.run(cache.get(content_hash, model_name))
+
+
+def test_lru_eviction():
+    cache = PredictionCache(max_entries=2, cache_dir="")
+    for content_hash in ("a", "b"):
+        cache.put(content_hash, "resnet9", RESULT)
+    get(cache, "a")
+    cache.put("c", "resnet9", RESULT)
+
+    assert get(cache, "b") is None
+    assert get(cache, "a") == RESULT
+    assert get(cache, "c") == RESULT
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    cache = PredictionCache(cache_dir=str(tmp_path))
+    cache.put("a", "resnet9", RESULT)
+    cache.flush()
+
+    restarted = PredictionCache(cache_dir=str(tmp_path))
+    assert get(restarted, "a") == RESULT
+    assert restarted.disk_hits == 1
+    # Read through into memory
+    assert get(restarted, "a") == RESULT
+    assert restarted.disk_hits == 1
+
+
+def test_disk_reads_run_off_the_event_loop(tmp_path, monkeypatch):
+    cache = PredictionCache(cache_dir=str(tmp_path))
+    read_row = cache.read_row
+    threads = []
+
+    def recording_read_row(key):
+        threads.append(threading.current_thread())
+        return read_row(key)
+
+    monkeypatch.setattr(cache, "read_row", recording_read_row)
+    assert get(cache, "missing") is None
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_disk_tier_purges_expired_rows(tmp_path):
+    cache = PredictionCache(ttl=60, cache_dir=str(tmp_path))
+    cache.put("a", "resnet9", RESULT)
+    cache.flush()
+    with sqlite3.connect(tmp_path / "predictions.sqlite3") as db:
+        db.execute("UPDATE predictions SET stored_at = stored_at - 120")
+
+    PredictionCache(ttl=60, cache_dir=str(tmp_path)).flush()
+    with sqlite3.connect(tmp_path / "predictions.sqlite3") as db:
+        assert db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] == 0
@@ -0,0 +1,96 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="the prefork supervisor needs fork()")
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+# Runs prefork.serve with a fake worker that logs "start <pid>" and, on
+# SIGTERM, "drain <pid>" once it has finished a short in-flight request.
+SUPERVISOR = """
+import os, signal, sys, time
+from app.utils import prefork
+
+log_path, mode = sys.argv[1], sys.argv[2]
+prefork.RESTART_BACKOFF = 1
+
+def log(event):
+    with open(log_path, "a") as f:
+        f.write(f"{event} {os.getpid()}\\n")
+
+def fake_worker(sock, graceful_timeout):
+    log("start")
+    if mode == "crash":
+        os._exit(1)
+    signal.signal(signal.SIGTERM, lambda signum, frame: (time.sleep(0.3), log("drain"), os._exit(0)))
+    while True:
+        time.sleep(0.05)
+
+prefork.run_worker = fake_worker
+prefork.serve("127.0.0.1", 0, int(sys.argv[3]), graceful_timeout=2, preload=False)
+"""
+
+
+def start_supervisor(tmp_path, mode="serve", workers=2):
+    log_path = tmp_path / "events.log"
+    log_path.touch()
+    process = subprocess.Popen(
+        [sys.executable, "-c", SUPERVISOR, str(log_path), mode, str(workers)],
+        cwd=SERVER_DIR, env={**os.environ, "PYTHONPATH": str(SERVER_DIR)},
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    return process, log_path
+
+
+def events(log_path, kind):
+    return [int(line.split()[1]) for line in log_path.read_text().splitlines() if line.startswith(kind)]
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.05)
+
+
+def test_crashed_worker_is_replaced(tmp_path):
+    process, log_path = start_supervisor(tmp_path)
+    try:
+        wait_for(lambda: len(events(log_path, "start")) == 2)
+        os.kill(events(log_path, "start")[0], signal.SIGKILL)
+        # Restarted after the backoff, since it died right after starting.
+        wait_for(lambda: len(events(log_path, "start")) == 3)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.communicate(timeout=10)
+
+
+@pytest.mark.parametrize("sig", [signal.SIGTERM, signal.SIGINT, signal.SIGHUP])
+def test_signal_drains_every_worker(tmp_path, sig):
+    process, log_path = start_supervisor(tmp_path)
+    wait_for(lambda: len(events(log_path, "start")) == 2)
+
+    process.send_signal(sig)
+    output, _ = process.communicate(timeout=10)
+    assert process.returncode == 0
+    assert sorted(events(log_path, "drain")) == sorted(events(log_path, "start"))
+    assert "All workers stopped" in output
+
+
+def test_stop_during_restart_backoff_spawns_nothing(tmp_path):
+    process, log_path = start_supervisor(tmp_path, mode="crash", workers=1)
+    wait_for(lambda: len(events(log_path, "start")) == 1)
+    time.sleep(0.3)  # Inside the one-second backoff before the restart
+
+    process.send_signal(signal.SIGTERM)
+    output, _ = process.communicate(timeout=10)
+    assert process.returncode == 0
+    assert len(events(log_path, "start")) == 1
+    assert "All workers stopped" in output
@@ -0,0 +1,120 @@
+import functools
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils import preprocessing
+from app.utils.preprocessing import IMAGE_SIZE, load_image, preprocess_image
+
+
+def leaf_image(width, height, mode="RGB", seed=0):
+    """Deterministic image with smooth gradients and noise, so resampling matters"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    channels = [
+        127 + 100 * np.sin(x / (7 + 3 * c)) * np.cos(y / (11 + c)) + rng.normal(0, 12, (height, width))
+        for c in range(4)
+    ]
+    pixels = np.clip(np.stack(channels, axis=-1), 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels, "RGBA")
+    return image if mode == "RGBA" else image.convert("RGB").convert(mode)
+
+
+def encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="module")
+def training_tensor():
+    """The transform the models are trained with (ml-model/inference/plant-disease/train.py)"""
+    transforms = pytest.importorskip("torchvision.transforms")
+    transform = transforms.Compose([transforms.Resize(IMAGE_SIZE), transforms.ToTensor()])
+    # ImageFolder opens every sample as RGB before the transform.
+    return lambda image: transform(image.convert("RGB")).numpy()
+
+
+@pytest.mark.parametrize("width, height, mode", [
+    (640, 480, "RGB"),
+    (300, 500, "RGB"),
+    (256, 256, "RGB"),
+    (120, 90, "RGB"),  # Upscaled
+    (400, 300, "RGBA"),
+    (333, 250, "L"),
+    (200, 260, "P"),
+])
+def test_matches_training_transform(training_tensor, width, height, mode):
+    image = leaf_image(width, height, mode)
+    expected = training_tensor(image)
+
+    np.testing.assert_array_equal(preprocess_image(image), expected)
+    # Encoded losslessly, the bytes decode to the same pixels.
+    np.testing.assert_array_equal(preprocess_image(encode(image, "PNG")), expected)
+
+
+def test_jpeg_without_draft_matches_training_transform(training_tensor, monkeypatch):
+    monkeypatch.setattr(preprocessing, "JPEG_DRAFT_OVERSAMPLE", 0)
+    content = encode(leaf_image(1024, 768), "JPEG", quality=90)
+    expected = training_tensor(Image.open(io.BytesIO(content)))
+    np.testing.assert_array_equal(preprocess_image(content), expected)
+
+
+def test_output_layout():
+    out = preprocess_image(leaf_image(300, 200))
+    assert out.shape == (3, *IMAGE_SIZE)
+    assert out.dtype == np.float32
+    assert 0.0 <= out.min() and out.max() <= 1.0
+
+
+def decode_both_ways(content, monkeypatch):
+    """`content` preprocessed with a full decode and with the default draft decode"""
+    monkeypatch.setattr(preprocessing, "JPEG_DRAFT_OVERSAMPLE", 0)
+    full = preprocess_image(content)
+    monkeypatch.setattr(preprocessing, "JPEG_DRAFT_OVERSAMPLE", 2)
+    return full, preprocess_image(content)
+
+
+PHOTO_SIZES = [(2048, 1536), (2400, 1800), (1600, 1200), (1200, 1600)]
+
+
+@functools.lru_cache
+def photo(seed):
+    return encode(leaf_image(*PHOTO_SIZES[seed], seed=seed), "JPEG", quality=90)
+
+
+@pytest.mark.parametrize("seed", range(len(PHOTO_SIZES)))
+def test_draft_decode_stays_close_to_full_decode(monkeypatch, seed):
+    full, draft = decode_both_ways(photo(seed), monkeypatch)
+    drift = np.abs(full - draft)
+    assert drift.mean() < 0.005
+    assert drift.max() < 8 / 255
+
+
+def test_draft_decode_keeps_the_top_class(monkeypatch):
+    # A fixed linear classifier over 16x16 pooled pixels stands in for a model.
+    weights = np.random.default_rng(0).normal(size=(38, 3 * 16 * 16)).astype(np.float32)
+
+    def logits(tensor):
+        return weights @ tensor.reshape(3, 16, 16, 16, 16).mean(axis=(2, 4)).ravel()
+
+    for seed in range(len(PHOTO_SIZES)):
+        full, draft = decode_both_ways(photo(seed), monkeypatch)
+        assert logits(draft).argmax() == logits(full).argmax()
+        assert np.abs(logits(draft) - logits(full)).max() < 0.02
+
+
+def test_draft_decode_covers_the_oversampled_target():
+    content = photo(0)
+    # 1/2 scale still covers 512x512; 1/4 would not.
+    assert load_image(content).size == (1024, 768)
+
+
+@pytest.mark.parametrize("size", [(400, 400), (600, 480), (256, 256)])
+def test_small_jpeg_is_decoded_in_full(monkeypatch, size):
+    content = encode(leaf_image(*size), "JPEG", quality=90)
+    assert load_image(content).size == size
+    full, draft = decode_both_ways(content, monkeypatch)
+    np.testing.assert_array_equal(draft, full)
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+nn = torch.nn
+
+from app.utils import torch_backend  # noqa: E402
+from app.utils.torch_backend import configure_threads, optimize_model, scripted_model_path  # noqa: E402
+
+
+@pytest.fixture
+def threads(monkeypatch):
+    """Records the intra-op thread count configure_threads picks"""
+    calls = []
+    monkeypatch.setattr(torch, "set_num_threads", calls.append)
+    monkeypatch.setattr(torch, "set_num_interop_threads", lambda count: None)
+    monkeypatch.setattr(torch_backend, "threads_configured", False)
+    monkeypatch.setattr(torch_backend, "TORCH_NUM_THREADS", 0)
+    return calls
+
+
+@pytest.mark.parametrize("cpus, workers, concurrency, expected", [
+    (16, 1, 2, 8),
+    (16, 4, 2, 2),
+    (16, 16, 2, 1),  # Never below one thread
+    (6, 2, 2, 1),
+    (None, 1, 2, 1),  # Unknown CPU count
+])
+def test_threads_split_the_cores(threads, monkeypatch, cpus, workers, concurrency, expected):
+    monkeypatch.setattr(os, "cpu_count", lambda: cpus)
+    monkeypatch.setattr(torch_backend, "SERVER_WORKERS", workers)
+    monkeypatch.setattr(torch_backend, "MODEL_MAX_CONCURRENCY", concurrency)
+    configure_threads()
+    assert threads == [expected]
+
+
+def test_thread_override_and_once_per_process(threads, monkeypatch):
+    monkeypatch.setattr(torch_backend, "TORCH_NUM_THREADS", 3)
+    configure_threads()
+    configure_threads()
+    assert threads == [3]
+
+
+def tiny_model():
+    torch.manual_seed(0)
+    return nn.Sequential(nn.Conv2d(3, 4, 3), nn.ReLU(), nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(4, 2)).eval()
+
+
+def test_eager_backend_returns_the_model(monkeypatch):
+    monkeypatch.setattr(torch_backend, "TORCH_BACKEND", "eager")
+    model = tiny_model()
+    assert optimize_model(model, "tiny", None, (16, 16)) is model
+
+
+@pytest.mark.parametrize("backend", ["script", "compile"])
+def test_failed_backend_falls_back_to_eager(monkeypatch, backend):
+    monkeypatch.setattr(torch_backend, "TORCH_BACKEND", backend)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("no C++ compiler")
+
+    monkeypatch.setattr(torch_backend, "script_model", fail)
+    monkeypatch.setattr(torch, "compile", fail)
+    model = tiny_model()
+    assert optimize_model(model, "tiny", None, (16, 16)) is model
+
+
+def test_unknown_backend_runs_eagerly(monkeypatch):
+    monkeypatch.setattr(torch_backend, "TORCH_BACKEND", "tensorrt")
+    model = tiny_model()
+    assert optimize_model(model, "tiny", None, (16, 16)) is model
+
+
+# TorchScript itself is deprecated in recent torch releases.
+@pytest.mark.filterwarnings("ignore::FutureWarning")
+def test_scripted_model_is_cached_per_checkpoint(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(torch_backend, "TORCH_BACKEND", "script")
+    monkeypatch.setattr(torch_backend, "TORCH_CACHE_DIR", str(tmp_path / "cache"))
+    checkpoint = tmp_path / "tiny.pth"
+    checkpoint.write_bytes(b"weights")
+    model = tiny_model()
+    inputs = torch.randn(2, 3, 16, 16)
+
+    scripted = optimize_model(model, "tiny", checkpoint, (16, 16))
+    path = scripted_model_path("tiny", checkpoint, torch.device("cpu"))
+    assert path.exists()
+    with torch.inference_mode():
+        torch.testing.assert_close(scripted(inputs), model(inputs))
+
+    reloaded = optimize_model(model, "tiny", checkpoint, (16, 16))
+    assert "Using frozen tiny TorchScript" in capsys.readouterr().out
+    with torch.inference_mode():
+        torch.testing.assert_close(reloaded(inputs), model(inputs))
+
+    # A changed checkpoint gets its own cache file.
+    checkpoint.write_bytes(b"new weights!")
+    assert scripted_model_path("tiny", checkpoint, torch.device("cpu")) != path
+    assert scripted_model_path("tiny", tmp_path / "missing.pth", torch.device("cpu")) is None
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+xgboost = pytest.importorskip("xgboost")
+
+from app.utils.tree_predictor import CompiledTreeEnsemble  # noqa: E402
+
+
+def train_booster(tmp_path, rounds=8, **params):
+    """A small multi-class Booster on data with missing values, saved as JSON"""
+    rng = np.random.default_rng(0)
+    features = rng.normal(size=(300, 7)).astype(np.float32)
+    labels = (features[:, 0] > 0).astype(int) + (features[:, 1] > 0.5).astype(int)
+    features[rng.random(features.shape) < 0.15] = np.nan
+
+    params = {"objective": "multi:softprob", "num_class": 3, "max_depth": 4, "eta": 0.3, **params}
+    booster = xgboost.train(params, xgboost.DMatrix(features, label=labels), num_boost_round=rounds)
+    path = tmp_path / "model.json"
+    booster.save_model(path)
+    return booster, path
+
+
+def sample_rows():
+    rng = np.random.default_rng(1)
+    rows = rng.normal(size=(200, 7)).astype(np.float32)
+    rows[rng.random(rows.shape) < 0.2] = np.nan
+    rows[0] = np.nan  # Every feature missing
+    return rows
+
+
+@pytest.mark.parametrize("params", [{}, {"base_score": 0.3}, {"max_depth": 6, "eta": 0.1}])
+def test_matches_booster_probabilities(tmp_path, params):
+    booster, path = train_booster(tmp_path, **params)
+    rows = sample_rows()
+
+    expected = booster.predict(xgboost.DMatrix(rows))
+    actual = CompiledTreeEnsemble(path).predict_proba(rows)
+    np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_matches_booster_margins(tmp_path):
+    booster, path = train_booster(tmp_path, base_score=0.3)
+    rows = sample_rows()
+
+    expected = booster.predict(xgboost.DMatrix(rows), output_margin=True)
+    np.testing.assert_allclose(CompiledTreeEnsemble(path).predict_margin(rows), expected, rtol=1e-5, atol=1e-5)
+
+
+def test_rejects_other_objectives(tmp_path):
+    rng = np.random.default_rng(0)
+    features = rng.normal(size=(50, 3))
+    booster = xgboost.train({"objective": "reg:squarederror"}, xgboost.DMatrix(features, label=features[:, 0]), 2)
+    booster.save_model(tmp_path / "model.json")
+    with pytest.raises(ValueError, match="Unsupported objective"):
+        CompiledTreeEnsemble(tmp_path / "model.json")
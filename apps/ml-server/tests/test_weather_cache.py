@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import pytest
+
+from app.utils import weather_cache
+from app.utils.weather_cache import CLIMATOLOGY_WEATHER, WeatherCache, WeatherReading, geohash
+
+
+def fake_provider(*answers):
+    """Coroutine provider returning `answers` in turn (the last one repeats)"""
+    answers = list(answers)
+
+    async def provider(lat, lon):
+        provider.calls.append((lat, lon))
+        await asyncio.sleep(0)
+        return answers.pop(0) if len(answers) > 1 else answers[0]
+
+    provider.calls = []
+    return provider
+
+
+def test_geohash_known_cell():
+    cell, lat, lon = geohash(57.64911, 10.40744, 11)
+    assert cell == "u4pruydqqvj"
+    assert lat == pytest.approx(57.64911, abs=1e-5)
+    assert lon == pytest.approx(10.40744, abs=1e-5)
+
+
+def test_geohash_neighbours_share_a_cell():
+    assert geohash(24.2401, 86.7601, 5)[0] == geohash(24.2409, 86.7609, 5)[0]
+    assert geohash(24.24, 86.76, 5)[0] != geohash(25.24, 86.76, 5)[0]
+
+
+def test_cell_is_fetched_once_for_concurrent_misses():
+    provider = fake_provider((24.0, 60))
+    cache = WeatherCache(provider=provider)
+
+    async def lookups():
+        return await asyncio.gather(*(cache.get(24.24, 86.76) for _ in range(5)))
+
+    assert asyncio.run(lookups()) == [WeatherReading((24.0, 60), "live")] * 5
+    assert len(provider.calls) == 1
+    # Fetched for the cell center, not the caller's coordinate
+    assert provider.calls[0] == geohash(24.24, 86.76)[1:]
+
+
+def test_stale_value_served_while_refreshing():
+    provider = fake_provider((30.0, 50))
+    cache = WeatherCache(provider=provider, ttl=60, stale_ttl=60)
+    cell = geohash(24.24, 86.76)[0]
+    cache.entries[cell] = ((20.0, 80), time.time() - 90)
+
+    async def lookup():
+        stale = await cache.get(24.24, 86.76)
+        await asyncio.gather(*cache.in_flight.values())
+        return stale, await cache.get(24.24, 86.76)
+
+    stale, fresh = asyncio.run(lookup())
+    assert stale == WeatherReading((20.0, 80), "stale")
+    assert fresh == WeatherReading((30.0, 50), "live")
+    assert len(provider.calls) == 1
+    assert cache.stale_hits == 1 and cache.hits == 1
+
+
+def test_expired_value_is_refetched():
+    provider = fake_provider((30.0, 50))
+    cache = WeatherCache(provider=provider, ttl=60, stale_ttl=60)
+    cache.entries[geohash(24.24, 86.76)[0]] = ((20.0, 80), time.time() - 600)
+
+    assert asyncio.run(cache.get(24.24, 86.76)) == WeatherReading((30.0, 50), "live")
+    assert cache.misses == 1
+
+
+async def failing_provider(lat, lon):
+    raise ConnectionError("Weather API unavailable")
+
+
+def test_failed_fetch_falls_back_to_last_known_weather():
+    cache = WeatherCache(provider=failing_provider, ttl=60, stale_ttl=60)
+    cache.entries[geohash(24.24, 86.76)[0]] = ((20.0, 80), time.time() - 600)
+
+    assert asyncio.run(cache.get(24.24, 86.76)) == WeatherReading((20.0, 80), "stale")
+    assert cache.fallbacks == 1
+
+
+def test_failed_fetch_without_history_uses_climatology():
+    cache = WeatherCache(provider=failing_provider)
+    assert asyncio.run(cache.get(24.24, 86.76)) == WeatherReading(CLIMATOLOGY_WEATHER, "climatology")
+
+
+def test_slow_fetch_is_bounded_and_fills_the_cache(monkeypatch):
+    monkeypatch.setattr(weather_cache, "WEATHER_FETCH_WAIT", 0.01)
+
+    async def slow_provider(lat, lon):
+        await asyncio.sleep(0.05)
+        return 30.0, 50
+
+    cache = WeatherCache(provider=slow_provider)
+
+    async def lookups():
+        first = await cache.get(24.24, 86.76)
+        await asyncio.gather(*cache.in_flight.values())
+        return first, await cache.get(24.24, 86.76)
+
+    first, second = asyncio.run(lookups())
+    assert first.source == "climatology"
+    assert second == WeatherReading((30.0, 50), "live")
+
+
+def test_fetch_wait_is_capped_by_the_attempts():
+    assert weather_cache.WEATHER_FETCH_WAIT <= weather_cache.WEATHER_TIMEOUT * (weather_cache.WEATHER_RETRIES + 1)
@@ -0,0 +1,90 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.utils import weather_fetch
+from app.utils.weather_fetch import CircuitBreaker, WeatherAuthError
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_trial_through(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(weather_fetch.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] += 30
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    # Concurrent callers keep failing fast while the trial runs
+    assert not breaker.allow()
+
+
+@pytest.mark.parametrize("trial_succeeds, state", [(True, "closed"), (False, "open")])
+def test_trial_closes_or_reopens(monkeypatch, trial_succeeds, state):
+    now = [1000.0]
+    monkeypatch.setattr(weather_fetch.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    now[0] += 30
+    assert breaker.allow()
+
+    if trial_succeeds:
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+    assert breaker.state == state
+
+
+def serve(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(weather_fetch, "get_http_client", lambda: client)
+    monkeypatch.setattr(weather_fetch, "weather_breaker", CircuitBreaker(failure_threshold=1))
+    monkeypatch.setattr(weather_fetch, "WEATHER_BACKOFF", 0)
+
+
+def test_fetch_reads_temperature_and_humidity(monkeypatch):
+    serve(monkeypatch, lambda request: httpx.Response(200, json={"main": {"temp": 24.5, "humidity": 61}}))
+    assert asyncio.run(weather_fetch.async_weather_fetch(24.24, 86.76)) == (24.5, 61)
+
+
+def test_rejected_key_raises(monkeypatch):
+    serve(monkeypatch, lambda request: httpx.Response(401, json={"message": "Invalid API key"}))
+    with pytest.raises(WeatherAuthError):
+        asyncio.run(weather_fetch.async_weather_fetch(24.24, 86.76))
+    # The API is up, so the breaker stays closed
+    assert weather_fetch.weather_breaker.state == "closed"
+
+
+def test_outage_is_retried_then_opens_the_breaker(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    serve(monkeypatch, handler)
+    with pytest.raises(ConnectionError):
+        asyncio.run(weather_fetch.async_weather_fetch(24.24, 86.76))
+    assert len(calls) == weather_fetch.WEATHER_RETRIES + 1
+    assert weather_fetch.weather_breaker.state == "open"
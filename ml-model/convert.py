@@ -9,10 +9,12 @@ class XGBoostLabelEncoder:
 
 xgb.compat.XGBoostLabelEncoder = XGBoostLabelEncoder
 
-# 🔹 Paths
+# 🔹 Paths (the ML server loads the native JSON model)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PKL_MODEL_PATH = os.path.join(BASE_DIR, "XGBoost.pkl")
-JSON_MODEL_PATH = os.path.join(BASE_DIR, "XGBoost.json")
+PKL_MODEL_PATH = os.path.join(BASE_DIR, "models", "crop-recommendation", "XGBoost.pkl")
+JSON_MODEL_PATH = os.path.join(
+    BASE_DIR, "..", "apps", "ml-server", "app", "models", "crop-recommendation", "XGBoost.json"
+)
 
 # 🔹 Load Pickle model
 if not os.path.exists(PKL_MODEL_PATH):
@@ -0,0 +1,161 @@
+"""
+Pick the confidence threshold of the ML server's /predict/auto cascade
+
+/predict/auto answers with the first model of CASCADE_MODELS whose top-1
+confidence reaches CASCADE_THRESHOLDS and escalates to the next one
+otherwise; the last model always answers. This script runs every model once
+over an evaluation slice of the validation set, timing each image at batch
+size 1 like a single request, then replays the cascade for a sweep of
+thresholds. For each threshold it reports the accuracy, the average cost
+per image (the summed latency of the stages tried) and the share of images
+answered by each stage.
+
+The recommended threshold is the cheapest one whose accuracy stays within
+--max-accuracy-drop of the last model alone. A JSON report of the sweep is
+written next to the models.
+
+Usage:
+    python evaluate_cascade.py --data PlantVillage/valid \
+        --models resnet9,resnet18,resnet50 --max-accuracy-drop 0.005
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+
+from quantize import SERVER_MODELS_DIR, preprocess_image, split_images
+
+
+def softmax(logits):
+    probabilities = np.exp(logits - np.max(logits, axis=1, keepdims=True))
+    return probabilities / np.sum(probabilities, axis=1, keepdims=True)
+
+
+def run_model(model_path, paths):
+    """
+    Returns:
+        tuple: (top-1 class per image, its confidence, seconds per image)
+    """
+    session = ort.InferenceSession(str(model_path), providers=['CPUExecutionProvider'])
+    input_name = session.get_inputs()[0].name
+    session.run(None, {input_name: preprocess_image(paths[0])[np.newaxis]})  # warm-up
+
+    predictions, confidences, seconds = [], [], []
+    for path in paths:
+        image = preprocess_image(path)[np.newaxis]
+        started = time.perf_counter()
+        logits = session.run(None, {input_name: image})[0]
+        seconds.append(time.perf_counter() - started)
+        probabilities = softmax(logits)[0]
+        predictions.append(int(np.argmax(probabilities)))
+        confidences.append(float(np.max(probabilities)))
+    return np.array(predictions), np.array(confidences), np.array(seconds)
+
+
+def replay_cascade(outputs, labels, threshold):
+    """Accuracy, cost and answering stage of the cascade at one threshold"""
+    count = len(labels)
+    answered = np.full(count, len(outputs) - 1)
+    predictions = outputs[-1]['predictions'].copy()
+    cost = np.zeros(count)
+    pending = np.ones(count, dtype=bool)
+
+    for stage, output in enumerate(outputs):
+        cost[pending] += output['seconds'][pending]
+        if stage == len(outputs) - 1:
+            break
+        confident = pending & (output['confidences'] >= threshold)
+        predictions[confident] = output['predictions'][confident]
+        answered[confident] = stage
+        pending &= ~confident
+
+    return {
+        'threshold': threshold,
+        'accuracy': float(np.mean(predictions == labels)),
+        'mean_ms': float(np.mean(cost) * 1000),
+        'answered_by': [float(np.mean(answered == stage)) for stage in range(len(outputs))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='PlantVillage/valid', help="Held-out ImageFolder directory")
+    parser.add_argument('--models', default='resnet9,resnet18,resnet50', help="Cascade stages, cheapest first")
+    parser.add_argument('--models-dir', default=str(SERVER_MODELS_DIR), help="Directory of the ONNX models")
+    parser.add_argument('--precision', default='fp32', help="ONNX variant to evaluate (e.g. int8)")
+    parser.add_argument('--eval-images', type=int, default=2000)
+    parser.add_argument('--thresholds', default='0.5:0.99:0.01', help="Sweep as start:stop:step")
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.005,
+                        help="Maximum accuracy loss vs the last model alone")
+    parser.add_argument('--report', default=None, help="Report path (default: <models-dir>/cascade_report.json)")
+    args = parser.parse_args()
+
+    models = [m.strip() for m in args.models.split(',') if m.strip()]
+    if len(models) < 2:
+        parser.error("A cascade needs at least two models")
+    start, stop, step = (float(value) for value in args.thresholds.split(':'))
+    thresholds = [round(float(t), 4) for t in np.arange(start, stop + step / 2, step)]
+
+    _, eval_paths, labels = split_images(args.data, 0, args.eval_images)
+    print(f"Evaluation images: {len(eval_paths)}")
+
+    suffix = '' if args.precision == 'fp32' else f".{args.precision}"
+    outputs = []
+    for model_name in models:
+        model_path = Path(args.models_dir) / f"{model_name}_plant_disease{suffix}.onnx"
+        if not model_path.exists():
+            raise FileNotFoundError(f"ONNX model not found at {model_path}")
+        predictions, confidences, seconds = run_model(model_path, eval_paths)
+        outputs.append({'predictions': predictions, 'confidences': confidences, 'seconds': seconds})
+        print(f"{model_name}: accuracy {np.mean(predictions == labels):.4f}, "
+              f"{np.mean(seconds) * 1000:.2f} ms/image")
+
+    baseline_accuracy = float(np.mean(outputs[-1]['predictions'] == labels))
+    baseline_ms = float(np.mean(outputs[-1]['seconds']) * 1000)
+    sweep = [replay_cascade(outputs, labels, threshold) for threshold in thresholds]
+
+    print(f"{'threshold':>9} {'accuracy':>8} {'ms/image':>8} {'cost':>6}  answered by ({', '.join(models)})")
+    for row in sweep:
+        row['relative_cost'] = row['mean_ms'] / baseline_ms
+        shares = ', '.join(f"{share:.1%}" for share in row['answered_by'])
+        print(f"{row['threshold']:>9g} {row['accuracy']:>8.4f} {row['mean_ms']:>8.2f} "
+              f"{row['relative_cost']:>5.2f}x  {shares}")
+
+    within = [row for row in sweep if baseline_accuracy - row['accuracy'] <= args.max_accuracy_drop]
+    recommended = min(within, key=lambda row: row['mean_ms']) if within else None
+    if recommended:
+        print(f"Recommended: CASCADE_MODELS={','.join(models)} CASCADE_THRESHOLDS={recommended['threshold']} "
+              f"(accuracy {recommended['accuracy']:.4f} vs {baseline_accuracy:.4f}, "
+              f"{recommended['relative_cost']:.2f}x the cost of {models[-1]})")
+    else:
+        print(f"No threshold keeps accuracy within {args.max_accuracy_drop} of {models[-1]}")
+
+    report = {
+        'data': str(args.data),
+        'evaluation_images': len(eval_paths),
+        'models': models,
+        'precision': args.precision,
+        'max_accuracy_drop': args.max_accuracy_drop,
+        'onnxruntime': ort.__version__,
+        'stages': {
+            model_name: {
+                'accuracy': float(np.mean(output['predictions'] == labels)),
+                'mean_ms': float(np.mean(output['seconds']) * 1000),
+            }
+            for model_name, output in zip(models, outputs)
+        },
+        'sweep': sweep,
+        'recommended': recommended,
+    }
+    report_path = args.report or Path(args.models_dir) / 'cascade_report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,10 @@ sys.path.insert(0, str(models_dir))
 sys.path.insert(0, str(current_dir.parent.parent))
 from model import get_model
 
+# BatchNorm folding and ONNX export are the ML server's, which serves the graphs.
+sys.path.insert(0, str(current_dir / '..' / '..' / '..' / 'apps' / 'ml-server'))
+from app.utils.model import export_onnx
+
 def detect_num_classes_from_checkpoint(checkpoint_path):
     """Detect number of classes from checkpoint file"""
     try:
@@ -274,26 +278,12 @@ def convert_pytorch_to_onnx(model_name='resnet9', input_size=(256, 256)):
     try:
         model = load_pytorch_model(model_name)
         
-        dummy_input = torch.randn(1, 3, input_size[0], input_size[1]).to(device)
-        
         config = MODEL_CONFIGS.get(model_name, {})
         onnx_path = config.get('onnx_path', f'././..//models/plant-disease/resnet9_best.pthplant-disease/{model_name}-plant-disease-model.onnx')
         
         os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
         
-        torch.onnx.export(
-            model,
-            dummy_input,
-            onnx_path,
-            input_names=["input"],
-            output_names=["output"],
-            dynamic_axes={
-                "input": {0: "batch_size"},
-                "output": {0: "batch_size"}
-            },
-            opset_version=11,
-            do_constant_folding=True
-        )
+        export_onnx(model, onnx_path, input_size)
         
         print(f"{model_name} model exported to ONNX: {onnx_path}")
         return True
@@ -0,0 +1,247 @@
+"""
+Build INT8 / FP16 variants of the plant disease ONNX models
+
+For each model the FP32 graph is quantized into the requested variants:
+
+    int8          static QDQ quantization, calibrated on held-out images
+    int8-dynamic  dynamic quantization (weights only, no calibration)
+    fp16          float16 weights with float32 inputs/outputs
+
+Every variant is scored against the FP32 model on an evaluation slice of
+the validation set that is disjoint from the calibration slice. A variant
+is only published next to the FP32 model (as e.g.
+`resnet50_plant_disease.int8.onnx`, which the ML server serves for
+`?precision=int8`) when its top-1 agreement with FP32 and its accuracy
+drop stay within the gate. A JSON report of all variants is written either way.
+
+Usage:
+    python quantize.py --data PlantVillage/valid --models resnet50 \
+        --precisions int8,int8-dynamic,fp16 --min-agreement 0.99
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+BASE_DIR = Path(__file__).resolve().parent
+SERVER_MODELS_DIR = BASE_DIR / '..' / '..' / '..' / 'apps' / 'ml-server' / 'app' / 'models' / 'plant-disease'
+IMAGE_SIZE = (256, 256)
+PRECISIONS = ('int8', 'int8-dynamic', 'fp16')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def preprocess_image(path):
+    """Same transform as training and serving: Resize((256, 256)) + ToTensor()"""
+    img = Image.open(path).convert('RGB').resize(IMAGE_SIZE[::-1], Image.BILINEAR)
+    pixels = np.asarray(img, dtype=np.float32) / 255
+    return np.ascontiguousarray(pixels.transpose(2, 0, 1))
+
+
+def split_images(data_dir, calibration_images, eval_images, seed=0):
+    """
+    Pick disjoint calibration and evaluation slices from an ImageFolder tree
+
+    Class indices follow the sorted folder names, like torchvision's
+    ImageFolder used for training.
+
+    Returns:
+        tuple: (calibration paths, evaluation paths, evaluation labels)
+    """
+    classes = sorted(d.name for d in Path(data_dir).iterdir() if d.is_dir() and not d.name.startswith('.'))
+    samples = [
+        (path, label)
+        for label, class_name in enumerate(classes)
+        for path in sorted((Path(data_dir) / class_name).iterdir())
+        if path.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+    if not samples:
+        raise FileNotFoundError(f"No images found under {data_dir}")
+
+    random.Random(seed).shuffle(samples)
+    calibration = [path for path, _ in samples[:calibration_images]]
+    evaluation = samples[calibration_images:calibration_images + eval_images]
+    if not evaluation:
+        raise ValueError(f"Not enough images in {data_dir} for an evaluation slice")
+    return calibration, [path for path, _ in evaluation], np.array([label for _, label in evaluation])
+
+
+class ImageCalibrationReader:
+    """CalibrationDataReader feeding preprocessed images one batch at a time"""
+
+    def __init__(self, paths, input_name, batch_size=16):
+        self.batches = iter([paths[i:i + batch_size] for i in range(0, len(paths), batch_size)])
+        self.input_name = input_name
+
+    def get_next(self):
+        paths = next(self.batches, None)
+        if paths is None:
+            return None
+        return {self.input_name: np.stack([preprocess_image(path) for path in paths])}
+
+
+def build_variant(fp32_path, output_path, precision, calibration_paths, workdir):
+    from onnxruntime.quantization import (
+        QuantFormat, QuantType, quantize_dynamic, quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    if precision == 'fp16':
+        import onnx
+        from onnxruntime.transformers.float16 import convert_float_to_float16
+
+        model = convert_float_to_float16(onnx.load(str(fp32_path)), keep_io_types=True)
+        onnx.save(model, str(output_path))
+        return
+
+    # Shape inference and graph cleanup first, as recommended for quantization.
+    prepared_path = Path(workdir) / 'prepared.onnx'
+    quant_pre_process(str(fp32_path), str(prepared_path))
+
+    if precision == 'int8-dynamic':
+        quantize_dynamic(str(prepared_path), str(output_path), weight_type=QuantType.QUInt8)
+        return
+
+    if not calibration_paths:
+        raise ValueError("Static INT8 quantization needs calibration images")
+    input_name = ort.InferenceSession(str(fp32_path), providers=['CPUExecutionProvider']).get_inputs()[0].name
+    quantize_static(
+        str(prepared_path),
+        str(output_path),
+        ImageCalibrationReader(calibration_paths, input_name),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+
+def evaluate(model_path, paths, batch_size=8):
+    """
+    Returns:
+        tuple: (top-1 class per image, images per second)
+    """
+    session = ort.InferenceSession(str(model_path), providers=['CPUExecutionProvider'])
+    input_name = session.get_inputs()[0].name
+
+    predictions = []
+    inference_seconds = 0.0
+    for i in range(0, len(paths), batch_size):
+        batch = np.stack([preprocess_image(path) for path in paths[i:i + batch_size]])
+        started = time.perf_counter()
+        logits = session.run(None, {input_name: batch})[0]
+        inference_seconds += time.perf_counter() - started
+        predictions.append(np.argmax(logits, axis=1))
+    return np.concatenate(predictions), len(paths) / inference_seconds
+
+
+def quantize_model(model_name, args, calibration_paths, eval_paths, labels):
+    fp32_path = Path(args.models_dir) / f"{model_name}_plant_disease.onnx"
+    if not fp32_path.exists():
+        raise FileNotFoundError(f"FP32 ONNX model not found at {fp32_path}")
+
+    fp32_predictions, fp32_speed = evaluate(fp32_path, eval_paths, args.batch_size)
+    fp32_accuracy = float(np.mean(fp32_predictions == labels))
+    print(f"{model_name} fp32: accuracy {fp32_accuracy:.4f}, {fp32_speed:.1f} images/s")
+
+    report = {'fp32': {'accuracy': fp32_accuracy, 'images_per_second': fp32_speed}}
+    for precision in args.precisions:
+        output_path = fp32_path.with_name(f"{fp32_path.stem}.{precision}.onnx")
+        # Built next to the published file, so publishing is an atomic rename on the same filesystem.
+        with tempfile.TemporaryDirectory(dir=output_path.parent, prefix='.quantize-') as workdir:
+            candidate_path = Path(workdir) / output_path.name
+            try:
+                build_variant(fp32_path, candidate_path, precision, calibration_paths, workdir)
+                predictions, speed = evaluate(candidate_path, eval_paths, args.batch_size)
+            except Exception as e:
+                print(f"{model_name} {precision}: failed to build: {e}")
+                report[precision] = {'published': False, 'error': str(e)}
+                unpublish(output_path)
+                continue
+
+            accuracy = float(np.mean(predictions == labels))
+            agreement = float(np.mean(predictions == fp32_predictions))
+            accuracy_drop = fp32_accuracy - accuracy
+            passed = agreement >= args.min_agreement and accuracy_drop <= args.max_accuracy_drop
+
+            report[precision] = {
+                'published': passed,
+                'top1_agreement': agreement,
+                'accuracy': accuracy,
+                'accuracy_drop': accuracy_drop,
+                'images_per_second': speed,
+                'speedup': speed / fp32_speed,
+                'size_bytes': candidate_path.stat().st_size,
+            }
+            status = 'published' if passed else 'REJECTED'
+            print(f"{model_name} {precision}: agreement {agreement:.4f}, accuracy {accuracy:.4f} "
+                  f"({-accuracy_drop:+.4f}), {speed:.1f} images/s ({speed / fp32_speed:.2f}x) -> {status}")
+
+            if not passed:
+                unpublish(output_path)
+                continue
+            try:
+                os.replace(candidate_path, output_path)
+            except OSError as e:
+                print(f"{model_name} {precision}: failed to publish: {e}")
+                report[precision].update(published=False, error=str(e))
+                unpublish(output_path)
+
+    return report
+
+
+def unpublish(output_path):
+    """A variant that fails against the current FP32 model must not stay served"""
+    if output_path.exists():
+        output_path.unlink()
+        print(f"Removed previously published {output_path.name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='PlantVillage/valid', help="Held-out ImageFolder directory")
+    parser.add_argument('--models', default='resnet9,resnet18,resnet50')
+    parser.add_argument('--precisions', default='int8,int8-dynamic,fp16')
+    parser.add_argument('--models-dir', default=str(SERVER_MODELS_DIR), help="Directory of the FP32 ONNX models")
+    parser.add_argument('--calibration-images', type=int, default=256)
+    parser.add_argument('--eval-images', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=8, help="Evaluation batch size (the server's default)")
+    parser.add_argument('--min-agreement', type=float, default=0.99, help="Minimum top-1 agreement with FP32")
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01, help="Maximum accuracy loss vs FP32")
+    parser.add_argument('--report', default=None, help="Report path (default: <models-dir>/quantization_report.json)")
+    args = parser.parse_args()
+
+    args.precisions = [p.strip() for p in args.precisions.split(',') if p.strip()]
+    unknown = set(args.precisions) - set(PRECISIONS)
+    if unknown:
+        parser.error(f"Unknown precisions {sorted(unknown)}. Choose from: {list(PRECISIONS)}")
+
+    calibration_paths, eval_paths, labels = split_images(args.data, args.calibration_images, args.eval_images)
+    print(f"Calibration images: {len(calibration_paths)}, evaluation images: {len(eval_paths)}")
+
+    report = {
+        'data': str(args.data),
+        'evaluation_images': len(eval_paths),
+        'min_agreement': args.min_agreement,
+        'max_accuracy_drop': args.max_accuracy_drop,
+        'onnxruntime': ort.__version__,
+        'models': {},
+    }
+    for model_name in [m.strip() for m in args.models.split(',') if m.strip()]:
+        report['models'][model_name] = quantize_model(model_name, args, calibration_paths, eval_paths, labels)
+
+    report_path = args.report or Path(args.models_dir) / 'quantization_report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
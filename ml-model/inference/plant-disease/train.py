@@ -4,11 +4,18 @@ import torch.optim as optim
 from torch.utils.data import DataLoader
 from torchvision import transforms, datasets
 import os
+import sys
 from pathlib import Path
 import time
 
 from model import get_model
 
+# BatchNorm folding, ONNX export and the safetensors layout are the ML server's, which serves these files.
+SERVER_DIR = Path(__file__).resolve().parent / '..' / '..' / '..' / 'apps' / 'ml-server'
+sys.path.insert(0, str(SERVER_DIR))
+from app.utils.checkpoint import STATE_DICT_KEY, save_safetensors
+from app.utils.model import export_onnx
+
 def train_model(model_name, data_dir, epochs=5, batch_size=16):
     
     print(f"TRAINING {model_name.upper()}")
@@ -106,29 +113,26 @@ def train_model(model_name, data_dir, epochs=5, batch_size=16):
     return model, train_dataset.classes
 
 def export_to_onnx(model, model_name, class_names, output_path):
-    """Export trained model to ONNX"""
+    """Export trained model to ONNX, with BatchNorm folded into the convolutions"""
     print(f"\nExporting {model_name} to ONNX...")
     
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = model.to(device)
-    model.eval()
-    
-    dummy_input = torch.randn(1, 3, 256, 256).to(device)
-    
-    torch.onnx.export(
-        model,
-        dummy_input,
-        output_path,
-        export_params=True,
-        opset_version=11,
-        do_constant_folding=True,
-        input_names=['input'],
-        output_names=['output'],
-        dynamic_axes={'input': {0: 'batch_size'}, 'output': {0: 'batch_size'}}
-    )
+    export_onnx(model, output_path)
     
     print(f"ONNX model saved: {output_path}")
 
+def export_to_safetensors(checkpoint_path, output_path):
+    """Save a checkpoint's weights as safetensors, which the ML server memory-maps instead of unpickling"""
+    try:
+        import safetensors  # noqa: F401
+    except ImportError:
+        print("safetensors is not installed, skipping the .safetensors weights")
+        return
+    
+    checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=True)
+    save_safetensors(checkpoint.pop(STATE_DICT_KEY), output_path, **checkpoint)
+    
+    print(f"Safetensors weights saved: {output_path}")
+
 def main():
     data_dir = "PlantVillage"  
     
@@ -169,6 +173,7 @@ def main():
         
         onnx_path = f"models/{model_name}_plant_disease.onnx"
         export_to_onnx(model, model_name, class_names, onnx_path)
+        export_to_safetensors(f"models/{model_name}_best.pth", f"models/{model_name}_best.safetensors")
         
         print(f"{model_name} COMPLETED!")
     
@@ -177,6 +182,7 @@ def main():
     print(f"   - resnet9_best.pth & resnet9_plant_disease.onnx")
     print(f"   - resnet18_best.pth & resnet18_plant_disease.onnx")
     print(f"   - resnet50_best.pth & resnet50_plant_disease.onnx")
+    print(f"Run quantize.py to build the INT8/FP16 variants served with ?precision=")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file